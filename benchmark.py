@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import concurrent.futures
+import multiprocessing
+
+from process import AppUtil, JSON
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_writer import M3UWriter
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class BenchUtil:
+    def get_operating_parameters():
+        global BENCH_SIZES
+        global BENCH_CASES
+        global BENCH_REPEAT
+        global BENCH_DIR
+        global BENCH_OUTPUT
+        global BENCH_BASELINE
+        global BENCH_TOLERANCE
+
+        BENCH_SIZES = [AppUtil.toint(s) for s in os.environ.get('BENCH_SIZES', '10000,100000').split(',') if s.strip()]
+        BENCH_CASES = [c.strip() for c in os.environ.get('BENCH_CASES', ','.join(CASES)).split(',') if c.strip()]
+        BENCH_REPEAT = AppUtil.toint(os.environ.get('BENCH_REPEAT', 3))
+        BENCH_DIR = os.environ.get('BENCH_DIR', 'bench-data')
+        BENCH_OUTPUT = os.environ.get('BENCH_OUTPUT', 'bench_results.json')
+        BENCH_BASELINE = os.environ.get('BENCH_BASELINE', '')
+        BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.15))
+
+        unknown = [case for case in BENCH_CASES if case not in CASES]
+        if unknown:
+            raise ValueError("unknown benchmark case(s) %s, expected some of %s" % (', '.join(unknown), ', '.join(CASES)))
+
+class SYNTH:
+    # Bump when the generated data changes, so cached files in BENCH_DIR are not reused
+    VERSION = 1
+    SEED = 20240501
+    HOST = 'http://line.example.net:8080'
+    USER = 'benchuser/benchpass'
+    # Share of live channels, movies and series in the m3u_plus playlist (typical of a panel export)
+    KINDS = (('live', 0.15), ('movie', 0.55), ('series', 0.30))
+    LIVE_PREFIXES = ('US', 'UK', 'CA', 'FR', 'DE', 'IT', 'ES', 'RO', 'AR', 'IN')
+    LIVE_GROUPS = ('NEWS', 'SPORTS', 'ENTERTAINMENT', 'KIDS', 'DOCUMENTARY', 'MUSIC', 'LOCAL', 'PPV EVENTS')
+    MOVIE_GROUPS = ('VOD| ACTION', 'VOD| COMEDY', 'VOD| DRAMA', 'VOD| HORROR', 'MOVIES| 4K', 'CINEMA| NEW RELEASES')
+    SERIES_GROUPS = ('SRS| DRAMA', 'SRS| COMEDY', 'SRS| CRIME', 'SRS| ANIMATION', 'SRS| REALITY')
+    WORDS = ('Star', 'Night', 'City', 'Blue', 'River', 'Last', 'Iron', 'Golden', 'Silent', 'Wild', 'Red', 'Storm')
+
+    def playlist_file(entries: int):
+      return os.path.join(BENCH_DIR, 'synthetic-v{}-{}.m3u'.format(SYNTH.VERSION, entries))
+
+    def panel_file(entries: int):
+      return os.path.join(BENCH_DIR, 'synthetic-panel-v{}-{}.json'.format(SYNTH.VERSION, entries))
+
+    def title(rng):
+      return ' '.join(rng.choice(SYNTH.WORDS) for _ in range(rng.randint(1, 3)))
+
+    def write_m3u_plus(filename: str, entries: int):
+      rng = random.Random(SYNTH.SEED)
+      kinds = [kind for kind, _ in SYNTH.KINDS]
+      weights = [weight for _, weight in SYNTH.KINDS]
+      live_groups = ['{}| {}'.format(prefix, group) for prefix in SYNTH.LIVE_PREFIXES for group in SYNTH.LIVE_GROUPS]
+      temp_file = filename + '.tmp'
+      with open(temp_file, 'w', encoding='utf-8') as outfile, M3UWriter(outfile) as writer:
+        outfile.write('#EXTM3U\n')
+        for stream_id in range(1, entries + 1):
+          kind = rng.choices(kinds, weights)[0]
+          if kind == 'live':
+            group = rng.choice(live_groups)
+            name = '{}| {} {}'.format(group[:2], SYNTH.title(rng).upper(), rng.choice(('HD', 'FHD', 'SD', '4K')))
+            tvg_id = '{}.{}'.format(name.split('| ')[1].split(' ')[0].lower(), group[:2].lower())
+            url = '{}/{}/{}.ts'.format(SYNTH.HOST, SYNTH.USER, stream_id)
+          elif kind == 'movie':
+            group = rng.choice(SYNTH.MOVIE_GROUPS)
+            name = '{} ({})'.format(SYNTH.title(rng), rng.randint(1950, 2024))
+            tvg_id = ''
+            url = '{}/movie/{}/{}.mkv'.format(SYNTH.HOST, SYNTH.USER, stream_id)
+          else:
+            group = rng.choice(SYNTH.SERIES_GROUPS)
+            name = '{} S{:02d} E{:02d}'.format(SYNTH.title(rng), rng.randint(1, 12), rng.randint(1, 24))
+            tvg_id = ''
+            url = '{}/series/{}/{}.mp4'.format(SYNTH.HOST, SYNTH.USER, stream_id)
+          logo = 'http://logo.example.net/{}.png'.format(stream_id) if rng.random() < 0.8 else ''
+          writer.write_rendered('#EXTINF:-1 tvg-id="{}" tvg-name="{}" tvg-logo="{}" group-title="{}",{}\n{}\n'.format(
+            tvg_id, name, logo, group, name, url))
+      os.replace(temp_file, filename)
+
+    def write_panel(filename: str, entries: int):
+      # Live categories: the ones of KY-filter_all.json plus as many that no profile includes
+      rng = random.Random(SYNTH.SEED)
+      included = JSON.json_load(os.path.join(ROOT_DIR, 'KY-filter_all.json'))['included_categories']
+      names = included + ['XX| Excluded {}'.format(n) for n in range(len(included))]
+      categories = [{'category_id': str(n + 1), 'category_name': name, 'parent_id': 0} for n, name in enumerate(names)]
+      temp_file = filename + '.tmp'
+      with open(temp_file, 'w', encoding='utf-8') as outfile:
+        # Written member by member, so 2M channels never have to be held as one dict
+        outfile.write('{"user_info":{"username":"benchuser","password":"benchpass","status":"Active"},')
+        outfile.write('"server_info":{"url":"line.example.net","port":"8080","server_protocol":"http"},')
+        outfile.write('"categories":' + json.dumps({'live': categories, 'movie': [], 'series': []}) + ',')
+        outfile.write('"available_channels":{')
+        for stream_id in range(1, entries + 1):
+          category = rng.choice(categories)
+          channel = {
+            'num': stream_id, 'name': '{} {}'.format(SYNTH.title(rng).upper(), rng.choice(('HD', 'FHD', 'SD'))),
+            'stream_type': 'live', 'stream_id': str(stream_id),
+            'stream_icon': 'http://logo.example.net/{}.png'.format(stream_id) if rng.random() < 0.8 else '',
+            'epg_channel_id': None, 'added': '1700000000', 'category_name': category['category_name'],
+            'category_id': category['category_id'], 'tv_archive': 0, 'direct_source': '', 'tv_archive_duration': 0
+          }
+          outfile.write('{}"{}":{}'.format(',' if stream_id > 1 else '', stream_id, json.dumps(channel)))
+        outfile.write('}}')
+      os.replace(temp_file, filename)
+
+    def ensure(entries: int):
+      # Generated once per size and kept in BENCH_DIR for the following runs
+      os.makedirs(BENCH_DIR, exist_ok=True)
+      for filename, write in ((SYNTH.playlist_file(entries), SYNTH.write_m3u_plus), (SYNTH.panel_file(entries), SYNTH.write_panel)):
+        if not os.path.exists(filename):
+          logging.debug('Generating {}'.format(filename))
+          with AppUtil.stage('generate'):
+            write(filename, entries)
+
+class CASE:
+    # Each case prepares its inputs, then returns a function doing the measured work once
+
+    def read_extinf_lines(entries: int):
+      with open(SYNTH.playlist_file(entries), encoding='utf-8') as infile:
+        lines = infile.read().splitlines()
+      return lines[1::2], lines[2::2]
+
+    def parse_extinf(entries: int):
+      extinf_lines, _ = CASE.read_extinf_lines(entries)
+      parse = FLC.parse_extinf_line_streaming
+      return lambda: [parse(line) for line in extinf_lines]
+
+    def should_keep_entry(entries: int):
+      extinf_lines, urls = CASE.read_extinf_lines(entries)
+      channels = [FLC.parse_extinf_line_streaming(line, url) for line, url in zip(extinf_lines, urls)]
+      keep = FLC.should_keep_entry
+      return lambda: [keep(channel.name, channel.url, channel.group) for channel in channels]
+
+    def classify(entries: int):
+      extinf_lines, urls = CASE.read_extinf_lines(entries)
+      channels = [FLC.parse_extinf_line_streaming(line, url) for line, url in zip(extinf_lines, urls)]
+      def run():
+        classify = FLC.EntryClassifier().classify
+        return [classify(channel.name, channel.url, channel.group) for channel in channels]
+      return run
+
+    def filter_streaming(entries: int):
+      output_file = os.path.join(BENCH_DIR, 'out-streaming.m3u')
+      return lambda: FLC.filter_live_channels_streaming(SYNTH.playlist_file(entries), output_file)
+
+    def filter_standard(entries: int):
+      output_file = os.path.join(BENCH_DIR, 'out-standard.m3u')
+      return lambda: FLC.filter_live_channels_batch(SYNTH.playlist_file(entries), output_file)
+
+    def process(entries: int):
+      os.environ.update({
+        'PANEL_FILE': SYNTH.panel_file(entries), 'PANEL_URL': '', 'PANEL_STATE_FILE': '',
+        'PANEL_PROFILES': '{}:{}'.format(os.path.join(ROOT_DIR, 'KY-filter_all.json'), os.path.join(BENCH_DIR, 'out-process.m3u'))
+      })
+      import process
+      process.AppUtil.get_operating_parameters()
+      return process.KY.process
+
+    def write_filter(entries: int):
+      extinf_lines, urls = CASE.read_extinf_lines(entries)
+      channels = [FLC.parse_extinf_line_streaming(line, url) for line, url in zip(extinf_lines, urls)]
+      output_file = os.path.join(BENCH_DIR, 'out-writer.m3u')
+      def run():
+        with open(output_file, 'w', encoding='utf-8') as outfile, M3UWriter(outfile) as writer:
+          outfile.write('#EXTM3U\n')
+          for channel in channels:
+            writer.write_entry(channel)
+      return run
+
+    def write_panel(entries: int):
+      from process import M3U
+      extinf_lines, urls = CASE.read_extinf_lines(entries)
+      channels = [FLC.parse_extinf_line_streaming(line, url) for line, url in zip(extinf_lines, urls)]
+      output_file = os.path.join(BENCH_DIR, 'out-panel-writer.m3u')
+      return lambda: M3U.render_m3u(channels, output_file)
+
+CASES = {
+  'parse_extinf': CASE.parse_extinf,
+  'should_keep_entry': CASE.should_keep_entry,
+  'classify': CASE.classify,
+  'filter_streaming': CASE.filter_streaming,
+  'filter_standard': CASE.filter_standard,
+  'process': CASE.process,
+  'write_filter': CASE.write_filter,
+  'write_panel': CASE.write_panel,
+}
+
+class BENCH:
+    def run_case(case: str, entries: int, repeat: int, bench_dir: str):
+      # Runs in a fresh worker process, so that the peak memory is the case's own
+      global BENCH_DIR
+      BENCH_DIR = bench_dir
+      FLC.VERBOSITY = FLC.QUIET
+      run = CASES[case](entries)
+      best = None
+      for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+      return {
+        'case': case, 'entries': entries, 'seconds': best,
+        'entries_per_second': entries / best if best else 0.0, 'peak_memory_kb': FLC.peak_memory_kb()
+      }
+
+    def compare(results: dict, baseline: dict, tolerance: float):
+      # Slower or larger than the baseline by more than tolerance (a fraction) counts as a regression
+      regressions = []
+      for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous:
+          continue
+        for metric in ('seconds', 'peak_memory_kb'):
+          if result.get(metric) and previous.get(metric) and result[metric] > previous[metric] * (1 + tolerance):
+            regressions.append('{} {}: {:.4g} -> {:.4g} (+{:.0%})'.format(
+              key, metric, previous[metric], result[metric], result[metric] / previous[metric] - 1))
+      return regressions
+
+    def benchmark():
+      for entries in BENCH_SIZES:
+        SYNTH.ensure(entries)
+
+      results = dict()
+      context = multiprocessing.get_context('spawn')
+      for entries in BENCH_SIZES:
+        for case in BENCH_CASES:
+          with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            with AppUtil.stage(case):
+              result = executor.submit(BENCH.run_case, case, entries, BENCH_REPEAT, BENCH_DIR).result()
+          results['{}/{}'.format(case, entries)] = result
+          logging.debug('{:<18} {:>9,} entries: {:8.3f}s {:>12,.0f} entries/s, peak {} KB'.format(
+            case, entries, result['seconds'], result['entries_per_second'], result['peak_memory_kb']))
+
+      JSON.json_write(BENCH_OUTPUT, {
+        'version': SYNTH.VERSION, 'python': platform.python_version(), 'platform': platform.platform(),
+        'numpy': FLC.numpy is not None, 'repeat': BENCH_REPEAT, 'results': results
+      })
+      logging.debug('Results written to {}'.format(BENCH_OUTPUT))
+
+      if BENCH_BASELINE:
+        baseline = JSON.json_load(BENCH_BASELINE)
+        if baseline.get('version') != SYNTH.VERSION:
+          logging.warning('Baseline {} was measured on other synthetic data, not comparing'.format(BENCH_BASELINE))
+          return True
+        regressions = BENCH.compare(results, baseline['results'], BENCH_TOLERANCE)
+        for regression in regressions:
+          logging.error('Regression: {}'.format(regression))
+        if regressions:
+          return False
+        logging.debug('No regressions against {} (tolerance {:.0%})'.format(BENCH_BASELINE, BENCH_TOLERANCE))
+      return True
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    BenchUtil.get_operating_parameters()
+    passed = BENCH.benchmark()
+    app.on_stop()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,139 @@
+import os
+import gzip
+import shutil
+import hashlib
+import logging
+import shlex
+import subprocess
+
+from process import AppUtil, JSON
+
+class DeployUtil:
+    def get_operating_parameters():
+        global DEPLOY_FILES
+        global DEPLOY_TRANSPORT
+        global DEPLOY_TARGET
+        global DEPLOY_MANIFEST
+        global DEPLOY_GZIP
+
+        DEPLOY_FILES = [f.strip() for f in os.environ.get('DEPLOY_FILES', 'ky-no-sports.m3u,ky-sports.m3u,ky-filter_all.m3u').split(',') if f.strip()]
+        DEPLOY_TRANSPORT = os.environ.get('DEPLOY_TRANSPORT', 'scp')
+        DEPLOY_TARGET = os.environ.get('DEPLOY_TARGET', 'ssimen-lt-second:public_html/m3u-tool')
+        DEPLOY_MANIFEST = os.environ.get('DEPLOY_MANIFEST', '.deploy-manifest.json')
+        DEPLOY_GZIP = AppUtil.tobool(os.environ.get('DEPLOY_GZIP', True))
+
+    def file_digest(filename: str):
+      digest = hashlib.sha256()
+      with open(filename, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+          digest.update(chunk)
+      return digest.hexdigest()
+
+    def write_gzip(filename: str):
+      # Pre-compressed sibling for the web server, written atomically; mtime=0 keeps it reproducible
+      gz_file = filename + '.gz'
+      temp_file = gz_file + '.tmp'
+      with open(filename, 'rb') as infile, open(temp_file, 'wb') as raw:
+        with gzip.GzipFile(filename=os.path.basename(filename), mode='wb', compresslevel=9, fileobj=raw, mtime=0) as outfile:
+          shutil.copyfileobj(infile, outfile, 1 << 20)
+      os.replace(temp_file, gz_file)
+      return gz_file
+
+class LocalTransport:
+    # Copies into a local directory; each file is copied to a temporary name and renamed into place
+    def __init__(self, target: str):
+      self.target = target
+
+    def send(self, filenames: list):
+      os.makedirs(self.target, exist_ok=True)
+      for filename in filenames:
+        destination = os.path.join(self.target, os.path.basename(filename))
+        temp_file = os.path.join(self.target, '.' + os.path.basename(filename) + '.tmp')
+        shutil.copyfile(filename, temp_file)
+        os.replace(temp_file, destination)
+
+class RsyncTransport:
+    # One rsync run for all files; rsync writes each file to a temporary name and renames it into place
+    def __init__(self, target: str):
+      self.target = target
+
+    def send(self, filenames: list):
+      subprocess.run(['rsync', '--times', '--compress'] + filenames + [self.target.rstrip('/') + '/'], check=True)
+
+class ScpTransport:
+    # One scp run into a staging directory, then one ssh run renaming the files into place
+    STAGING_DIR = '.deploy-tmp'
+
+    def __init__(self, target: str):
+      self.host, _, self.path = target.partition(':')
+      self.path = self.path.rstrip('/') or '.'
+
+    def send(self, filenames: list):
+      staging = self.path + '/' + ScpTransport.STAGING_DIR
+      subprocess.run(['ssh', self.host, 'mkdir -p ' + shlex.quote(staging)], check=True)
+      subprocess.run(['scp', '-q'] + filenames + [self.host + ':' + staging + '/'], check=True)
+      moves = ' && '.join('mv -f {} {}'.format(shlex.quote(staging + '/' + os.path.basename(f)), shlex.quote(self.path + '/'))
+                          for f in filenames)
+      subprocess.run(['ssh', self.host, moves], check=True)
+
+TRANSPORTS = {
+    'local': LocalTransport,
+    'rsync': RsyncTransport,
+    'scp': ScpTransport,
+}
+
+class DEPLOY:
+    def load_manifest(filename: str, target: str):
+      try:
+        manifest = JSON.json_load(filename)
+      except FileNotFoundError:
+        return dict()
+      except (OSError, ValueError) as e:
+        logging.warning('Ignoring unreadable deploy manifest {}: {}'.format(filename, e))
+        return dict()
+      # A manifest written for another target says nothing about what this one has
+      return manifest.get('files', dict()) if manifest.get('target') == target else dict()
+
+    def save_manifest(filename: str, target: str, files: dict):
+      temp_file = filename + '.tmp'
+      JSON.json_write(temp_file, {'target': target, 'files': files})
+      os.replace(temp_file, filename)
+
+    def deploy():
+      if DEPLOY_TRANSPORT not in TRANSPORTS:
+        raise ValueError('Unknown DEPLOY_TRANSPORT {!r}, expected one of {}'.format(DEPLOY_TRANSPORT, ', '.join(TRANSPORTS)))
+      missing = [f for f in DEPLOY_FILES if not os.path.isfile(f)]
+      if missing:
+        raise FileNotFoundError('Files to deploy not found: {}, run first ky-process.sh'.format(', '.join(missing)))
+
+      target_id = DEPLOY_TRANSPORT + ':' + DEPLOY_TARGET
+      manifest = DEPLOY.load_manifest(DEPLOY_MANIFEST, target_id)
+      deployed = dict(manifest)
+      to_send = []
+      with AppUtil.stage('hash'):
+        for filename in DEPLOY_FILES:
+          digest = DeployUtil.file_digest(filename)
+          name = os.path.basename(filename)
+          if manifest.get(name) == digest:
+            logging.debug('Unchanged since the last deploy: {}'.format(filename))
+            continue
+          to_send.append(filename)
+          deployed[name] = digest
+          if DEPLOY_GZIP:
+            with AppUtil.stage('compress'):
+              to_send.append(DeployUtil.write_gzip(filename))
+
+      if not to_send:
+        logging.debug('Nothing to deploy')
+        return
+      logging.debug('Deploying {} to {}'.format(', '.join(to_send), target_id))
+      with AppUtil.stage('transfer'):
+        TRANSPORTS[DEPLOY_TRANSPORT](DEPLOY_TARGET).send(to_send)
+      DEPLOY.save_manifest(DEPLOY_MANIFEST, target_id, deployed)
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    DeployUtil.get_operating_parameters()
+    DEPLOY.deploy()
+    app.on_stop()
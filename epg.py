@@ -0,0 +1,309 @@
+import os
+import math
+import gzip
+import shutil
+import calendar
+import logging
+import tempfile
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from process import AppUtil, JSON, FETCH
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_entry import Entry, normalise_channel_name
+from v2.m3u_writer import set_attribute
+
+class EpgUtil:
+    def get_operating_parameters():
+        global EPG_SOURCES
+        global EPG_PLAYLISTS
+        global EPG_OUTPUT
+        global EPG_PAST_HOURS
+        global EPG_FUTURE_HOURS
+        global EPG_MAP_FILE
+        global EPG_MATCH_THRESHOLD
+        global EPG_REWRITE_PLAYLISTS
+
+        sources = os.environ.get('EPG_SOURCES', '')
+        if sources:
+          EPG_SOURCES = [s.strip() for s in sources.split(',') if s.strip()]
+        else:
+          EPG_SOURCES = JSON.json_load(os.environ.get('EPG_SOURCES_FILE', os.path.join('v1', 'epg_sources.json')))
+        EPG_PLAYLISTS = [p.strip() for p in os.environ.get('EPG_PLAYLISTS', 'ky-filter_all.m3u').split(',') if p.strip()]
+        EPG_OUTPUT = os.environ.get('EPG_OUTPUT', 'epg.xml.gz')
+        # Programme window around now, in hours; empty keeps the whole guide
+        EPG_PAST_HOURS = float(os.environ.get('EPG_PAST_HOURS') or 'inf')
+        EPG_FUTURE_HOURS = float(os.environ.get('EPG_FUTURE_HOURS') or 'inf')
+        # Channel names matched to guide ids are cached here; empty disables matching
+        EPG_MAP_FILE = os.environ.get('EPG_MAP_FILE', '')
+        EPG_MATCH_THRESHOLD = float(os.environ.get('EPG_MATCH_THRESHOLD', 0.8))
+        # Sets the matched tvg-ids in EPG_PLAYLISTS in place; off by default, the guide alone is written
+        EPG_REWRITE_PLAYLISTS = AppUtil.tobool(os.environ.get('EPG_REWRITE_PLAYLISTS', False))
+
+class MATCH:
+    def normalise(name: str):
+      # Channel names reduced to what identifies the channel: 'US| CNN HD', 'CNN (FHD)' and 'cnn' all become 'cnn'
+      return normalise_channel_name(name, strip_prefix=True)
+
+    def grams(key: str):
+      return frozenset(key[i:i + 3] for i in range(len(key) - 2)) or frozenset((key,))
+
+class ChannelIndex:
+    # Trigram index of the normalised display names of a guide's channels. A name is looked up by scoring
+    # (Dice coefficient of the trigram sets) only the channels sharing one of its rarest trigrams (prefix filter).
+    def __init__(self, channels: list):
+      # channels: (guide id, display names) pairs
+      self.exact = dict()
+      self.names = []
+      self.postings = dict()
+      for channel_id, display_names in channels:
+        for display_name in display_names:
+          key = MATCH.normalise(display_name)
+          if not key or key in self.exact:
+            continue
+          self.exact[key] = channel_id
+          grams = MATCH.grams(key)
+          for gram in grams:
+            self.postings.setdefault(gram, []).append(len(self.names))
+          self.names.append((channel_id, grams))
+
+    def lookup(self, key: str, min_score: float = 0.0):
+      # Returns (guide id, score), score 1.0 for an exact match and 0.0 when no channel can reach min_score
+      if key in self.exact:
+        return self.exact[key], 1.0
+      grams = MATCH.grams(key)
+      present = sorted((len(self.postings[gram]), gram) for gram in grams if gram in self.postings)
+      # A channel shares at most the trigrams present in the index, so the score is bounded before any candidate
+      # is scored, and a score of min_score bounds the size of the candidate's trigram set from both sides
+      if not present or 2 * len(present) / (len(grams) + len(present)) < min_score:
+        return None, 0.0
+      # (with some slack for rounding, so that a score of exactly min_score is not missed)
+      smallest = len(grams) * min_score / (2 - min_score) - 1e-9
+      largest = len(grams) * (2 - min_score) / min_score + 1e-9 if min_score else float('inf')
+      # Reaching min_score takes at least min_shared common trigrams (with the smallest candidate), all among
+      # the present ones, so any channel that can match shares one of the len(present) - min_shared + 1 rarest
+      min_shared = max(1, math.ceil(min_score * (len(grams) + smallest) / 2 - 1e-9))
+      candidates = set()
+      for _, gram in present[:len(present) - min_shared + 1]:
+        candidates.update(self.postings[gram])
+      best_id, best_score = None, 0.0
+      for candidate in candidates:
+        channel_id, candidate_grams = self.names[candidate]
+        if not smallest <= len(candidate_grams) <= largest:
+          continue
+        score = 2 * len(grams & candidate_grams) / (len(grams) + len(candidate_grams))
+        if score > best_score:
+          best_id, best_score = channel_id, score
+      return best_id, best_score
+
+class EPG:
+    def playlist_names(filenames: list):
+      # tvg-id -> normalised names of the entries of the playlists (plain or compressed), '' for entries without one
+      names = dict()
+      for filename in filenames:
+        with FLC.open_playlist_input(filename) as infile:
+          for line in infile:
+            if line.startswith('#EXTINF'):
+              entry = Entry.from_extinf(line.rstrip('\r\n'))
+              names.setdefault(entry.tvg_id, set()).add(MATCH.normalise(entry.name))
+      return names
+
+    def resolve(channels: list, playlist_names: dict, ids: set, mapping: dict, matched: dict):
+      # Matches the names of the entries whose tvg-id is not a channel of this guide to its channels. Accepted
+      # matches (normalised name -> guide id) go to matched and to the persistent mapping, their ids to ids.
+      guide_ids = set(channel_id for channel_id, _ in channels)
+      keys = set()
+      for tvg_id, names in playlist_names.items():
+        if tvg_id not in guide_ids:
+          keys.update(key for key in names if key and key not in matched)
+      index = None
+      for key in keys:
+        channel_id = mapping.get(key)
+        if channel_id not in guide_ids:
+          index = index or ChannelIndex(channels)
+          channel_id, score = index.lookup(key, EPG_MATCH_THRESHOLD)
+          if score < EPG_MATCH_THRESHOLD:
+            continue
+          mapping[key] = channel_id
+        matched[key] = channel_id
+        ids.add(channel_id)
+
+    def rewrite_playlist(filename: str, matched: dict, guide_ids: set):
+      # Sets the tvg-id of the entries matched by name, in place; entries already carrying a guide id are left alone
+      changed = 0
+      temp_file = filename + '.part'
+      try:
+        with FLC.open_playlist_input(filename) as infile, FLC.open_playlist_output(temp_file, filename) as outfile:
+          for line in infile:
+            if line.startswith('#EXTINF'):
+              entry = Entry.from_extinf(line.rstrip('\r\n'))
+              channel_id = matched.get(MATCH.normalise(entry.name)) if entry.tvg_id not in guide_ids else None
+              if channel_id and channel_id != entry.tvg_id:
+                line = set_attribute(line, 'tvg-id', channel_id)
+                changed += 1
+            outfile.write(line)
+      except BaseException:
+        if os.path.exists(temp_file):
+          os.remove(temp_file)
+        raise
+      os.replace(temp_file, filename)
+      return changed
+
+    def open_source(source: str):
+      # Binary stream of a guide file or URL, decompressed when it is gzip, bz2 or xz
+      if not FLC.is_url(source):
+        return FLC.open_playlist_binary(source)
+      logging.debug('Fetching guide {}'.format(FLC.redact_url(source)))
+      request = urllib.request.Request(source, headers={'User-Agent': FETCH.USER_AGENT})
+      return FLC.open_sniffed(urllib.request.urlopen(request, timeout=FETCH.TIMEOUT))
+
+    def xmltv_time(value: str):
+      # Seconds since the epoch of an XMLTV time ('20240501183000 +0200'), None when malformed
+      value = value.strip()
+      try:
+        seconds = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                                   int(value[8:10] or 0), int(value[10:12] or 0), int(value[12:14] or 0), 0, 0, 0))
+      except ValueError:
+        return None
+      offset = value[14:].strip()
+      if len(offset) == 5 and offset[0] in '+-' and offset[1:].isdigit():
+        sign = -1 if offset[0] == '-' else 1
+        seconds -= sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+      return seconds
+
+    def in_window(programme, earliest: float, latest: float):
+      # Programmes with a malformed time are kept
+      start = EPG.xmltv_time(programme.get('start', ''))
+      stop = EPG.xmltv_time(programme.get('stop', '')) or start
+      return (stop is None or stop >= earliest) and (start is None or start <= latest)
+
+    def filter_source(source: str, ids: set, outfile, programmes, channels_written: set, window, resolve=None):
+      # Streams one guide: matching <channel> elements go to outfile, matching <programme> ones to the
+      # programmes spool; every top-level element is dropped from the tree once handled. With resolve,
+      # the channels are held until the guide's channel list is complete (at its first programme) and
+      # resolve(channels) adds the ids matched by name to ids before any of them is written.
+      counts = {'channels': 0, 'channels_kept': 0, 'programmes': 0, 'programmes_kept': 0}
+      held = [] if resolve else None
+      root = None
+      depth = 0
+      with EPG.open_source(source) as infile:
+        for event, elem in ET.iterparse(infile, events=('start', 'end')):
+          if event == 'start':
+            depth += 1
+            if root is None:
+              root = elem
+              if outfile.tell() == 0:
+                EPG.write_header(outfile, root.attrib)
+            continue
+          depth -= 1
+          if depth != 1:
+            continue
+          if elem.tag == 'channel':
+            counts['channels'] += 1
+            if held is not None:
+              held.append(elem)
+            else:
+              EPG.write_channel(elem, ids, outfile, channels_written, counts)
+          elif elem.tag == 'programme':
+            if held is not None:
+              EPG.release_channels(held, resolve, ids, outfile, channels_written, counts)
+              held = None
+            counts['programmes'] += 1
+            if elem.get('channel') in ids and (window is None or EPG.in_window(elem, *window)):
+              elem.tail = '\n'
+              programmes.write(ET.tostring(elem, encoding='utf-8', xml_declaration=False))
+              counts['programmes_kept'] += 1
+          root.clear()
+      if held is not None:
+        EPG.release_channels(held, resolve, ids, outfile, channels_written, counts)
+      return counts
+
+    def release_channels(held: list, resolve, ids: set, outfile, channels_written: set, counts: dict):
+      with AppUtil.stage('match'):
+        resolve([(elem.get('id'), [name.text or '' for name in elem.iter('display-name')]) for elem in held])
+      for elem in held:
+        EPG.write_channel(elem, ids, outfile, channels_written, counts)
+
+    def write_channel(elem, ids: set, outfile, channels_written: set, counts: dict):
+      channel_id = elem.get('id')
+      if channel_id in ids and channel_id not in channels_written:
+        channels_written.add(channel_id)
+        elem.tail = '\n'
+        outfile.write(ET.tostring(elem, encoding='utf-8', xml_declaration=False))
+        counts['channels_kept'] += 1
+
+    def write_header(outfile, attrib: dict):
+      attributes = ''.join(' {}={}'.format(key, quoteattr(value)) for key, value in attrib.items())
+      outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE tv SYSTEM "xmltv.dtd">\n<tv{}>\n'.format(attributes).encode('utf-8'))
+
+    def compressor(raw, output_file: str):
+      # Compression implied by the extension of output_file; gzip at the level of the gzip command line tool
+      module = FLC.output_compression(output_file)
+      if module is gzip:
+        return gzip.GzipFile(filename=os.path.basename(output_file)[:-3], mode='wb', compresslevel=6, fileobj=raw, mtime=0)
+      return module.open(raw, 'wb') if module else raw
+
+    def filter_guides(sources: list, playlists: list, output_file: str):
+      with AppUtil.stage('read playlists'):
+        playlist_names = EPG.playlist_names(playlists)
+      ids = set(tvg_id for tvg_id in playlist_names if tvg_id)
+      logging.debug('{} channel ids in {}'.format(len(ids), ', '.join(playlists)))
+
+      resolve = None
+      matched = dict()
+      guide_ids = set()
+      if EPG_MAP_FILE:
+        try:
+          mapping = JSON.json_load(EPG_MAP_FILE)
+        except FileNotFoundError:
+          mapping = dict()
+        def resolve(channels):
+          guide_ids.update(channel_id for channel_id, _ in channels)
+          EPG.resolve(channels, playlist_names, ids, mapping, matched)
+
+      window = None
+      if EPG_PAST_HOURS != float('inf') or EPG_FUTURE_HOURS != float('inf'):
+        now = time.time()
+        window = (now - EPG_PAST_HOURS * 3600, now + EPG_FUTURE_HOURS * 3600)
+
+      # Channels have to precede programmes, so the kept programmes wait in a spool until every guide is read
+      temp_file = output_file + '.part'
+      channels_written = set()
+      try:
+        with open(temp_file, 'wb') as raw, EPG.compressor(raw, output_file) as outfile, tempfile.TemporaryFile() as programmes:
+          for source in sources:
+            with AppUtil.stage('filter'):
+              counts = EPG.filter_source(source, ids, outfile, programmes, channels_written, window, resolve)
+            logging.debug('{}: kept {} of {} channels and {} of {} programmes'.format(
+              FLC.redact_url(source) if FLC.is_url(source) else source,
+              counts['channels_kept'], counts['channels'], counts['programmes_kept'], counts['programmes']))
+          if outfile.tell() == 0:
+            EPG.write_header(outfile, dict())
+          programmes.seek(0)
+          with AppUtil.stage('write'):
+            shutil.copyfileobj(programmes, outfile, 1 << 20)
+            outfile.write(b'</tv>\n')
+      except BaseException:
+        # The previous guide stays in place
+        os.remove(temp_file)
+        raise
+      os.replace(temp_file, output_file)
+
+      if EPG_MAP_FILE:
+        logging.debug('{} channel names matched to guide ids'.format(len(matched)))
+        JSON.json_write(EPG_MAP_FILE, mapping)
+        if EPG_REWRITE_PLAYLISTS:
+          with AppUtil.stage('rewrite playlists'):
+            for playlist in (p for p in playlists if not FLC.is_stdio(p)):
+              changed = EPG.rewrite_playlist(playlist, matched, guide_ids)
+              logging.debug('{}: tvg-id set on {} entries'.format(playlist, changed))
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    EpgUtil.get_operating_parameters()
+    EPG.filter_guides(EPG_SOURCES, EPG_PLAYLISTS, EPG_OUTPUT)
+    app.on_stop()
@@ -1,10 +1,7 @@
 #!/bin/bash
 
-if [ ! -f ky-filter-1.m3u ]; then
-    echo "File ky-filter-1.m3u must be present, run first ky-process.sh"
-    exit 1
-fi
-
-scp ky-no-sports.m3u ssimen-lt-second:public_html/m3u-tool/
-scp ky-sports.m3u ssimen-lt-second:public_html/m3u-tool/
-scp ky-filter_all.m3u ssimen-lt-second:public_html/m3u-tool/
\ No newline at end of file
+# Only files changed since the last deploy are sent, each with a pre-compressed .gz sibling
+export DEPLOY_FILES=ky-no-sports.m3u,ky-sports.m3u,ky-filter_all.m3u
+export DEPLOY_TRANSPORT=scp
+export DEPLOY_TARGET=ssimen-lt-second:public_html/m3u-tool
+python3 deploy.py
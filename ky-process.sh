@@ -1,18 +1,14 @@
 #!/bin/bash
 
-if [ ! -f KY-panel.json ]; then
-    echo "File KY-panel.json must be present, run first ky-data-fetch.sh"
+if [ "$KY_PANEL_URL" != "" ]; then
+    # The panel is fetched conditionally and parsed while it downloads, a copy is kept in KY-panel.json
+    export PANEL_URL="$KY_PANEL_URL"
+elif [ ! -f KY-panel.json ]; then
+    echo "File KY-panel.json must be present, run first ky-data-fetch.sh or set KY_PANEL_URL"
     exit 1
 fi
 
-export OUT_M3U_FILE=ky-no-sports.m3u
-export PANEL_FILTER_FILE=KY-filter_no_sports.json
-python3 process.py
-
-export OUT_M3U_FILE=ky-sports.m3u
-export PANEL_FILTER_FILE=KY-filter_sports.json
-python3 process.py
-
-export OUT_M3U_FILE=ky-filter_all.m3u
-export PANEL_FILTER_FILE=KY-filter_all.json
+# All profiles are rendered from a single load of the panel
+export PANEL_PROFILES="KY-filter_no_sports.json:ky-no-sports.m3u,KY-filter_sports.json:ky-sports.m3u,KY-filter_all.json:ky-filter_all.m3u"
+export PANEL_STATE_FILE=KY-state.json
 python3 process.py
@@ -0,0 +1,225 @@
+import os
+import io
+import re
+import time
+import hashlib
+import logging
+import tempfile
+import http.client
+import urllib.error
+import urllib.request
+import concurrent.futures
+
+from process import AppUtil, JSON, FETCH
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_entry import Entry
+from v2.m3u_writer import set_attribute
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: logos are stored as downloaded
+    Image = None
+
+# Pillow refuses images of too many pixels with an error that is not an OSError
+IMAGE_ERRORS = (Image.DecompressionBombError,) if Image is not None else ()
+
+class LogoUtil:
+    def get_operating_parameters():
+        global LOGO_PLAYLISTS
+        global LOGO_DIR
+        global LOGO_BASE_URL
+        global LOGO_TTL
+        global LOGO_WORKERS
+        global LOGO_TIMEOUT
+        global LOGO_MAX_BYTES
+        global LOGO_MAX_SIZE
+
+        LOGO_PLAYLISTS = [p.strip() for p in os.environ.get('LOGO_PLAYLISTS', 'ky-filter_all.m3u').split(',') if p.strip()]
+        LOGO_DIR = os.environ.get('LOGO_DIR', 'logos')
+        # URL under which LOGO_DIR is served (serve.py serves it as /logos); empty only fills the cache
+        LOGO_BASE_URL = os.environ.get('LOGO_BASE_URL', '').rstrip('/')
+        # Seconds a logo is used without asking its host; after that a conditional GET revalidates it
+        LOGO_TTL = AppUtil.toint(os.environ.get('LOGO_TTL', 7 * 24 * 3600))
+        LOGO_WORKERS = AppUtil.toint(os.environ.get('LOGO_WORKERS', 16))
+        LOGO_TIMEOUT = float(os.environ.get('LOGO_TIMEOUT', 10))
+        LOGO_MAX_BYTES = AppUtil.toint(os.environ.get('LOGO_MAX_BYTES', 2 * 1024 * 1024))
+        # Largest width or height in pixels, 0 keeps the logos as they are; needs Pillow
+        LOGO_MAX_SIZE = AppUtil.toint(os.environ.get('LOGO_MAX_SIZE', 0))
+
+        if LOGO_MAX_SIZE and Image is None:
+            logging.warning('LOGO_MAX_SIZE is set but Pillow is not installed, logos are not downscaled')
+
+class LOGO:
+    MANIFEST = 'manifest.json'
+    # File extension by the first bytes of the image; anything else (HTML error pages) is not stored
+    IMAGE_TYPES = ((b'\x89PNG', 'png'), (b'\xff\xd8\xff', 'jpg'), (b'GIF8', 'gif'), (b'RIFF', 'webp'), (b'<svg', 'svg'), (b'<?xml', 'svg'))
+    # Replies meaning the logo is gone; other failures keep the stored copy until the host answers again
+    GONE = (404, 410)
+    # Seconds before a logo that could not be fetched is tried again, when it is shorter than LOGO_TTL
+    RETRY_SECONDS = 24 * 3600
+    FILE_NAME = re.compile(r'^[0-9a-f]{32}\.(?:png|jpg|gif|webp|svg)$')
+    # Attribute keeping the logo URL of a rewritten entry, so the logo is revalidated on later runs
+    SOURCE_ATTRIBUTE = 'x-tvg-logo-src'
+
+    def image_type(data: bytes):
+      for magic, extension in LOGO.IMAGE_TYPES:
+        if data.startswith(magic) and (extension != 'webp' or data[8:12] == b'WEBP'):
+          return extension
+      return None
+
+    def downscale(data: bytes, extension: str):
+      # Logos larger than LOGO_MAX_SIZE in either dimension are scaled down, keeping their format
+      if not LOGO_MAX_SIZE or Image is None or extension == 'svg':
+        return data
+      with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= LOGO_MAX_SIZE:
+          return data
+        image_format = image.format
+        image.thumbnail((LOGO_MAX_SIZE, LOGO_MAX_SIZE))
+        output = io.BytesIO()
+        image.save(output, format=image_format)
+      return output.getvalue()
+
+    def store(data: bytes, extension: str):
+      # Content-addressed: the same image from several URLs or hosts is stored once
+      name = '{}.{}'.format(hashlib.blake2b(data, digest_size=16).hexdigest(), extension)
+      path = os.path.join(LOGO_DIR, name)
+      if not os.path.exists(path):
+        with tempfile.NamedTemporaryFile(dir=LOGO_DIR, suffix='.part', delete=False) as outfile:
+          outfile.write(data)
+        os.replace(outfile.name, path)
+      return name
+
+    def fetch(url: str, previous: dict, now: float):
+      # Returns the manifest record of url: {'file', 'etag', 'last_modified', 'checked'}, 'error' when it failed
+      headers = {'User-Agent': FETCH.USER_AGENT}
+      stored = previous.get('file') and os.path.exists(os.path.join(LOGO_DIR, previous['file']))
+      if stored:
+        if previous.get('etag'):
+          headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+          headers['If-Modified-Since'] = previous['last_modified']
+      try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=LOGO_TIMEOUT) as response:
+          data = response.read(LOGO_MAX_BYTES + 1)
+          etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if len(data) > LOGO_MAX_BYTES:
+          raise ValueError('larger than {} bytes'.format(LOGO_MAX_BYTES))
+        extension = LOGO.image_type(data)
+        if extension is None:
+          raise ValueError('not an image')
+        name = LOGO.store(LOGO.downscale(data, extension), extension)
+        return {'file': name, 'etag': etag, 'last_modified': last_modified, 'checked': now}
+      except urllib.error.HTTPError as e:
+        e.close()
+        if e.code == 304 and stored:
+          record = dict(previous, checked=now)
+          record.pop('error', None)
+          return record
+        error = 'HTTP {}'.format(e.code)
+        if e.code in LOGO.GONE:
+          return {'error': error, 'checked': now}
+      except (OSError, ValueError, http.client.HTTPException) + IMAGE_ERRORS as e:
+        error = str(e) or type(e).__name__
+      return dict(previous, error=error, checked=now) if stored else {'error': error, 'checked': now}
+
+    def source(entry: Entry):
+      # The logo URL of an entry, also once an earlier run pointed its tvg-logo at the stored copy
+      return (entry.attrs or {}).get(LOGO.SOURCE_ATTRIBUTE) or entry.logo
+
+    def collect(playlists: list):
+      # Returns the distinct logo URLs of the playlists, and the stored files that entries
+      # rewritten by an earlier run already point at
+      urls, stored = set(), set()
+      own_prefix = LOGO_BASE_URL + '/' if LOGO_BASE_URL else None
+      for playlist in playlists:
+        with FLC.open_playlist_input(playlist) as infile:
+          for line in infile:
+            if line.startswith('#EXTINF'):
+              entry = Entry.from_extinf(line.rstrip('\r\n'))
+              if own_prefix and entry.logo.startswith(own_prefix):
+                stored.add(entry.logo[len(own_prefix):])
+              source = LOGO.source(entry)
+              if FLC.is_url(source) and not (own_prefix and source.startswith(own_prefix)):
+                urls.add(source)
+      return urls, stored
+
+    def due(record: dict, now: float):
+      if record is None:
+        return True
+      ttl = LOGO_TTL if 'file' in record else min(LOGO_TTL, LOGO.RETRY_SECONDS)
+      return now - record['checked'] >= ttl
+
+    def prefetch(urls: set, stored: set = frozenset()):
+      # Downloads the logos not checked within LOGO_TTL, LOGO_WORKERS at a time; returns the manifest of urls.
+      # Files neither in the manifest nor in stored are removed.
+      os.makedirs(LOGO_DIR, exist_ok=True)
+      manifest_file = os.path.join(LOGO_DIR, LOGO.MANIFEST)
+      try:
+        previous = JSON.json_load(manifest_file)
+      except (OSError, ValueError):
+        previous = dict()
+      now = time.time()
+      # Records of logos no longer listed are dropped, unless rewritten entries still point at their file
+      manifest = {key: record for key, record in previous.items() if record.get('file') in stored}
+      manifest.update((key, previous[key]) for key in map(FETCH.url_key, urls) if key in previous)
+      due = [url for url in urls if LOGO.due(manifest.get(FETCH.url_key(url)), now)]
+      logging.debug('{} logo URLs, {} to fetch or revalidate'.format(len(urls), len(due)))
+      if due:
+        with AppUtil.stage('fetch'), concurrent.futures.ThreadPoolExecutor(max_workers=LOGO_WORKERS) as executor:
+          keys = [FETCH.url_key(url) for url in due]
+          for key, record in zip(keys, executor.map(lambda url, key: LOGO.fetch(url, manifest.get(key, {}), now), due, keys)):
+            manifest[key] = record
+      JSON.json_write(manifest_file, manifest)
+
+      referenced = {record['file'] for record in manifest.values() if 'file' in record} | stored
+      for name in os.listdir(LOGO_DIR):
+        if LOGO.FILE_NAME.match(name) and name not in referenced:
+          os.remove(os.path.join(LOGO_DIR, name))
+      return manifest
+
+    def rewrite_playlist(filename: str, manifest: dict):
+      # Points tvg-logo at the stored copies, in place, keeping the URL in SOURCE_ATTRIBUTE;
+      # logos that could not be fetched keep (or get back) their URL
+      changed = 0
+      temp_file = filename + '.part'
+      try:
+        with FLC.open_playlist_input(filename) as infile, FLC.open_playlist_output(temp_file, filename) as outfile:
+          for line in infile:
+            if line.startswith('#EXTINF'):
+              entry = Entry.from_extinf(line.rstrip('\r\n'))
+              source = LOGO.source(entry)
+              record = manifest.get(FETCH.url_key(source)) if FLC.is_url(source) else None
+              if record and 'file' in record:
+                logo = '{}/{}'.format(LOGO_BASE_URL, record['file'])
+                if source == entry.logo:
+                  line = set_attribute(line, LOGO.SOURCE_ATTRIBUTE, source)
+                changed += 1
+              else:
+                logo = source
+              if logo != entry.logo:
+                line = set_attribute(line, 'tvg-logo', logo)
+            outfile.write(line)
+      except BaseException:
+        if os.path.exists(temp_file):
+          os.remove(temp_file)
+        raise
+      os.replace(temp_file, filename)
+      return changed
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    LogoUtil.get_operating_parameters()
+    with AppUtil.stage('collect'):
+      urls, stored = LOGO.collect(LOGO_PLAYLISTS)
+    manifest = LOGO.prefetch(urls, stored)
+    failed = sum(1 for record in manifest.values() if 'file' not in record)
+    logging.debug('{} logos stored in {}, {} unavailable'.format(len(manifest) - failed, LOGO_DIR, failed))
+    if LOGO_BASE_URL:
+      with AppUtil.stage('rewrite'):
+        for playlist in LOGO_PLAYLISTS:
+          if not FLC.is_stdio(playlist):
+            logging.debug('{}: tvg-logo set on {} entries'.format(playlist, LOGO.rewrite_playlist(playlist, manifest)))
+    app.on_stop()
@@ -0,0 +1,94 @@
+import os
+import hashlib
+import logging
+import urllib.parse
+
+from process import AppUtil
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_entry import Entry, normalise_channel_name
+from v2.m3u_writer import M3UWriter
+
+class MergeUtil:
+    def get_operating_parameters():
+        global MERGE_SOURCES
+        global MERGE_OUTPUT
+        global MERGE_KEYS
+
+        # Highest priority first: a channel found in several sources is taken from the first one listing it
+        MERGE_SOURCES = [s.strip() for s in os.environ.get('MERGE_SOURCES', 'ky-filter_all.m3u,live_channels.m3u').split(',') if s.strip()]
+        MERGE_OUTPUT = os.environ.get('MERGE_OUTPUT', 'merged.m3u')
+        MERGE_KEYS = [k.strip() for k in os.environ.get('MERGE_KEYS', 'tvg_id,url,name').split(',') if k.strip()]
+
+        unknown = [key for key in MERGE_KEYS if key not in KEYS]
+        if unknown:
+            raise ValueError("unknown merge key(s) %s, expected some of %s" % (', '.join(unknown), ', '.join(KEYS)))
+
+class NORMALISE:
+    # Normalised identities of an entry; '' when the entry has none of that kind
+
+    def tvg_id(entry: Entry):
+      # Numeric ids are panel stream ids, only meaningful within their own provider
+      tvg_id = entry.tvg_id.strip().lower()
+      return '' if tvg_id.isdigit() else tvg_id
+
+    def url(entry: Entry):
+      parts = urllib.parse.urlsplit(entry.url.strip())
+      return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+    def name(entry: Entry):
+      # 'US| CNN HD', 'US: CNN' and 'us - cnn (FHD)' all become 'uscnn'; the provider prefix stays, as the
+      # same name in two countries' groups is usually two different channels
+      return normalise_channel_name(entry.name)
+
+KEYS = {'tvg_id': NORMALISE.tvg_id, 'url': NORMALISE.url, 'name': NORMALISE.name}
+
+class MERGE:
+    def key_hashes(entry: Entry, keys: list):
+      # 64-bit hashes of the entry's keys, tagged with the key kind so a name never matches a URL
+      hashes = []
+      for kind in keys:
+        value = KEYS[kind](entry)
+        if value:
+          digest = hashlib.blake2b((kind + '\0' + value).encode('utf-8'), digest_size=8).digest()
+          hashes.append(int.from_bytes(digest, 'little'))
+      return hashes
+
+    def merge(sources: list, output_file: str, keys: list):
+      # Streams the sources in priority order; only the hashes of the keys seen so far are kept in memory
+      seen = set()
+      counts = []
+      replace_output = not FLC.is_stdio(output_file)
+      target_file = output_file + '.part' if replace_output else output_file
+      try:
+        with FLC.open_playlist_output(target_file, output_file) as outfile, M3UWriter(outfile) as writer:
+          outfile.write('#EXTM3U\n')
+          for source in sources:
+            kept = duplicates = 0
+            with AppUtil.stage('merge'):
+              for extinf_line, directives, url in FLC.read_playlist_entries(source):
+                hashes = MERGE.key_hashes(Entry.from_extinf(extinf_line, url), keys)
+                if any(h in seen for h in hashes):
+                  duplicates += 1
+                  continue
+                seen.update(hashes)
+                writer.write_rendered(extinf_line + '\n' + directives + url + '\n')
+                kept += 1
+            counts.append((source, kept, duplicates))
+            logging.debug('{}: {} entries kept, {} duplicates dropped'.format(source, kept, duplicates))
+      except BaseException:
+        # The previous merged playlist stays in place
+        if replace_output and os.path.exists(target_file):
+          os.remove(target_file)
+        raise
+      if replace_output:
+        os.replace(target_file, output_file)
+      return counts
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    MergeUtil.get_operating_parameters()
+    counts = MERGE.merge(MERGE_SOURCES, MERGE_OUTPUT, MERGE_KEYS)
+    logging.debug('Wrote {} entries from {} sources to {}'.format(sum(kept for _, kept, _ in counts), len(counts), MERGE_OUTPUT))
+    app.on_stop()
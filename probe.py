@@ -0,0 +1,235 @@
+import os
+import ssl
+import time
+import asyncio
+import logging
+import urllib.parse
+
+from process import AppUtil, JSON, FETCH
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_writer import M3UWriter, set_attribute
+
+class ProbeUtil:
+    def get_operating_parameters():
+        global PROBE_INPUT
+        global PROBE_OUTPUT
+        global PROBE_CACHE
+        global PROBE_TTL
+        global PROBE_CONCURRENCY
+        global PROBE_PER_HOST
+        global PROBE_TIMEOUT
+        global PROBE_BYTES
+        global PROBE_DEAD_GROUP
+
+        PROBE_INPUT = os.environ.get('PROBE_INPUT', 'ky-filter_all.m3u')
+        # Never the input: dead channels dropped or regrouped there would not be probed again
+        PROBE_OUTPUT = os.environ.get('PROBE_OUTPUT', 'probed.m3u')
+        PROBE_CACHE = os.environ.get('PROBE_CACHE', 'probe_cache.json')
+        # Seconds a result is reused before the stream is probed again
+        PROBE_TTL = AppUtil.toint(os.environ.get('PROBE_TTL', 6 * 3600))
+        PROBE_CONCURRENCY = AppUtil.toint(os.environ.get('PROBE_CONCURRENCY', 200))
+        PROBE_PER_HOST = AppUtil.toint(os.environ.get('PROBE_PER_HOST', 4))
+        PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', 5))
+        PROBE_BYTES = AppUtil.toint(os.environ.get('PROBE_BYTES', 1024))
+        # Dead channels are moved to this group; empty drops them
+        PROBE_DEAD_GROUP = os.environ.get('PROBE_DEAD_GROUP', '')
+
+        if not FLC.is_stdio(PROBE_INPUT) and os.path.abspath(PROBE_OUTPUT) == os.path.abspath(PROBE_INPUT):
+          raise ValueError('PROBE_OUTPUT must differ from PROBE_INPUT, the input keeps the dead channels for the next run')
+
+class HostPool:
+    # Keep-alive connections per (scheme, host, port), at most per_host of them busy at once.
+    # Live streams never end, so their connections are closed after the first bytes; only
+    # responses read to their end (redirects, errors, short playlists) give their connection back.
+    def __init__(self, per_host: int):
+      self.per_host = per_host
+      self.limits = dict()
+      self.idle = dict()
+      self.ssl_context = ssl.create_default_context()
+
+    def limit(self, key):
+      if key not in self.limits:
+        self.limits[key] = asyncio.Semaphore(self.per_host)
+      return self.limits[key]
+
+    async def connect(self, key):
+      # Returns (reader, writer, reused)
+      idle = self.idle.get(key)
+      while idle:
+        reader, writer = idle.pop()
+        if not reader.at_eof() and not writer.is_closing():
+          return reader, writer, True
+        writer.close()
+      scheme, host, port = key
+      reader, writer = await asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None)
+      return reader, writer, False
+
+    def release(self, key, reader, writer, reusable: bool):
+      if reusable and len(self.idle.setdefault(key, [])) < self.per_host:
+        self.idle[key].append((reader, writer))
+      else:
+        writer.close()
+
+    def close(self):
+      for connections in self.idle.values():
+        for _, writer in connections:
+          writer.close()
+      self.idle.clear()
+
+class PROBE:
+    MAX_REDIRECTS = 3
+    MAX_HEADER_BYTES = 1 << 16
+
+    def connection_key(parts):
+      scheme = parts.scheme.lower()
+      return (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+
+    async def request(pool: HostPool, key, parts):
+      # One GET on a pooled connection; returns (status, headers, body bytes read)
+      reader, writer, reused = await pool.connect(key)
+      reusable = False
+      try:
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nUser-Agent: {}\r\nAccept: */*\r\nConnection: keep-alive\r\n\r\n'.format(
+          target, parts.netloc.rpartition('@')[2], FETCH.USER_AGENT).encode('latin-1'))
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        if len(head) > PROBE.MAX_HEADER_BYTES:
+          raise ValueError('response header too large')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        status = int(status_line.split(' ', 2)[1])
+        headers = dict()
+        for line in header_lines:
+          name, _, value = line.partition(':')
+          if name:
+            headers[name.strip().lower()] = value.strip()
+        # A body known to be short (redirects, errors, playlists) is read to its end to keep the connection;
+        # of a longer one or one of unknown length (a live stream), the first bytes are enough
+        length = int(headers['content-length']) if headers.get('content-length', '').isdigit() else None
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+          body, complete = await PROBE.read_chunked(reader)
+        elif length is not None and length <= PROBE_BYTES:
+          body, complete = len(await reader.readexactly(length)), True
+        else:
+          body, complete = len(await reader.read(PROBE_BYTES)), False
+        reusable = complete and headers.get('connection', '').lower() != 'close'
+        return status, headers, body
+      except (asyncio.IncompleteReadError, ConnectionError):
+        # The server may have closed an idle connection just as it was reused
+        if reused:
+          writer.close()
+          writer = None
+          return await PROBE.request(pool, key, parts)
+        raise
+      finally:
+        if writer is not None:
+          pool.release(key, reader, writer, reusable)
+
+    async def read_chunked(reader):
+      # Returns (body bytes read, complete): a chunked body is read to its last chunk while it stays
+      # within PROBE_BYTES, otherwise up to the first bytes of the chunk going past it
+      body = 0
+      while True:
+        size = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+        if size == 0:
+          # Trailer fields, up to the empty line ending the body
+          while await reader.readuntil(b'\r\n') != b'\r\n':
+            pass
+          return body, True
+        if body + size > PROBE_BYTES:
+          return body + len(await reader.read(PROBE_BYTES - body)), False
+        await reader.readexactly(size + 2)
+        body += size
+
+    async def probe(pool: HostPool, url: str):
+      # Returns (alive, detail): alive when the stream answers 2xx with some bytes within PROBE_TIMEOUT
+      try:
+        for _ in range(PROBE.MAX_REDIRECTS + 1):
+          parts = urllib.parse.urlsplit(url)
+          if parts.scheme.lower() not in ('http', 'https') or not parts.hostname:
+            return False, 'unsupported URL'
+          key = PROBE.connection_key(parts)
+          async with pool.limit(key):
+            status, headers, body = await asyncio.wait_for(PROBE.request(pool, key, parts), PROBE_TIMEOUT)
+          if 300 <= status < 400 and headers.get('location'):
+            url = urllib.parse.urljoin(url, headers['location'])
+            continue
+          if 200 <= status < 300:
+            return body > 0, str(status) if body else '{} empty'.format(status)
+          return False, str(status)
+        return False, 'too many redirects'
+      except asyncio.TimeoutError:
+        return False, 'timeout'
+      except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+        return False, type(e).__name__
+
+    async def probe_all(urls: list):
+      # Results by URL; PROBE_CONCURRENCY probes in flight overall, PROBE_PER_HOST per host
+      pool = HostPool(PROBE_PER_HOST)
+      slots = asyncio.Semaphore(PROBE_CONCURRENCY)
+      async def run(url):
+        async with slots:
+          return url, await PROBE.probe(pool, url)
+      try:
+        return dict(await asyncio.gather(*[run(url) for url in urls]))
+      finally:
+        pool.close()
+
+    def cache_load(filename: str):
+      # URL hash -> [checked at, alive, detail]; the URLs carry credentials, so only their hashes are stored
+      try:
+        return JSON.json_load(filename)
+      except (OSError, ValueError):
+        return dict()
+
+    def cache_save(filename: str, cache: dict, now: float):
+      JSON.json_write(filename, {key: result for key, result in cache.items() if now - result[0] < PROBE_TTL})
+
+    def probe_playlist(input_file: str, output_file: str):
+      # Probes the streams not found in the cache, then writes the playlist without (or regrouping) the dead ones
+      entries = list(FLC.read_playlist_entries(input_file))
+      cache = PROBE.cache_load(PROBE_CACHE) if PROBE_CACHE else dict()
+      now = time.time()
+      keys = {url: FETCH.url_key(url) for _, _, url in entries}
+      stale = [url for url, key in keys.items() if key not in cache or now - cache[key][0] >= PROBE_TTL]
+      logging.debug('{} entries, {} streams, {} to probe'.format(len(entries), len(keys), len(stale)))
+      if stale:
+        with AppUtil.stage('probe'):
+          results = asyncio.run(PROBE.probe_all(stale))
+        for url, (alive, detail) in results.items():
+          cache[keys[url]] = [now, alive, detail]
+        if PROBE_CACHE:
+          PROBE.cache_save(PROBE_CACHE, cache, now)
+
+      dead = 0
+      replace_output = not FLC.is_stdio(output_file)
+      target_file = output_file + '.part' if replace_output else output_file
+      with AppUtil.stage('write'):
+        try:
+          with FLC.open_playlist_output(target_file, output_file) as outfile, M3UWriter(outfile) as writer:
+            outfile.write('#EXTM3U\n')
+            for extinf_line, directives, url in entries:
+              if not cache[keys[url]][1]:
+                dead += 1
+                if not PROBE_DEAD_GROUP:
+                  continue
+                extinf_line = set_attribute(extinf_line, 'group-title', PROBE_DEAD_GROUP)
+              writer.write_rendered(extinf_line + '\n' + directives + url + '\n')
+        except BaseException:
+          # The previous output stays in place
+          if replace_output and os.path.exists(target_file):
+            os.remove(target_file)
+          raise
+        if replace_output:
+          os.replace(target_file, output_file)
+      return len(entries), dead
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    ProbeUtil.get_operating_parameters()
+    entries, dead = PROBE.probe_playlist(PROBE_INPUT, PROBE_OUTPUT)
+    logging.debug('{} of {} entries dead, {} to {}'.format(
+      dead, entries, 'moved to group {}'.format(PROBE_DEAD_GROUP) if PROBE_DEAD_GROUP else 'dropped', PROBE_OUTPUT))
+    app.on_stop()
@@ -1,9 +1,27 @@
 import os
 import time
 import json
+import re
+import hashlib
 import logging
+import contextlib
+import io
+import gzip
+import http.client
+import urllib.error
+import urllib.request
+
+# The entry model and the M3U writer are shared with the v2 filter
+from v2.m3u_entry import Entry
+from v2.m3u_writer import M3UWriter, render_entry, render_panel_extinf_line
+from v2.group_filter import GroupFilter
+from v2.filter_live_channels import redact_url
 
 class AppUtil:
+    # Per-stage durations in seconds, exclusive of nested stages
+    stage_times = dict()
+    stage_stack = []
+
     def strtobool(val):
             val = val.lower()
             if val in ('y', 'yes', 't', 'true', 'on', '1'):
@@ -26,15 +44,36 @@ class AppUtil:
     def toint(val):
         return int(val)
 
+    def toprofiles(val):
+        # "filter.json:out.m3u,filter2.json:out2.m3u" -> [(filter, out), ...]
+        profiles = []
+        for item in val.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            filter_file, sep, out_file = item.partition(':')
+            if not sep or not filter_file or not out_file:
+                raise ValueError("invalid profile %r, expected FILTER_FILE:OUT_M3U_FILE" % (item,))
+            profiles.append((filter_file, out_file))
+        return profiles
+
     def get_operating_parameters():
         global PANEL_FILE
         global PANEL_FILTER_FILE
         global OUT_M3U_FILE
+        global PANEL_PROFILES
+        global PANEL_STREAMING
+        global PANEL_STATE_FILE
+        global PANEL_URL
         global LOG_TO_FILE_ENABLED
 
         PANEL_FILE = os.environ.get('PANEL_FILE', 'KY-panel.json')
         PANEL_FILTER_FILE = os.environ.get('PANEL_FILTER_FILE', 'KY-filter_all.json')
         OUT_M3U_FILE = os.environ.get('OUT_M3U_FILE', 'ky-filter-1.m3u')
+        PANEL_PROFILES = AppUtil.toprofiles(os.environ.get('PANEL_PROFILES', ''))
+        PANEL_STREAMING = AppUtil.tobool(os.environ.get('PANEL_STREAMING', True))
+        PANEL_STATE_FILE = os.environ.get('PANEL_STATE_FILE', '')
+        PANEL_URL = os.environ.get('PANEL_URL', '')
         LOG_TO_FILE_ENABLED = AppUtil.tobool(os.environ.get('LOG_TO_FILE_ENABLED', False))
 
     def log_setup():
@@ -53,9 +92,46 @@ class AppUtil:
         logging.debug('Starting')
         self.time_start = time.time()
 
+    @contextlib.contextmanager
+    def stage(name: str):
+        AppUtil.stage_stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            AppUtil.stage_stack.pop()
+            AppUtil.add_stage_time(name, time.perf_counter() - start)
+
+    def add_stage_time(name: str, seconds: float):
+        AppUtil.stage_times[name] = AppUtil.stage_times.get(name, 0.0) + seconds
+        # Time spent in a nested stage is not counted again in the enclosing one
+        if AppUtil.stage_stack and AppUtil.stage_stack[-1] != name:
+            enclosing = AppUtil.stage_stack[-1]
+            AppUtil.stage_times[enclosing] = AppUtil.stage_times.get(enclosing, 0.0) - seconds
+
+    def timed(iterable, name: str):
+        # Attributes the time spent producing each item of iterable to stage name
+        clock = time.perf_counter
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += clock() - start
+                yield item
+        finally:
+            AppUtil.add_stage_time(name, elapsed)
+
     def on_stop(self):
         time_end = time.time()
         total_time = time_end - self.time_start
+        for name, seconds in AppUtil.stage_times.items():
+            logging.debug('Stage {}: {:.3f}s'.format(name, seconds))
         logging.debug('Processing time: {}'.format(total_time))
         logging.debug('Completed')
 
@@ -69,32 +145,249 @@ class JSON:
           json_object = json.dumps(data, indent=4)
           outfile.write(json_object)
 
+    def json_stream_object(filename: str, stream_key: str, required_keys: tuple = (), infile = None):
+      # Returns (header, items): the top level members other than stream_key, decoded as usual, and an
+      # iterator decoding the members of stream_key one at a time. When stream_key comes before one of
+      # required_keys in the file, its members are skipped and read back from a second pass.
+      # infile, when given, is read instead of opening filename; the document must be complete in
+      # filename once infile has been read to its end (see FETCH.download)
+      infile = infile or open(filename)
+      try:
+        stream = JSONStream(infile)
+        header = dict()
+        found = False
+        for key in stream.keys():
+          if key != stream_key:
+            header[key] = stream.value()
+          elif all(k in header for k in required_keys):
+            return header, JSON._stream_items(infile, stream)
+          else:
+            found = True
+            stream.skip()
+      except BaseException:
+        infile.close()
+        raise
+      JSON._drain(infile)
+      infile.close()
+      return header, JSON._stream_items_second_pass(filename, stream_key) if found else iter(())
+
+    def _stream_items(infile, stream):
+      with infile:
+        yield from stream.values()
+        JSON._drain(infile)
+
+    def _drain(infile):
+      # Reads past the end of the document, so that a download being parsed completes
+      while infile.read(JSONStream.CHUNK_SIZE):
+        pass
+
+    def _stream_items_second_pass(filename: str, stream_key: str):
+      with open(filename) as infile:
+        stream = JSONStream(infile)
+        for key in stream.keys():
+          if key == stream_key:
+            yield from stream.values()
+            return
+          stream.skip()
+
+class JSONStream:
+    # Incremental reader for large JSON documents: values are decoded one member at a time with
+    # json.JSONDecoder.raw_decode over a sliding buffer, so memory stays bounded by the largest member
+    CHUNK_SIZE = 1 << 16
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, infile):
+      self.infile = infile
+      self.decoder = json.JSONDecoder()
+      self.buffer = ''
+      self.pos = 0
+      self.eof = False
+
+    def _fill(self):
+      # Read at least as much as is already buffered so retries of a large value stay linear
+      chunk = self.infile.read(max(JSONStream.CHUNK_SIZE, len(self.buffer) - self.pos))
+      if not chunk:
+        self.eof = True
+        return False
+      self.buffer = self.buffer[self.pos:] + chunk
+      self.pos = 0
+      return True
+
+    def _peek(self):
+      while True:
+        self.pos = JSONStream.WHITESPACE.match(self.buffer, self.pos).end()
+        if self.pos < len(self.buffer):
+          return self.buffer[self.pos]
+        if not self._fill():
+          raise ValueError('Unexpected end of JSON document')
+
+    def _expect(self, chars: str):
+      char = self._peek()
+      if char not in chars:
+        raise ValueError('Expected one of {!r} at offset {} of the buffer, found {!r}'.format(chars, self.pos, char))
+      self.pos += 1
+      return char
+
+    def value(self):
+      self._peek()
+      while True:
+        try:
+          value, end = self.decoder.raw_decode(self.buffer, self.pos)
+          # A value ending exactly at the end of the buffer (e.g. a number) may continue in the next chunk
+          if end < len(self.buffer) or self.eof:
+            self.pos = end
+            return value
+        except json.JSONDecodeError:
+          if self.eof:
+            raise
+        self._fill()
+
+    def keys(self):
+      # Yields the keys of the object at the current position; the caller consumes each member value
+      self._expect('{')
+      if self._peek() == '}':
+        self.pos += 1
+        return
+      while True:
+        key = self.value()
+        self._expect(':')
+        yield key
+        if self._expect(',}') == '}':
+          return
+
+    def values(self):
+      # Yields the decoded member values of the object or array at the current position
+      if self._peek() == '[':
+        self.pos += 1
+        if self._peek() == ']':
+          self.pos += 1
+          return
+        while True:
+          yield self.value()
+          if self._expect(',]') == ']':
+            return
+      else:
+        for _ in self.keys():
+          yield self.value()
+
+    def skip(self):
+      if self._peek() in '{[':
+        for _ in self.values():
+          pass
+      else:
+        self.value()
+
+class FETCH:
+    # Conditional GET of the panel: the validators (ETag, Last-Modified) of the last complete download
+    # are kept next to the downloaded copy, so a 304 reply means that copy is still current
+    USER_AGENT = 'TV-Lite custom build'
+    TIMEOUT = 60
+
+    def url_key(url: str):
+      # The URL carries the credentials, so only its hash is stored
+      return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+    def open(url: str, filename: str):
+      # Returns the response, or None when the server replies 304 Not Modified for the copy in filename
+      headers = {'User-Agent': FETCH.USER_AGENT, 'Accept-Encoding': 'gzip'}
+      meta = dict()
+      if os.path.exists(filename):
+        try:
+          meta = JSON.json_load(filename + '.fetch.json')
+        except (OSError, ValueError):
+          pass
+      if meta.get('url_key') == FETCH.url_key(url):
+        if meta.get('etag'):
+          headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+          headers['If-Modified-Since'] = meta['last_modified']
+      try:
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=FETCH.TIMEOUT)
+      except urllib.error.HTTPError as e:
+        if e.code == 304:
+          e.close()
+          return None
+        raise
+
+    def download(url: str, response, filename: str):
+      # Text stream of the response body that saves a copy to filename as it is read; the copy and
+      # its validators replace the previous ones only once the body has been read to its end
+      body = response
+      if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+        body = gzip.GzipFile(fileobj=response)
+      meta = {'url_key': FETCH.url_key(url), 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+      return io.TextIOWrapper(io.BufferedReader(Download(response, body, filename, meta)), encoding='utf-8')
+
+class Download(io.RawIOBase):
+    def __init__(self, response, body, filename: str, meta: dict):
+      self.response = response
+      self.body = body
+      self.filename = filename
+      self.meta = meta
+      self.temp_file = filename + '.part'
+      self.outfile = open(self.temp_file, 'wb')
+
+    def readable(self):
+      return True
+
+    def readinto(self, buffer):
+      data = self.body.read(len(buffer))
+      if data:
+        self.outfile.write(data)
+        buffer[:len(data)] = data
+      elif not self.outfile.closed:
+        self.outfile.close()
+        # urllib ends a cut short body like a complete one; length is what was announced but not received
+        if self.response.length:
+          os.remove(self.temp_file)
+          raise http.client.IncompleteRead(b'', self.response.length)
+        os.replace(self.temp_file, self.filename)
+        JSON.json_write(self.filename + '.fetch.json', self.meta)
+      return len(data)
+
+    def close(self):
+      if not self.outfile.closed:
+        # Closed before the end of the body: the previous copy is kept
+        self.outfile.close()
+        os.remove(self.temp_file)
+      self.body.close()
+      super().close()
+
 class M3U:
-  def render_m3u_entry_extinf(entry: dict):
-    buffer = "#EXTINF:-1 "
-    buffer += 'tvg-id="' + entry['stream_id'] +'" '
-    buffer += 'tvg-name="' + entry['name'] + '" '
-    buffer += 'tvg-logo="' + entry['stream_icon'] + '" '
-    buffer += 'group-title="' + entry['category_name'] +'"'
-    buffer += ',' + entry['name']
-    return buffer
-
-  def render_m3u_entry_url(base_url:str, entry: dict):
-    id = entry['stream_id']
-    return base_url + "/" + id + ".ts"
-
-  def render_m3u(m3u_entries: list, filename: str, base_url: str):
-    with open(filename, "w") as outfile:
+  def render_m3u(m3u_entries: list, filename: str):
+    with open(filename, "w") as outfile, M3UWriter(outfile, render_panel_extinf_line) as writer:
       outfile.write("#EXTM3U" + '\n')
       for entry in m3u_entries:
-        outfile.write(M3U.render_m3u_entry_extinf(entry) + '\n')
-        outfile.write(M3U.render_m3u_entry_url(base_url, entry) + '\n')
+        writer.write_entry(entry)
+
+  def render_m3u_profiles(entries, profiles_by_category: dict, filenames: list):
+    # One walk over the channels, each one rendered once and written to every profile including it
+    counts = [0] * len(filenames)
+    with contextlib.ExitStack() as stack:
+      writers = []
+      for filename in filenames:
+        outfile = stack.enter_context(open(filename, "w"))
+        outfile.write("#EXTM3U" + '\n')
+        writers.append(stack.enter_context(M3UWriter(outfile)))
+      for entry in entries:
+        profiles = profiles_by_category.get(entry.group_id)
+        if not profiles:
+          continue
+        lines = render_entry(entry, render_panel_extinf_line)
+        for profile in profiles:
+          writers[profile].write_rendered(lines)
+          counts[profile] += 1
+    return counts
 
 class PANEL:
+  # Panel members needed before the channels can be filtered and rendered
+  HEADER_KEYS = ('server_info', 'user_info', 'categories')
+
   def get_active_categories(panel_data, filter_definition):
     all_categories = panel_data['categories']['live']
-    included_categories = frozenset(filter_definition['included_categories'])
-    categories = [cat for cat in all_categories if cat['category_name'] in included_categories]
+    # included_categories, include and exclude patterns compiled into one matcher (see group_filter)
+    group_filter = GroupFilter.from_definition(filter_definition)
+    categories = [cat for cat in all_categories if cat['category_name'] in group_filter]
     return categories
 
   def categories_list_to_dict_by_id(categories: list):
@@ -103,21 +396,71 @@ class PANEL:
       dict_cat[c['category_id']] = c
     return dict_cat
 
+  def get_profiles_by_category(panel_data, filter_definitions: list):
+    # category_id -> indices of the filter definitions including that category
+    profiles_by_category = dict()
+    for profile, filter_definition in enumerate(filter_definitions):
+      for category_id in PANEL.categories_list_to_dict_by_id(PANEL.get_active_categories(panel_data, filter_definition)):
+        profiles_by_category.setdefault(category_id, []).append(profile)
+    return profiles_by_category
+
   def filter_channels_by_category(channels: dict, categories: dict):
     return [chanel for id, chanel in channels.items() if chanel['category_id'] in categories ]
 
   def get_base_stream_url(panel_data: dict):
-    base_url = panel_data['server_info']['server_protocol']
-    base_url += "://"
-    base_url += panel_data['server_info']['url']
-    base_url += ":"
-    base_url += panel_data['server_info']['port']
-    base_url += "/"
-    base_url += panel_data['user_info']['username']
-    base_url += "/"
-    base_url += panel_data['user_info']['password']
-    return base_url
+    server_info, user_info = panel_data['server_info'], panel_data['user_info']
+    return '{}://{}:{}/{}/{}'.format(server_info['server_protocol'], server_info['url'], server_info['port'],
+                                     user_info['username'], user_info['password'])
+
+
+class STATE:
+    # Fingerprints of the inputs and channels of the previous run, used to skip unchanged runs
+    # and to report which channels were added, removed or changed
+    VERSION = 1
+    # Entry fields of the panel's stream_id, name, stream_icon, category_id and category_name
+    ENTRY_FIELDS = ('stream_id', 'name', 'logo', 'group_id', 'group')
+
+    def load(filename: str):
+      try:
+        state = JSON.json_load(filename)
+      except FileNotFoundError:
+        return dict()
+      except (OSError, ValueError) as e:
+        logging.warning('Ignoring unreadable state file {}: {}'.format(filename, e))
+        return dict()
+      return state if state.get('version') == STATE.VERSION else dict()
 
+    def save(filename: str, state: dict):
+      temp_file = filename + '.tmp'
+      with open(temp_file, 'w') as outfile:
+        json.dump(state, outfile, separators=(',', ':'))
+      os.replace(temp_file, filename)
+
+    def inputs_key(filenames: list):
+      digest = hashlib.blake2b(digest_size=16)
+      for filename in filenames:
+        digest.update(filename.encode() + b'\0')
+        with open(filename, 'rb') as infile:
+          for chunk in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(chunk)
+      return digest.hexdigest()
+
+    def channel_fingerprint(entry: Entry):
+      fields = '\x1f'.join(str(getattr(entry, field)) for field in STATE.ENTRY_FIELDS)
+      return hashlib.blake2b(fields.encode(), digest_size=8).hexdigest()
+
+    def track(entries, fingerprints: dict):
+      # Records [fingerprint, name] of every channel by stream_id while passing the entries through
+      for entry in entries:
+        fingerprints[str(entry.stream_id)] = [STATE.channel_fingerprint(entry), entry.name]
+        yield entry
+
+    def delta(previous: dict, current: dict):
+      added = [{'stream_id': id, 'name': entry[1]} for id, entry in current.items() if id not in previous]
+      removed = [{'stream_id': id, 'name': entry[1]} for id, entry in previous.items() if id not in current]
+      changed = [{'stream_id': id, 'name': entry[1], 'previous_name': previous[id][1]}
+                 for id, entry in current.items() if id in previous and previous[id][0] != entry[0]]
+      return {'added': added, 'removed': removed, 'changed': changed}
 
 class KY:
     def generate_list_of_all_categories_to_file(data: dict, type: str, filename: str):
@@ -125,21 +468,79 @@ class KY:
       JSON.json_write(filename, file_contents)
 
     def process():
-      logging.debug('Loading filter file {} '.format(PANEL_FILTER_FILE))
-      filter_definition = JSON.json_load(PANEL_FILTER_FILE)
-      logging.debug('Loading filter file {} complete'.format(PANEL_FILTER_FILE))
+      profiles = PANEL_PROFILES or [(PANEL_FILTER_FILE, OUT_M3U_FILE)]
+      KY.process_profiles(profiles)
+
+    def process_profiles(profiles: list):
+      out_files = [out_file for _, out_file in profiles]
+      response = None
+      if PANEL_URL:
+        logging.debug('Fetching panel {} '.format(redact_url(PANEL_URL)))
+        with AppUtil.stage('fetch'):
+          response = FETCH.open(PANEL_URL, PANEL_FILE)
+        if response is None:
+          logging.debug('Panel not modified since the last fetch, using {}'.format(PANEL_FILE))
+
+      state = dict()
+      if PANEL_STATE_FILE:
+        with AppUtil.stage('check state'):
+          state = STATE.load(PANEL_STATE_FILE)
+          # A fresh download is parsed while it arrives, its key is computed once it is complete
+          inputs_key = None if response else STATE.inputs_key([PANEL_FILE] + [filter_file for filter_file, _ in profiles])
+        if inputs_key and state.get('inputs_key') == inputs_key and state.get('out_files') == out_files \
+           and all(os.path.exists(out_file) for out_file in out_files):
+          logging.debug('Panel and filter files unchanged since the previous run, outputs are up to date')
+          return
+
+      filter_definitions = []
+      with AppUtil.stage('load filters'):
+        for filter_file, _ in profiles:
+          logging.debug('Loading filter file {} '.format(filter_file))
+          filter_definitions.append(JSON.json_load(filter_file))
+          logging.debug('Loading filter file {} complete'.format(filter_file))
 
       logging.debug('Loading panel file {} '.format(PANEL_FILE))
-      panel_data = JSON.json_load(PANEL_FILE)
+      with AppUtil.stage('load panel'):
+        infile = FETCH.download(PANEL_URL, response, PANEL_FILE) if response else None
+        if PANEL_STREAMING:
+          panel_data, channels = JSON.json_stream_object(PANEL_FILE, 'available_channels', PANEL.HEADER_KEYS, infile)
+          logging.debug('Channels of panel file {} are streamed while rendering'.format(PANEL_FILE))
+        elif infile:
+          with infile:
+            panel_data = json.load(infile)
+            JSON._drain(infile)
+          channels = panel_data['available_channels'].values()
+        else:
+          panel_data = JSON.json_load(PANEL_FILE)
+          channels = panel_data['available_channels'].values()
       logging.debug('Loading panel file {} complete'.format(PANEL_FILE))
 
-      logging.debug('Processing')
-      categories = PANEL.get_active_categories(panel_data, filter_definition)
-      categories_dict = PANEL.categories_list_to_dict_by_id(categories)
-      channels = PANEL.filter_channels_by_category(panel_data['available_channels'], categories_dict)
-      base_url = PANEL.get_base_stream_url(panel_data)
-      logging.debug('Writing results to file {}'.format(OUT_M3U_FILE))
-      M3U.render_m3u(channels, OUT_M3U_FILE, base_url)
+      logging.debug('Processing {} profiles'.format(len(profiles)))
+      with AppUtil.stage('index categories'):
+        profiles_by_category = PANEL.get_profiles_by_category(panel_data, filter_definitions)
+        base_url = PANEL.get_base_stream_url(panel_data)
+
+      entries = (Entry.from_panel_channel(channel, base_url) for channel in AppUtil.timed(channels, 'read channels'))
+      fingerprints = dict()
+      if PANEL_STATE_FILE:
+        entries = STATE.track(entries, fingerprints)
+
+      logging.debug('Writing results to files {}'.format(', '.join(out_files)))
+      with AppUtil.stage('render'):
+        counts = M3U.render_m3u_profiles(entries, profiles_by_category, out_files)
+      for out_file, count in zip(out_files, counts):
+        logging.debug('Wrote {} channels to {}'.format(count, out_file))
+
+      if PANEL_STATE_FILE:
+        with AppUtil.stage('save state'):
+          if not inputs_key:
+            inputs_key = STATE.inputs_key([PANEL_FILE] + [filter_file for filter_file, _ in profiles])
+          delta = STATE.delta(state.get('channels', dict()), fingerprints)
+          delta_file = os.path.splitext(PANEL_STATE_FILE)[0] + '.delta.json'
+          JSON.json_write(delta_file, delta)
+          STATE.save(PANEL_STATE_FILE, {'version': STATE.VERSION, 'inputs_key': inputs_key, 'out_files': out_files, 'channels': fingerprints})
+        logging.debug('Channels since the previous run: {} added, {} removed, {} changed (details in {})'.format(
+          len(delta['added']), len(delta['removed']), len(delta['changed']), delta_file))
 
 if __name__ == '__main__':
     app = AppUtil()
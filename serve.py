@@ -0,0 +1,316 @@
+import os
+import glob
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+import itertools
+import re
+import urllib.parse
+import http.server
+
+import process
+from process import AppUtil, JSON, FETCH, PANEL
+
+from v2 import filter_live_channels as FLC
+from v2.m3u_entry import Entry
+from v2.m3u_writer import render_entry, render_extinf_line, render_panel_extinf_line
+from v2.group_filter import GroupFilter
+from logos import LOGO
+
+class ServeUtil:
+    def get_operating_parameters():
+        global SERVE_HOST
+        global SERVE_PORT
+        global SERVE_PROFILES
+        global SERVE_GROUP_FILES
+        global SERVE_PLAYLIST
+        global SERVE_REFRESH
+        global SERVE_CACHE_SIZE
+        global SERVE_LOGO_DIR
+
+        SERVE_HOST = os.environ.get('SERVE_HOST', '127.0.0.1')
+        SERVE_PORT = AppUtil.toint(os.environ.get('SERVE_PORT', 8080))
+        SERVE_PROFILES = [p.strip() for p in os.environ.get('SERVE_PROFILES', 'KY-filter_*.json').split(',') if p.strip()]
+        SERVE_GROUP_FILES = [p.strip() for p in os.environ.get('SERVE_GROUP_FILES', '').split(',') if p.strip()]
+        SERVE_PLAYLIST = os.environ.get('SERVE_PLAYLIST', '')
+        SERVE_REFRESH = AppUtil.toint(os.environ.get('SERVE_REFRESH', 300))
+        SERVE_CACHE_SIZE = AppUtil.toint(os.environ.get('SERVE_CACHE_SIZE', 64))
+        # Logos stored by logos.py, served as /logos/<file>; empty disables
+        SERVE_LOGO_DIR = os.environ.get('SERVE_LOGO_DIR', 'logos')
+
+class CATALOGUE:
+    # One load of the source: every entry rendered once, with the rows of each group in source order.
+    # Profiles are joins of the rows of their groups; rendered profiles are cached until the next load.
+    def __init__(self, rendered: list, rows_by_group: dict, group_titles: dict, source_key):
+      self.rendered = rendered
+      self.rows_by_group = rows_by_group
+      # group key -> title the profiles select on
+      self.group_titles = group_titles
+      self.source_key = source_key
+      self.loaded = time.time()
+      self.cache = dict()
+      self.lock = threading.Lock()
+
+    def build(entries, render, source_key, categories: list = None):
+      # Panel entries are grouped by category_id and only the panel's live categories (category_id, name)
+      # can be selected, as process.py does; playlist entries are grouped by group title
+      rendered = []
+      rows_by_group = dict()
+      for row, entry in enumerate(entries):
+        rendered.append(render_entry(entry, render))
+        rows_by_group.setdefault(entry.group if categories is None else entry.group_id, []).append(row)
+      group_titles = {group: group for group in rows_by_group} if categories is None else dict(categories)
+      return CATALOGUE(rendered, rows_by_group, group_titles, source_key)
+
+    def playlist(self, key, group_filter: GroupFilter):
+      # Returns {'etag', 'body', 'entries'} of the playlist of the selected groups, rendered on the first request for key
+      with self.lock:
+        cached = self.cache.get(key)
+      if cached:
+        return cached
+      groups = [group for group, title in self.group_titles.items() if title in group_filter]
+      rows = sorted(itertools.chain.from_iterable(self.rows_by_group.get(group, ()) for group in groups))
+      body = ('#EXTM3U\n' + ''.join([self.rendered[row] for row in rows])).encode('utf-8')
+      cached = {'etag': '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest()), 'body': body, 'entries': len(rows)}
+      with self.lock:
+        if len(self.cache) >= SERVE_CACHE_SIZE:
+          # Oldest first; ad-hoc filters must not grow the cache without bound
+          self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = cached
+      return cached
+
+    def gzipped(cached: dict):
+      # Compressed once per rendered playlist, on the first request accepting gzip
+      if 'gzip' not in cached:
+        cached['gzip'] = gzip.compress(cached['body'], compresslevel=6, mtime=0)
+      return cached['gzip']
+
+class SOURCE:
+    # The panel (PANEL_FILE, fetched from PANEL_URL when set) or an M3U playlist (SERVE_PLAYLIST)
+
+    def file_key(filename: str):
+      stat = os.stat(filename)
+      return (stat.st_mtime_ns, stat.st_size)
+
+    def load(previous_key=None):
+      # Returns a new CATALOGUE, or None when the source did not change since previous_key
+      if SERVE_PLAYLIST:
+        key = SOURCE.file_key(SERVE_PLAYLIST)
+        if key == previous_key:
+          return None
+        return CATALOGUE.build(SOURCE.playlist_entries(SERVE_PLAYLIST), render_extinf_line, key)
+
+      infile = None
+      if process.PANEL_URL:
+        response = FETCH.open(process.PANEL_URL, process.PANEL_FILE)
+        if response is not None:
+          infile = FETCH.download(process.PANEL_URL, response, process.PANEL_FILE)
+      if infile is None:
+        key = SOURCE.file_key(process.PANEL_FILE)
+        if key == previous_key:
+          return None
+      panel_data, channels = JSON.json_stream_object(process.PANEL_FILE, 'available_channels', PANEL.HEADER_KEYS, infile)
+      base_url = PANEL.get_base_stream_url(panel_data)
+      live_categories = [(category['category_id'], category['category_name']) for category in panel_data['categories']['live']]
+      catalogue = CATALOGUE.build((Entry.from_panel_channel(channel, base_url) for channel in channels),
+                                  render_panel_extinf_line, None, live_categories)
+      catalogue.source_key = SOURCE.file_key(process.PANEL_FILE)
+      return catalogue
+
+    def playlist_entries(filename: str):
+      # Live channels of the playlist, as the v2 filter keeps them
+      classifier = FLC.EntryClassifier()
+      current_extinf = None
+      with FLC.open_playlist_input(filename) as infile:
+        for line in infile:
+          line = line.strip()
+          if not line:
+            continue
+          if line.startswith('#'):
+            if line.startswith('#EXTINF'):
+              current_extinf = line
+          elif current_extinf:
+            entry = Entry.from_extinf(current_extinf, line)
+            current_extinf = None
+            if classifier.classify(entry.name, entry.url, entry.group)[0]:
+              yield entry
+
+class PROFILES:
+    # name -> (filename, file key, GroupFilter); KY-filter_sports.json is served as sports, groups/news.txt as news
+    profiles = dict()
+    lock = threading.Lock()
+
+    def name(filename: str):
+      name = os.path.splitext(os.path.basename(filename))[0]
+      return name[len('KY-filter_'):] if name.startswith('KY-filter_') else name
+
+    def load_groups(filename: str):
+      if filename.endswith('.json'):
+        return GroupFilter.from_definition(JSON.json_load(filename))
+      groups = FLC.load_allowed_groups(filename)
+      if groups is None:
+        raise ValueError('unreadable group file {}'.format(filename))
+      return groups
+
+    def scan():
+      # Picks up new, changed and removed profile files; unchanged ones are not read again
+      found = dict()
+      for pattern in SERVE_PROFILES + SERVE_GROUP_FILES:
+        for filename in sorted(glob.glob(pattern)):
+          found.setdefault(PROFILES.name(filename), filename)
+      with PROFILES.lock:
+        profiles = dict()
+        for name, filename in found.items():
+          try:
+            key = SOURCE.file_key(filename)
+            previous = PROFILES.profiles.get(name)
+            if previous and previous[0] == filename and previous[1] == key:
+              profiles[name] = previous
+            else:
+              profiles[name] = (filename, key, PROFILES.load_groups(filename))
+          except (OSError, ValueError, re.error) as e:
+            logging.warning('Skipping profile {}: {}'.format(filename, e))
+        PROFILES.profiles = profiles
+
+    def get(name: str):
+      # Rescans on a miss or when the profile file changed, so new and edited profiles are served at once
+      profile = PROFILES.profiles.get(name)
+      try:
+        current = profile is not None and SOURCE.file_key(profile[0]) == profile[1]
+      except OSError:
+        current = False
+      if not current:
+        PROFILES.scan()
+        profile = PROFILES.profiles.get(name)
+      return profile
+
+class SERVER:
+    catalogue = None
+
+    def refresh():
+      with AppUtil.stage('load'):
+        catalogue = SOURCE.load(SERVER.catalogue.source_key if SERVER.catalogue else None)
+      if catalogue is None:
+        logging.debug('Source unchanged, keeping the loaded catalogue')
+        return
+      # Replacing the catalogue drops every cached playlist of the previous one
+      SERVER.catalogue = catalogue
+      logging.debug('Loaded {} entries in {} groups'.format(len(catalogue.rendered), len(catalogue.rows_by_group)))
+
+    def refresh_loop():
+      while True:
+        time.sleep(SERVE_REFRESH)
+        try:
+          SERVER.refresh()
+          PROFILES.scan()
+        except Exception:
+          logging.exception('Refresh failed, still serving the previous catalogue')
+
+    def serve():
+      SERVER.refresh()
+      PROFILES.scan()
+      logging.debug('Profiles: {}'.format(', '.join(sorted(PROFILES.profiles)) or 'none'))
+      if SERVE_REFRESH > 0:
+        threading.Thread(target=SERVER.refresh_loop, name='refresh', daemon=True).start()
+      httpd = http.server.ThreadingHTTPServer((SERVE_HOST, SERVE_PORT), PlaylistHandler)
+      logging.debug('Serving on http://{}:{}/'.format(SERVE_HOST, SERVE_PORT))
+      try:
+        httpd.serve_forever()
+      except KeyboardInterrupt:
+        pass
+      finally:
+        httpd.server_close()
+
+class PlaylistHandler(http.server.BaseHTTPRequestHandler):
+    # GET /playlist/<profile>.m3u, /playlist.m3u?group=A&group=B (ad-hoc, patterns allowed), /profiles (JSON)
+    # and /logos/<file> (logos stored by logos.py)
+    LOGO_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif', 'webp': 'image/webp', 'svg': 'image/svg+xml'}
+
+    def do_GET(self):
+      self.respond(send_body=True)
+
+    def do_HEAD(self):
+      self.respond(send_body=False)
+
+    def respond(self, send_body: bool):
+      url = urllib.parse.urlsplit(self.path)
+      path = urllib.parse.unquote(url.path)
+      catalogue = SERVER.catalogue
+      if path == '/profiles':
+        body = json.dumps({'loaded': catalogue.loaded, 'entries': len(catalogue.rendered), 'profiles': {
+          name: {'file': filename, 'filter': groups.summary()} for name, (filename, _, groups) in sorted(PROFILES.profiles.items())
+        }}, indent=4).encode('utf-8')
+        return self.send(200, 'application/json', body, send_body)
+      if path == '/playlist.m3u':
+        groups = urllib.parse.parse_qs(url.query).get('group', [])
+        if not groups:
+          return self.send(400, 'text/plain; charset=utf-8', b'At least one group parameter is required\n', send_body)
+        try:
+          group_filter = GroupFilter(groups)
+        except re.error as e:
+          return self.send(400, 'text/plain; charset=utf-8', 'Invalid group pattern: {}\n'.format(e).encode('utf-8'), send_body)
+        return self.send_playlist(catalogue.playlist(('?',) + tuple(sorted(set(groups))), group_filter), send_body)
+      if path.startswith('/playlist/') and path.endswith('.m3u'):
+        profile = PROFILES.get(path[len('/playlist/'):-len('.m3u')])
+        if profile is not None:
+          filename, key, groups = profile
+          return self.send_playlist(catalogue.playlist((filename, key), groups), send_body)
+      if path.startswith('/logos/') and SERVE_LOGO_DIR:
+        return self.send_logo(path[len('/logos/'):], send_body)
+      self.send(404, 'text/plain; charset=utf-8', b'Not found\n', send_body)
+
+    def send_logo(self, name: str, send_body: bool):
+      # Stored under the hash of their content, so a logo never changes and clients may keep it for good
+      if not LOGO.FILE_NAME.match(name):
+        return self.send(404, 'text/plain; charset=utf-8', b'Not found\n', send_body)
+      etag = '"{}"'.format(name.partition('.')[0])
+      if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return
+      try:
+        with open(os.path.join(SERVE_LOGO_DIR, name), 'rb') as infile:
+          body = infile.read()
+      except OSError:
+        return self.send(404, 'text/plain; charset=utf-8', b'Not found\n', send_body)
+      self.send(200, PlaylistHandler.LOGO_TYPES[name.rpartition('.')[2]], body, send_body, {
+        'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'
+      })
+
+    def send_playlist(self, cached: dict, send_body: bool):
+      body, etag, encoding = cached['body'], cached['etag'], None
+      if 'gzip' in self.headers.get('Accept-Encoding', ''):
+        body, etag, encoding = CATALOGUE.gzipped(cached), cached['etag'][:-1] + '-gzip"', 'gzip'
+      if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return
+      self.send(200, 'audio/x-mpegurl; charset=utf-8', body, send_body, {
+        'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding', 'Content-Encoding': encoding
+      })
+
+    def send(self, status: int, content_type: str, body: bytes, send_body: bool, headers: dict = None):
+      self.send_response(status)
+      self.send_header('Content-Type', content_type)
+      self.send_header('Content-Length', str(len(body)))
+      for name, value in (headers or dict()).items():
+        if value:
+          self.send_header(name, value)
+      self.end_headers()
+      if send_body:
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+      logging.debug('{} {}'.format(self.address_string(), format % args))
+
+if __name__ == '__main__':
+    app = AppUtil()
+    app.on_start()
+    ServeUtil.get_operating_parameters()
+    SERVER.serve()
+    app.on_stop()
@@ -0,0 +1,46 @@
+"""Verdicts of the v2 EntryClassifier against the rules it replaced."""
+
+import itertools
+import re
+
+import pytest
+
+from v2 import filter_live_channels as FLC
+
+TITLES = ['BBC One', 'BBC One HD', 'CNN 24/7', 'Friends S01E02', 'Friends s1 e2', 'Friends S1  E12',
+          'The Season Finale', 'Episode 4', 'ESPN2', 'Sky Sports 1080p', 'Matrix (1999)', 'News 2024',
+          'Channel 1984x', 'Studio 54', 'Ziggo Sport 20', 'ſ01 Unicode', 'straße', '']
+CATEGORIES = ['UK| NEWS', 'UK| SRS DRAMA', 'uk| srs lower', 'VOD| ACTION', 'vod kids', 'MOVIES', 'Film4',
+              'CINEMA HD', 'PPV DOWNLOAD', 'ON DEMAND', 'RENTALS', 'ſrs unicode', 'US| SPORTS', '', None]
+URLS = ['http://panel/live/u/p/1.ts', 'http://panel/series/u/p/2.mkv', 'http://panel/movie/u/p/3.mp4',
+        'http://panel/u/p/4', '']
+
+
+def reference_should_keep_entry(title, url, category, allowed_groups=None):
+    # should_keep_entry as it was before EntryClassifier
+    if allowed_groups is not None:
+        if not category or category not in allowed_groups:
+            return False, "group_not_allowed"
+    if (category and "SRS" in category.upper()) or \
+       (url and "/series/" in url) or \
+       (title and any(pattern in title.upper() for pattern in ["S0", "E0", "SEASON", "EPISODE"])) or \
+       (title and re.search(r'S\d+\s*E\d+', title.upper())):
+        return False, "series"
+    elif (category and "VOD" in category.upper()) or \
+         (url and "/movie/" in url) or \
+         (title and re.search(r'\b(19|20)\d{2}\b', title)) or \
+         (category and any(keyword in category.upper() for keyword in ["MOVIE", "FILM", "CINEMA"])):
+        return False, "movie"
+    elif category and any(keyword in category.upper() for keyword in ["DOWNLOAD", "ON DEMAND", "RENTAL"]):
+        return False, "other VOD"
+    return True, ""
+
+
+@pytest.mark.parametrize('allowed_groups', [None, {'UK| NEWS', 'UK| SRS DRAMA', 'MOVIES', 'US| SPORTS'}],
+                         ids=['all groups', 'allowed groups'])
+def test_classifier_matches_previous_rules(allowed_groups):
+    classifier = FLC.EntryClassifier(allowed_groups)
+    for title, category, url in itertools.product(TITLES, CATEGORIES, URLS):
+        expected = reference_should_keep_entry(title, url, category, allowed_groups)
+        assert classifier.classify(title, url, category) == expected, (title, category, url)
+        assert FLC.should_keep_entry(title, url, category, allowed_groups) == expected
@@ -0,0 +1,64 @@
+"""EXTINF line tokenizing against the per-attribute regex searches it replaced."""
+
+import re
+
+import pytest
+
+from v2.m3u_entry import split_extinf_line, tokenize_extinf_line
+
+WELL_FORMED = [
+    '#EXTINF:-1 tvg-id="bbc1.uk" tvg-name="BBC One" tvg-logo="http://logo/1.png" group-title="UK| NEWS",BBC One',
+    '#EXTINF:-1 tvg-chno="7" catchup="default" group-title="UK| NEWS",ITV 1, HD',
+    '#EXTINF:0 group-title="",Untitled group',
+    '#EXTINF:-1 tvg-id="a" tvg-id="b" group-title="A" group-title="B",First wins',
+    '#EXTINF:-1,No attributes',
+    '#EXTINF:-1\ttvg-id="tab"\tgroup-title="Tabs",Tab separated',
+    '#EXTINF:-1 group-title="Üñíçødé | Sport",Ünïcode 🎉',
+]
+# Commas inside attribute values: the title is taken after the attributes, not at the first comma
+COMMAS = [
+    ('#EXTINF:-1 tvg-name="Smith, John" group-title="Talk, Radio",The Smith Show',
+     {'tvg-name': 'Smith, John', 'group-title': 'Talk, Radio'}, 'The Smith Show'),
+    ('#EXTINF:-1 tvg-logo="http://logo/a,b.png",Logo With Comma',
+     {'tvg-logo': 'http://logo/a,b.png'}, 'Logo With Comma'),
+]
+# Unquoted or malformed attributes are skipped without losing the attributes after them
+MALFORMED = [
+    ('#EXTINF:-1 catchup tvg-id="x" group-title="G",After a bare word', {'tvg-id': 'x', 'group-title': 'G'}, 'After a bare word'),
+    ('#EXTINF:-1 tvg-chno=7 group-title="G",Unquoted value', {'group-title': 'G'}, 'Unquoted value'),
+    ('#EXTINF:-1 tvg-id="x"group-title="G",Glued attributes', {'tvg-id': 'x', 'group-title': 'G'}, 'Glued attributes'),
+    ('#EXTINF:-1 tvg-name="open quote,Cut', {}, 'Cut'),
+    ('#EXTINF:-1 group-title="G"', {'group-title': 'G'}, ''),
+]
+
+
+def reference_fields(extinf_line):
+    # The per-attribute searches of parse_extinf_line_streaming before the tokenizer
+    fields = {}
+    for key in ('tvg-id', 'tvg-name', 'tvg-logo', 'group-title'):
+        match = re.search(key + r'="([^"]*)"', extinf_line)
+        if match:
+            fields[key] = match.group(1)
+    match = re.search(r',(.+)$', extinf_line)
+    return fields, match.group(1) if match else ''
+
+
+@pytest.mark.parametrize('line', WELL_FORMED)
+def test_well_formed_lines_match_previous_parser(line):
+    attributes, title = tokenize_extinf_line(line)
+    fields, expected_title = reference_fields(line)
+    assert {key: attributes[key] for key in fields} == fields
+    assert title == expected_title
+
+
+@pytest.mark.parametrize('line, attributes, title', COMMAS + MALFORMED)
+def test_commas_and_malformed_attributes(line, attributes, title):
+    assert tokenize_extinf_line(line) == (attributes, title)
+
+
+@pytest.mark.parametrize('line', WELL_FORMED + [line for line, _, _ in COMMAS + MALFORMED])
+def test_split_matches_tokenizer(line):
+    attributes, title = tokenize_extinf_line(line)
+    expected = (attributes.get('group-title', ''), title)
+    assert split_extinf_line(line) == expected
+    assert split_extinf_line(line.encode('utf-8')) == tuple(part.encode('utf-8') for part in expected)
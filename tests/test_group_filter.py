@@ -0,0 +1,43 @@
+"""Group files and patterns of v2/group_filter.py."""
+
+from v2 import filter_live_channels as FLC
+from v2.group_filter import GroupFilter, PATTERNS_MARKER
+
+# Group titles that look like patterns, next to the titles those patterns would match
+LISTED = ['SPORTS*', 'Movies ?', '!NEW', 're:cool', '[UK] News', 'USA Local - *']
+OTHERS = ['SPORTS 1', 'Movies X', 'NEW', 'very cool', 'U News', 'USA Local - Boston', 'UK| NEWS', '']
+
+
+def old_list_groups_file(path, groups):
+    # As written by --list-groups --groups-output before patterns existed
+    lines = ["# M3U Playlist Group Analysis", "# Input: playlist.m3u", "# Generated: 2024-01-01 00:00:00",
+             f"# Total entries: {len(groups) * 10:,}", f"# Unique groups: {len(groups):,}", "#"]
+    path.write_text('\n'.join(lines + sorted(groups, key=str.lower)) + '\n', encoding='utf-8')
+
+
+def old_load_allowed_groups(path):
+    # The exact-title set the filter used before patterns existed
+    with open(path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip() and not line.strip().startswith('#')}
+
+
+def test_old_list_groups_file_selects_the_same_groups(tmp_path):
+    groups_file = tmp_path / 'groups.txt'
+    old_list_groups_file(groups_file, LISTED)
+    allowed = FLC.load_allowed_groups(str(groups_file))
+    expected = old_load_allowed_groups(groups_file)
+    assert expected == set(LISTED)
+    assert [group for group in LISTED + OTHERS if group in allowed] == [group for group in LISTED + OTHERS if group in expected]
+
+
+def test_patterns_after_marker():
+    allowed = GroupFilter.from_lines(['# kept as before', 'SPORTS*', PATTERNS_MARKER,
+                                      'USA Local - *', 're:cool$', '!USA Local - Boston'])
+    assert allowed.select(LISTED + OTHERS) == ['SPORTS*', 're:cool', 'USA Local - *', 'very cool']
+
+
+def test_exclusions_only_keep_other_groups():
+    allowed = GroupFilter.from_lines([PATTERNS_MARKER, '!SPORTS*', '!re:^USA'])
+    assert allowed.select(LISTED + OTHERS) == ['Movies ?', '!NEW', 're:cool', '[UK] News',
+                                              'Movies X', 'NEW', 'very cool', 'U News', 'UK| NEWS', '']
+    assert GroupFilter.from_lines(['# nothing selected']).select(OTHERS) == []
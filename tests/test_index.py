@@ -0,0 +1,73 @@
+"""The .m3uidx sidecar of the v2 filter: stale or damaged indexes are rebuilt, never trusted."""
+
+import os
+
+import pytest
+
+from v2 import filter_live_channels as FLC
+
+ENTRIES = [
+    ('#EXTINF:-1 tvg-id="news.uk" group-title="UK| NEWS",News One', 'http://panel/live/u/p/1.ts'),
+    ('#EXTINF:-1 group-title="VOD| ACTION",Some Film (2020)', 'http://panel/movie/u/p/2.mkv'),
+    ('#EXTINF:-1 group-title="UK| SPORTS",Sport One', 'http://panel/live/u/p/3.ts'),
+    ('#EXTINF:-1 group-title="UK| SRS DRAMA",Show S01E02', 'http://panel/series/u/p/4.mkv'),
+]
+
+
+def write_playlist(path, count, first_group='UK| NEWS'):
+    lines = ['#EXTM3U']
+    for n in range(count):
+        extinf, url = ENTRIES[n % len(ENTRIES)]
+        lines += [extinf.replace('UK| NEWS', first_group), url.replace('/1.ts', f'/{n}.ts')]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(FLC, 'VERBOSITY', FLC.QUIET)
+
+
+@pytest.fixture
+def playlist(tmp_path):
+    input_file = tmp_path / 'input.m3u'
+    write_playlist(input_file, 100)
+    return input_file
+
+
+def filtered(input_file, groups_file=None, **mode):
+    output_file = input_file.parent / 'output.m3u'
+    FLC.filter_live_channels(str(input_file), str(output_file), groups_filter_file=groups_file, **mode)
+    return output_file.read_bytes()
+
+
+def test_index_output_matches_mmap(playlist, tmp_path):
+    groups_file = tmp_path / 'groups.txt'
+    groups_file.write_text('UK| NEWS\nVOD| ACTION\n', encoding='utf-8')
+    for groups in (None, str(groups_file)):
+        assert filtered(playlist, groups, use_index=True) == filtered(playlist, groups, use_mmap=True)
+    assert FLC.PlaylistIndex.load(str(playlist)) is not None
+
+
+def test_changed_source_rebuilds_index(playlist):
+    filtered(playlist, use_index=True)
+    # Same size, other content; then more entries
+    write_playlist(playlist, 100, first_group='UK| NEWZ')
+    assert FLC.PlaylistIndex.load(str(playlist)) is None
+    assert filtered(playlist, use_index=True) == filtered(playlist, use_mmap=True)
+    write_playlist(playlist, 150)
+    assert filtered(playlist, use_index=True) == filtered(playlist, use_mmap=True)
+    assert len(FLC.PlaylistIndex.load(str(playlist)).reasons) == 150
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'extended', 'empty', 'garbage'])
+def test_damaged_index_is_rebuilt(playlist, damage):
+    expected = filtered(playlist, use_index=True)
+    index_file = FLC.PlaylistIndex.index_file(str(playlist))
+    with open(index_file, 'rb') as f:
+        data = f.read()
+    damaged = {'truncated': data[:-5], 'extended': data + b'\0' * 8, 'empty': b'', 'garbage': b'M3UIDX\n\xff\xff\xff\xff{'}[damage]
+    with open(index_file, 'wb') as f:
+        f.write(damaged)
+    assert FLC.PlaylistIndex.load(str(playlist)) is None
+    assert filtered(playlist, use_index=True) == expected
+    assert os.path.getsize(index_file) == len(data)
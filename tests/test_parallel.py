@@ -0,0 +1,76 @@
+"""--jobs N of the v2 filter: output byte-identical to a single process, wherever the chunks start."""
+
+import pytest
+
+from v2 import filter_live_channels as FLC
+
+ENTRIES = [
+    ('#EXTINF:-1 tvg-id="news.uk" group-title="UK| NEWS",News Ünø', 'http://panel/live/u/p/1.ts'),
+    ('#EXTINF:-1 group-title="VOD| ACTION",Some Film (2020)', 'http://panel/movie/u/p/2.mkv'),
+    ('#EXTINF:-1 group-title="UK| SPORTS",Sport 🎉', 'http://panel/live/u/p/3.ts'),
+    ('#EXTINF:-1 group-title="UK| SRS DRAMA",Show S01E02', 'http://panel/series/u/p/4.mkv'),
+    ('#EXTINF:-1 tvg-name="A, B" group-title="UK| NEWS",Comma, Title', 'http://panel/live/u/p/5.ts'),
+]
+
+
+def playlist(newline, count=40):
+    lines = ['#EXTM3U']
+    for n in range(count):
+        extinf, url = ENTRIES[n % len(ENTRIES)]
+        lines.append(extinf)
+        if n % 7 == 3:
+            lines.append('#EXTVLCOPT:http-user-agent=Test')
+        if n % 11 == 5:
+            lines.append('')
+        lines.append(url)
+    return (newline.join(lines) + newline).encode('utf-8')
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(FLC, 'VERBOSITY', FLC.QUIET)
+
+
+def chunk(input_file, start, end, tmp_path, raw):
+    chunk_file = tmp_path / 'chunk.m3u'
+    FLC.filter_chunk(str(input_file), start, end, str(chunk_file), None, raw)
+    return chunk_file.read_bytes()
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['lf', 'crlf'])
+@pytest.mark.parametrize('raw', [False, True], ids=['streaming', 'mmap'])
+def test_every_chunk_boundary(tmp_path, newline, raw):
+    input_file = tmp_path / 'input.m3u'
+    data = playlist(newline)
+    input_file.write_bytes(data)
+    whole = chunk(input_file, 0, len(data), tmp_path, raw)
+    boundaries = [n + 1 for n in range(len(data)) if data.startswith(b'\n#EXTINF', n)]
+    assert len(boundaries) == 40
+    for boundary in boundaries:
+        assert chunk(input_file, 0, boundary, tmp_path, raw) + chunk(input_file, boundary, len(data), tmp_path, raw) == whole
+
+
+# The mmap engine splits lines on LF only, so CR-only playlists are run in streaming mode
+@pytest.mark.parametrize('newline, use_mmap', [('\n', False), ('\r\n', False), ('\r', False), ('\n', True), ('\r\n', True)],
+                         ids=['streaming-lf', 'streaming-crlf', 'streaming-cr', 'mmap-lf', 'mmap-crlf'])
+def test_jobs_output_identical(tmp_path, newline, use_mmap):
+    input_file = tmp_path / 'input.m3u'
+    input_file.write_bytes(playlist(newline, 200))
+    outputs = []
+    for jobs in (1, 3):
+        output_file = tmp_path / f'output-{jobs}.m3u'
+        stats = FLC.filter_live_channels(str(input_file), str(output_file), use_mmap=use_mmap, jobs=jobs)
+        outputs.append((output_file.read_bytes(), stats['live_channels'], stats['total_entries']))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][1] == 120 and outputs[0][2] == 200
+
+
+def test_ranges_start_on_entries(tmp_path):
+    input_file = tmp_path / 'input.m3u'
+    data = playlist('\n', 200)
+    input_file.write_bytes(data)
+    for jobs in range(2, 9):
+        ranges = FLC.split_on_entries(str(input_file), jobs)
+        assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+        assert all(data.startswith(b'#EXTINF', start) for start, _ in ranges[1:])
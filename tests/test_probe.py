@@ -0,0 +1,131 @@
+"""Stream probes of probe.py, against a local HTTP stand-in for the stream hosts."""
+
+import asyncio
+import http.server
+import threading
+import time
+
+import pytest
+
+import probe
+
+HLS = b'#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXTINF:6.0,\nsegment1.ts\n'
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_chunked(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(body), 16):
+            chunk = body[start:start + 16]
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_GET(self):
+        if self.path == '/live.ts':
+            # A live stream: no length, data as long as the client reads
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp2t')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            try:
+                for _ in range(100):
+                    self.wfile.write(b'\x47' * 188)
+                    self.wfile.flush()
+                    time.sleep(0.02)
+            except OSError:
+                pass
+            self.close_connection = True
+        elif self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/live.ts')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/index.m3u8':
+            # Keep-alive and chunked, like most HLS origins
+            self.send_chunked(HLS)
+        elif self.path == '/empty.m3u8':
+            self.send_chunked(b'')
+        elif self.path == '/stalled':
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp2t')
+            self.end_headers()
+            time.sleep(2)
+            self.close_connection = True
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+
+@pytest.fixture
+def host():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StreamHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def parameters(monkeypatch, tmp_path):
+    monkeypatch.setenv('PROBE_INPUT', str(tmp_path / 'input.m3u'))
+    monkeypatch.setenv('PROBE_OUTPUT', str(tmp_path / 'probed.m3u'))
+    monkeypatch.setenv('PROBE_CACHE', '')
+    monkeypatch.setenv('PROBE_TIMEOUT', '1')
+    probe.ProbeUtil.get_operating_parameters()
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('/live.ts', (True, '200')),
+    ('/redirect', (True, '200')),
+    ('/index.m3u8', (True, '200')),
+    ('/empty.m3u8', (False, '200 empty')),
+    ('/missing.ts', (False, '404')),
+    ('/stalled', (False, 'timeout')),
+])
+def test_probe(host, path, expected):
+    assert asyncio.run(probe.PROBE.probe_all([host + path])) == {host + path: expected}
+
+
+def test_chunked_playlist_keeps_connection(host):
+    async def probe_twice():
+        pool = probe.HostPool(1)
+        try:
+            first = await probe.PROBE.probe(pool, host + '/index.m3u8')
+            idle = sum(len(connections) for connections in pool.idle.values())
+            second = await probe.PROBE.probe(pool, host + '/index.m3u8')
+            return first, idle, second
+        finally:
+            pool.close()
+    started = time.monotonic()
+    assert asyncio.run(probe_twice()) == ((True, '200'), 1, (True, '200'))
+    assert time.monotonic() - started < probe.PROBE_TIMEOUT
+
+
+def test_dead_channels_stay_in_input(host, tmp_path):
+    input_file = tmp_path / 'input.m3u'
+    input_file.write_text('#EXTM3U\n'
+                          '#EXTINF:-1 group-title="News",Live\n' + host + '/live.ts\n'
+                          '#EXTINF:-1 group-title="News",Gone\n' + host + '/missing.ts\n')
+    original = input_file.read_text()
+    assert probe.PROBE.probe_playlist(probe.PROBE_INPUT, probe.PROBE_OUTPUT) == (2, 1)
+    assert input_file.read_text() == original
+    probed = (tmp_path / 'probed.m3u').read_text()
+    assert 'Live' in probed and 'Gone' not in probed
+    assert not (tmp_path / 'probed.m3u.part').exists()
+
+
+def test_output_must_differ_from_input(monkeypatch, tmp_path):
+    monkeypatch.setenv('PROBE_OUTPUT', str(tmp_path / 'input.m3u'))
+    with pytest.raises(ValueError):
+        probe.ProbeUtil.get_operating_parameters()
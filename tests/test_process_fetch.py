@@ -0,0 +1,93 @@
+"""Conditional panel download of process.py, against a local HTTP stand-in for the panel."""
+
+import http.client
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import process
+
+PANEL = {
+    'user_info': {'username': 'u', 'password': 'p'},
+    'server_info': {'url': 'panel', 'port': '80', 'server_protocol': 'http'},
+    'categories': {'live': [{'category_id': '1', 'category_name': 'UK| NEWS'}]},
+    'available_channels': {
+        str(n): {'stream_id': str(n), 'name': 'News {}'.format(n), 'stream_icon': '', 'category_id': '1', 'category_name': 'UK| NEWS'}
+        for n in range(1, 2001)
+    },
+}
+
+
+class PanelHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # ETag of the panel served, and whether the body is cut half way
+    etag = '"v1"'
+    cut = False
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(PANEL).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        if self.cut:
+            # The connection drops half way through the announced body
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def panel(monkeypatch):
+    monkeypatch.setattr(PanelHandler, 'etag', '"v1"')
+    monkeypatch.setattr(PanelHandler, 'cut', False)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PanelHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/player_api.php'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=[True, False], ids=['streaming', 'whole'])
+def parameters(request, panel, monkeypatch, tmp_path):
+    filter_file = tmp_path / 'filter.json'
+    filter_file.write_text(json.dumps({'included_categories': ['UK| NEWS']}))
+    monkeypatch.setenv('PANEL_URL', panel)
+    monkeypatch.setenv('PANEL_FILE', str(tmp_path / 'panel.json'))
+    monkeypatch.setenv('PANEL_FILTER_FILE', str(filter_file))
+    monkeypatch.setenv('OUT_M3U_FILE', str(tmp_path / 'out.m3u'))
+    monkeypatch.setenv('PANEL_STREAMING', str(request.param))
+    process.AppUtil.get_operating_parameters()
+    return tmp_path
+
+
+def test_cut_panel_keeps_previous_copy_and_validators(parameters):
+    panel_file = parameters / 'panel.json'
+    meta_file = parameters / 'panel.json.fetch.json'
+    process.KY.process()
+    good, meta = panel_file.read_bytes(), meta_file.read_bytes()
+
+    PanelHandler.etag, PanelHandler.cut = '"v2"', True
+    with pytest.raises(http.client.IncompleteRead):
+        process.KY.process()
+    assert panel_file.read_bytes() == good
+    assert meta_file.read_bytes() == meta
+    assert not os.path.exists(str(panel_file) + '.part')
+
+    # The repaired server is asked for the new panel instead of answering 304 for the cut copy
+    PanelHandler.cut = False
+    process.KY.process()
+    assert json.loads(panel_file.read_text()) == PANEL
+    assert json.loads(meta_file.read_text())['etag'] == '"v2"'
+    assert (parameters / 'out.m3u').read_text().count('#EXTINF') == len(PANEL['available_channels'])
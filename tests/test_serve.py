@@ -0,0 +1,95 @@
+"""Catalogue refresh of serve.py, against a local HTTP stand-in for the panel."""
+
+import http.client
+import http.server
+import json
+import threading
+
+import pytest
+
+import process
+import serve
+
+
+def panel(names):
+    return {
+        'user_info': {'username': 'u', 'password': 'p'},
+        'server_info': {'url': 'panel', 'port': '80', 'server_protocol': 'http'},
+        'categories': {'live': [{'category_id': '1', 'category_name': 'UK| NEWS'}]},
+        'available_channels': {
+            str(n): {'stream_id': str(n), 'name': name, 'stream_icon': '', 'category_id': '1', 'category_name': 'UK| NEWS'}
+            for n, name in enumerate(names, 1)
+        },
+    }
+
+
+class PanelHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Panel served under its ETag, and whether the body is cut half way
+    etag, body, cut = '"v1"', b'', False
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = self.body
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        if self.cut:
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def publish(etag, names, cut=False):
+    PanelHandler.etag, PanelHandler.body, PanelHandler.cut = etag, json.dumps(panel(names)).encode('utf-8'), cut
+
+
+@pytest.fixture
+def parameters(monkeypatch, tmp_path):
+    for name in ('etag', 'body', 'cut'):
+        monkeypatch.setattr(PanelHandler, name, getattr(PanelHandler, name))
+    monkeypatch.setattr(serve.SERVER, 'catalogue', None)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PanelHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('PANEL_URL', 'http://127.0.0.1:{}/player_api.php'.format(server.server_address[1]))
+    monkeypatch.setenv('PANEL_FILE', str(tmp_path / 'panel.json'))
+    monkeypatch.setenv('SERVE_PLAYLIST', '')
+    process.AppUtil.get_operating_parameters()
+    serve.ServeUtil.get_operating_parameters()
+    yield tmp_path
+    server.shutdown()
+    server.server_close()
+
+
+def names():
+    return [entry.split('\n', 1)[0].rpartition(',')[2] for entry in serve.SERVER.catalogue.rendered]
+
+
+def test_failed_refresh_keeps_last_good_catalogue(parameters):
+    publish('"v1"', ['News One', 'News Two'])
+    serve.SERVER.refresh()
+    catalogue = serve.SERVER.catalogue
+    assert names() == ['News One', 'News Two']
+
+    # A cut refresh fails, and so does the next one: the cut copy was not kept to be answered 304 for
+    publish('"v2"', ['News One', 'News Two', 'News Three'], cut=True)
+    for _ in range(2):
+        with pytest.raises(http.client.IncompleteRead):
+            serve.SERVER.refresh()
+        assert serve.SERVER.catalogue is catalogue
+
+    PanelHandler.cut = False
+    serve.SERVER.refresh()
+    assert names() == ['News One', 'News Two', 'News Three']
+    # Unchanged upstream: 304, and the loaded catalogue is kept
+    catalogue = serve.SERVER.catalogue
+    serve.SERVER.refresh()
+    assert serve.SERVER.catalogue is catalogue
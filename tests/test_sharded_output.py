@@ -0,0 +1,42 @@
+"""Sharded output of the v2 filter: what a run leaves in the shard directory."""
+
+import os
+
+import pytest
+
+from v2 import filter_live_channels as FLC
+
+ENTRIES = [('UK| NEWS', '#EXTINF:-1 group-title="UK| NEWS",News One\nhttp://panel/live/u/p/1.ts\n'),
+           ('US| SPORTS', '#EXTINF:-1 group-title="US| SPORTS",Sports One\nhttp://panel/live/u/p/2.ts\n')]
+
+
+def write_shards(shard_dir, entries):
+    with FLC.ShardedOutput(str(shard_dir), compression='.gz') as shards:
+        for group, text in entries:
+            shards.write(group, text)
+    return shards
+
+
+def test_only_shards_of_the_previous_run_are_removed(tmp_path):
+    shard_dir = tmp_path / 'shards'
+    shard_dir.mkdir()
+    (shard_dir / 'input.m3u').write_text('#EXTM3U\n')
+    write_shards(shard_dir, ENTRIES)
+    assert {'UK_NEWS.m3u', 'US_SPORTS.m3u.gz', 'input.m3u'} <= set(os.listdir(shard_dir))
+
+    write_shards(shard_dir, ENTRIES[:1])
+    assert sorted(os.listdir(shard_dir)) == [FLC.SHARD_MANIFEST, 'UK_NEWS.m3u', 'UK_NEWS.m3u.gz', 'input.m3u']
+
+
+def test_failed_run_keeps_previous_shards(tmp_path):
+    shard_dir = tmp_path / 'shards'
+    write_shards(shard_dir, ENTRIES[:1])
+    before = {name: (shard_dir / name).read_bytes() for name in os.listdir(shard_dir)}
+
+    with pytest.raises(KeyboardInterrupt):
+        with FLC.ShardedOutput(str(shard_dir), compression='.gz') as shards:
+            for group, text in ENTRIES[1:]:
+                shards.write(group, text)
+            shards.flush()
+            raise KeyboardInterrupt
+    assert {name: (shard_dir / name).read_bytes() for name in os.listdir(shard_dir)} == before
@@ -0,0 +1,5 @@
+"""
+M3U filter (filter_live_channels.py) and the playlist modules it shares with
+the scripts at the top of the repository, which import them as v2.<module>.
+The filter itself still runs as a plain script from this directory.
+"""
@@ -3,93 +3,307 @@
 M3U Playlist Filter Script
 
 This script reads an M3U playlist file and filters out series and movies,
-keeping only live TV channels. It uses the m3u_parser library for parsing
-and creates a new filtered playlist.
-
-Requirements:
-    pip install m3u_parser
+keeping only live TV channels, and creates a new filtered playlist. Entries
+are carried as m3u_entry.Entry objects and written with m3u_writer.
 
 Usage:
     python filter_live_channels.py [input_file] [output_file]
     python filter_live_channels.py filtered.m3u live_channels.m3u
     python filter_live_channels.py --list-groups input.m3u
+    python filter_live_channels.py "http://host/get.php?username=...&type=m3u_plus" live_channels.m3u
+    curl -s "$URL" | python filter_live_channels.py - - | gzip > live_channels.m3u.gz
 """
 
-import m3u_parser
 import os
 import json
 import sys
 import argparse
 import re
+import time
+import functools
+import mmap
+import array
+import io
+import shutil
+import tempfile
+import concurrent.futures
+import hashlib
+import itertools
+import collections
+import bisect
+import gzip
+import bz2
+import lzma
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+
+try:
+    from .m3u_entry import Entry, split_extinf_line
+    from .m3u_writer import M3UWriter, RENDER_VERSION, render_extinf_line
+    from .group_filter import GroupFilter
+except ImportError:  # Run as a script from v2/
+    from m3u_entry import Entry, split_extinf_line
+    from m3u_writer import M3UWriter, RENDER_VERSION, render_extinf_line
+    from group_filter import GroupFilter
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import numpy
+except ImportError:  # Optional: the batch engine falls back to plain lists
+    numpy = None
+
+# Verbosity levels: QUIET prints errors only, NORMAL adds progress and a summary,
+# VERBOSE adds one line per kept or filtered entry
+QUIET, NORMAL, VERBOSE = 0, 1, 2
+VERBOSITY = NORMAL
+
+# Seconds between two progress lines
+PROGRESS_INTERVAL = 2.0
+
+# Files larger than this are always filtered in streaming mode
+STREAMING_THRESHOLD_MB = 100
+
+# Kinds of entries counted by --list-groups, told apart by their URL
+ENTRY_KINDS = ('live', 'vod', 'series')
+
+# Stages timed during a filtering run
+STAGES = ('read', 'parse', 'classify', 'write')
+
+# Filter reason -> statistics counter (anything else counts as 'other_filtered')
+FILTER_REASON_STATS = {
+    "series": 'series_filtered',
+    "movie": 'movies_filtered',
+    "group_not_allowed": 'group_filtered'
+}
+
+# Remote playlists: some panels reject unknown clients, so identify as the player does
+FETCH_USER_AGENT = "TV-Lite custom build"
+FETCH_TIMEOUT = 60
+# Query parameters masked when a URL is logged
+SENSITIVE_QUERY_PARAMS = ('username', 'password', 'token')
+
+# Compressed inputs are recognised by their magic bytes, outputs are compressed by extension
+COMPRESSION_MAGIC = ((b'\x1f\x8b', gzip), (b'BZh', bz2), (b'\xfd7zXZ\x00', lzma))
+COMPRESSION_EXTENSIONS = {'.gz': gzip, '.bz2': bz2, '.xz': lzma}
+
+# Sharded output: shard keys, shard files kept open at once, and the file name of entries without a group
+SHARD_KINDS = ('group', 'prefix')
+MAX_OPEN_SHARDS = 256
+# Entries held in memory across all shards before they are written out
+SHARD_BUFFER_ENTRIES = 65536
+UNGROUPED_SHARD = 'ungrouped'
+# Shard files, and the list of those written by the previous run: the only ones removed once their group is gone
+SHARD_FILE_EXTENSIONS = ('.m3u',) + tuple(f".m3u{extension}" for extension in COMPRESSION_EXTENSIONS)
+SHARD_MANIFEST = '.shards.json'
+
+
+def log(message, level=NORMAL):
+    """Print a message if the current verbosity includes its level."""
+    if VERBOSITY >= level:
+        print(message)
+
+
+def new_stats(total_entries=0):
+    """Return an empty statistics dict for a filtering run."""
+    return {
+        'total_entries': total_entries,
+        'live_channels': 0,
+        'series_filtered': 0,
+        'movies_filtered': 0,
+        'other_filtered': 0,
+        'group_filtered': 0
+    }
+
+
+class ProgressReporter:
+    """
+    Time-based progress reporting and per-stage timing for a filtering run.
+    
+    Callers accumulate stage durations themselves (a few perf_counter calls per
+    entry) and hand them over with add_time(); tick() is cheap enough to be
+    called every entry and only looks at the clock every 1024 entries.
+    """
+    
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.start = time.perf_counter()
+        self.next_report = self.start + interval
+    
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+    
+    def tick(self, entries):
+        if entries & 1023 or VERBOSITY < NORMAL:
+            return
+        now = time.perf_counter()
+        if now >= self.next_report:
+            self.next_report = now + self.interval
+            elapsed = now - self.start
+            log(f"  Processed {entries:,} entries ({entries / elapsed:,.0f} entries/s)...")
+    
+    def finish(self, stats):
+        """Store elapsed time, throughput and stage timings in the statistics dict."""
+        elapsed = time.perf_counter() - self.start
+        stats['elapsed_seconds'] = elapsed
+        stats['entries_per_second'] = stats['total_entries'] / elapsed if elapsed > 0 else 0.0
+        stats['timings'] = dict(self.timings)
+        return stats
+
+
+def peak_memory_kb():
+    """Return the peak resident set size of this process in KB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def write_stats_json(stats, stats_file):
+    """Write the statistics of a run as JSON."""
+    with open(stats_file, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2)
+        f.write('\n')
 
   
-def filter_live_channels(input_file="filtered.m3u", output_file="live_channels.m3u", use_streaming=True, groups_filter_file=None):
+def filter_live_channels(input_file="filtered.m3u", output_file="live_channels.m3u", use_streaming=True, groups_filter_file=None, use_mmap=False, jobs=1, state_file=None, use_index=False, shards=None):
     """
     Filter M3U playlist to exclude series and movies, keeping only live channels.
     Uses streaming processing to handle large files efficiently by default.
     
     Args:
-        input_file (str): Path to input M3U file
+        input_file (str): Path to input M3U file, or an http(s) URL fetched conditionally
+                          and filtered while it downloads
         output_file (str): Path to output M3U file
         use_streaming (bool): Use streaming mode for large files (default: True)
         groups_filter_file (str, optional): Path to file containing allowed group titles
+        use_mmap (bool): Scan the memory-mapped file as bytes and copy kept entries verbatim
+        jobs (int): Number of worker processes; more than one filters chunks of the file in parallel
+        state_file (str, optional): State of the previous run; unchanged entries reuse its
+                                    verdicts, and a delta report is written next to the output
+        use_index (bool): Take the verdicts from the index sidecar of the input (built when
+                          missing or out of date) and copy kept entries verbatim
+        shards (ShardedOutput, optional): Write the kept entries to one playlist per group
+                                          or prefix, with output_file as their index
+                                          (implies streaming mode)
     
     Returns:
         dict: Statistics about the filtering process
     """
     
-    # Check if input file exists
-    if not os.path.exists(input_file):
-        raise FileNotFoundError(f"Input file '{input_file}' not found")
-    
-    # Check file size to determine processing method
-    file_size = os.path.getsize(input_file)
-    file_size_mb = file_size / (1024 * 1024)
+    remote = is_url(input_file)
+    if remote:
+        log(f"Fetching M3U playlist: {redact_url(input_file)}")
+    elif is_stdio(input_file):
+        log("Reading M3U playlist from stdin")
+    else:
+        # Check if input file exists
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Input file '{input_file}' not found")
+        
+        # Check file size to determine processing method
+        file_size = os.path.getsize(input_file)
+        file_size_mb = file_size / (1024 * 1024)
+        
+        log(f"Reading M3U file: {input_file}")
+        log(f"File size: {file_size_mb:.1f} MB")
     
-    print(f"Reading M3U file: {input_file}")
-    print(f"File size: {file_size_mb:.1f} MB")
+    # Pipes and compressed files can only be read and written front to back
+    sequential = (is_stdio(input_file) or is_stdio(output_file) or output_compression(output_file) is not None
+                  or (not remote and input_compression(input_file) is not None))
     
     # Auto-detect if streaming should be used for large files
-    if file_size_mb > 1:  # Files larger than 100MB
+    if remote:
+        use_streaming = True
+        log("Using streaming mode (entries are filtered while the playlist downloads)")
+    elif sequential:
+        use_streaming, use_mmap, jobs, use_index = True, False, 1, False
+        log("Using streaming mode (pipe or compressed input/output)")
+    elif shards is not None:
+        use_streaming, use_mmap, jobs, use_index = True, False, 1, False
+        log(f"Using streaming mode (one playlist per {shards.shard_by} in {shards.shard_dir})")
+    elif use_index:
+        log("Using index mode (verdicts from the index, kept entries copied verbatim)")
+    elif use_mmap:
+        log("Using mmap mode (bytes-level scan, kept entries copied verbatim)")
+    elif file_size_mb > STREAMING_THRESHOLD_MB:
         use_streaming = True
-        print("Large file detected - using streaming mode for memory efficiency")
+        log("Large file detected - using streaming mode for memory efficiency")
     elif not use_streaming:
-        print("Using standard mode (loads file into memory)")
+        log("Using standard mode (batch engine, loads file into memory)")
     else:
-        print("Using streaming mode")
+        log("Using streaming mode")
     
     # Load allowed groups if specified
     allowed_groups = None
     if groups_filter_file:
         allowed_groups = load_allowed_groups(groups_filter_file)
         if allowed_groups is not None:
-            print(f"Group filter loaded: {len(allowed_groups)} allowed groups")
+            log(f"Group filter loaded: {allowed_groups.summary()}")
+    
+    fetch = None
+    if remote:
+        fetch = PlaylistFetch(input_file, output_file, filter_config_key(groups_filter_file))
+        # Without the previous output a 304 would leave nothing to serve, so only ask conditionally if it exists
+        if not fetch.open(conditional=not is_stdio(output_file) and os.path.exists(output_file)):
+            log(f"Playlist not modified since the last fetch, {output_file} is up to date")
+            stats = new_stats()
+            stats['not_modified'] = True
+            return stats
     
-    if use_streaming:
+    if state_file:
+        log(f"Using incremental streaming mode with state file: {state_file}")
+        state = FilterState.load(state_file, filter_config_key(groups_filter_file))
+        stats = filter_live_channels_streaming(input_file, output_file, allowed_groups, state, fetch, shards)
+        delta = state.delta()
+        stats['reused_entries'] = state.reused
+        for change in ('added', 'removed', 'changed'):
+            stats[f'{change}_entries'] = len(delta[change])
+        delta_file = f"{os.path.splitext(state_file)[0] if is_stdio(output_file) else output_file}.delta.json"
+        write_stats_json(delta, delta_file)
+        state.save(state_file)
+        log(f"Delta since previous run: {len(delta['added']):,} added, {len(delta['removed']):,} removed, "
+            f"{len(delta['changed']):,} changed ({state.reused:,} entries reused)")
+        log(f"Delta report written to: {delta_file}")
+        return stats
+    elif fetch is not None or shards is not None:
+        return filter_live_channels_streaming(input_file, output_file, allowed_groups, fetch=fetch, shards=shards)
+    elif use_index:
+        return filter_live_channels_indexed(input_file, output_file, allowed_groups)
+    elif jobs > 1 and (use_streaming or use_mmap):
+        return filter_live_channels_parallel(input_file, output_file, allowed_groups, jobs, raw=use_mmap)
+    elif use_mmap:
+        return filter_live_channels_mmap(input_file, output_file, allowed_groups)
+    elif use_streaming:
         return filter_live_channels_streaming(input_file, output_file, allowed_groups)
     else:
-        return filter_live_channels_standard(input_file, output_file, allowed_groups)
+        return filter_live_channels_batch(input_file, output_file, allowed_groups)
 
 
 def load_allowed_groups(groups_file):
     """
     Load allowed group titles from a file.
     
+    Each line is a group title and '#' starts a comment; after a '#!patterns'
+    line, lines are patterns ('USA Local - *', 're:^UK\\b') and '!' in front
+    excludes (see group_filter).
+    
     Args:
         groups_file (str): Path to file containing group titles (one per line)
     
     Returns:
-        set: Set of allowed group titles, or None if file cannot be loaded
+        GroupFilter: Compiled filter of the allowed group titles, or None if file cannot be loaded
     """
     try:
         with open(groups_file, 'r', encoding='utf-8') as f:
-            groups = set()
-            for line in f:
-                line = line.strip()
-                # Skip comments and empty lines
-                if line and not line.startswith('#'):
-                    groups.add(line)
-            return groups
+            return GroupFilter.from_lines(f)
     except FileNotFoundError:
         print(f"❌ Groups filter file not found: {groups_file}")
         return None
@@ -98,285 +312,1424 @@ def load_allowed_groups(groups_file):
         return None
 
 
-def filter_live_channels_streaming(input_file, output_file, allowed_groups=None):
-    """Streaming version for large files."""
-    print("Processing entries (streaming mode)...")
+def filter_live_channels_streaming(input_file, output_file, allowed_groups=None, state=None, fetch=None, shards=None):
+    """
+    Streaming version for large files.
     
-    # Initialize counters
-    stats = {
-        'total_entries': 0,
-        'live_channels': 0,
-        'series_filtered': 0,
-        'movies_filtered': 0,
-        'other_filtered': 0,
-        'group_filtered': 0
-    }
+    With a FilterState, entries whose EXTINF line and URL are unchanged since
+    the previous run reuse the stored verdict and rendering. With an opened
+    PlaylistFetch, the lines are read from the HTTP response as it arrives and
+    the previous output is only replaced once the download is complete.
+    With a ShardedOutput, the kept entries go to the shards in the same pass
+    and output_file becomes the index playlist of the shards.
     
-    # Process the file line by line and write output simultaneously
-    with open(input_file, 'r', encoding='utf-8') as infile, \
-         open(output_file, 'w', encoding='utf-8') as outfile:
-        
-        # Write M3U header
-        outfile.write("#EXTM3U\n")
-        
-        # State tracking for line-by-line processing
-        current_extinf = None
-        line_count = 0
+    Either file may be '-' for stdin/stdout; compressed input is decompressed
+    and the output compressed according to its extension, both on the fly.
+    """
+    log("Processing entries (streaming mode)...")
+    
+    stats = new_stats()
+    classifier = EntryClassifier(allowed_groups)
+    reporter = ProgressReporter()
+    
+    infile = fetch.body if fetch is not None else open_playlist_input(input_file)
+    replace_output = (fetch is not None or shards is not None) and not is_stdio(output_file)
+    target_file = f"{output_file}.part" if replace_output else output_file
+    
+    try:
+        if shards is not None:
+            with infile, shards:
+                filter_entries_lines(infile, None, classifier, stats, reporter, state, shards)
+                if fetch is not None:
+                    fetch.check_complete()
+            with open_playlist_output(target_file, output_file) as outfile:
+                shards.write_index(outfile, output_file)
+            stats['shards'] = len(shards.counts)
+            stats['shard_files_opened'] = shards.opened
+        else:
+            # Process the file line by line and write output simultaneously
+            with infile, open_playlist_output(target_file, output_file) as outfile:
+                
+                # Write M3U header
+                outfile.write("#EXTM3U\n")
+                filter_entries_lines(infile, outfile, classifier, stats, reporter, state)
+                if fetch is not None:
+                    fetch.check_complete()
+    except BaseException:
+        # A failed download or run leaves the previous output in place
+        if replace_output and os.path.exists(target_file):
+            os.remove(target_file)
+        raise
+    
+    if replace_output:
+        os.replace(target_file, output_file)
+    if fetch is not None and not is_stdio(output_file):
+        fetch.commit()
+    
+    log(f"\nFiltered playlist written to: {output_file}")
+    return reporter.finish(stats)
+
+
+class ShardedOutput:
+    """
+    Kept entries written to one playlist per group title (or group prefix).
+    
+    Entries are collected per shard and written in rounds of
+    SHARD_BUFFER_ENTRIES, so a round opens each of its shards at most once
+    even when the groups are interleaved. Shard files are kept in an LRU pool
+    of at most max_open files; a shard pushed out of the pool is reopened for
+    appending in a later round, so thousands of groups need no more file
+    handles than that.
+    
+    Shards are written to a temporary directory inside shard_dir and only
+    moved into place when the run succeeds; a failed run leaves the previous
+    shards as they were. Of the files already in shard_dir, only the shards
+    listed in the SHARD_MANIFEST of the previous run are removed, once their
+    group is gone.
+    """
+    
+    def __init__(self, shard_dir, shard_by='group', compression=None, max_open=MAX_OPEN_SHARDS):
+        """
+        Args:
+            shard_dir (str): Directory of the shard playlists, created if missing
+            shard_by (str): 'group' for one shard per group title, 'prefix' per group prefix
+            compression (str, optional): Extension ('.gz', '.bz2', '.xz') of compressed
+                                         copies written next to the shards
+            max_open (int): Shard files kept open at once
+        """
+        if shard_by not in SHARD_KINDS:
+            raise ValueError(f"Unknown shard kind '{shard_by}', expected one of {', '.join(SHARD_KINDS)}")
+        self.shard_dir = shard_dir
+        self.shard_by = shard_by
+        self.compression = compression
+        self.max_open = max(1, max_open)
+        self.handles = collections.OrderedDict()
+        self.pending = {}
+        self.buffered = 0
+        # Shard key -> file name and entry count, in order of first appearance
+        self.files = {}
+        self.counts = {}
+        # File names given out, in lower case for case-insensitive file systems
+        self.taken = set()
+        self.opened = 0
+        self.temp_dir = None
+    
+    def __enter__(self):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.temp_dir = tempfile.mkdtemp(prefix='.part-', dir=self.shard_dir)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+    
+    def file_name(self, key):
+        """Return a file name for a new shard key, unique within this run."""
+        name = re.sub(r'[^\w.-]+', '_', key).strip('._')[:80] or UNGROUPED_SHARD
+        if f"{name}.m3u".lower() in self.taken:
+            # Titles that only differ in punctuation or case would share a name
+            name = f"{name}-{hashlib.blake2b(key.encode('utf-8'), digest_size=4).hexdigest()}"
+        return f"{name}.m3u"
+    
+    def write(self, group, text):
+        """Append the rendered entry text to the shard of group."""
+        key = group_prefix(group) if self.shard_by == 'prefix' else group
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = []
+        pending.append(text)
+        self.buffered += 1
+        if self.buffered >= SHARD_BUFFER_ENTRIES:
+            self.flush()
+    
+    def flush(self):
+        """Write the collected entries of every shard."""
+        for key, pending in self.pending.items():
+            handle = self.handles.get(key)
+            if handle is None:
+                handle = self.open(key)
+            else:
+                self.handles.move_to_end(key)
+            handle.write(''.join(pending))
+            self.counts[key] += len(pending)
+        self.pending.clear()
+        self.buffered = 0
+    
+    def open(self, key):
+        if len(self.handles) >= self.max_open:
+            self.handles.popitem(last=False)[1].close()
+        name = self.files.get(key)
+        if name is None:
+            name = self.files[key] = self.file_name(key)
+            self.taken.add(name.lower())
+            self.counts[key] = 0
+            handle = open(os.path.join(self.temp_dir, name), 'w', encoding='utf-8')
+            handle.write("#EXTM3U\n")
+        else:
+            handle = open(os.path.join(self.temp_dir, name), 'a', encoding='utf-8')
+        self.opened += 1
+        self.handles[key] = handle
+        return handle
+    
+    def close(self):
+        """
+        Close the open shards, write the compressed copies, move the shards
+        into shard_dir and remove the shards of the previous run whose group is gone.
+        """
+        self.flush()
+        while self.handles:
+            self.handles.popitem(last=False)[1].close()
+        names = set(self.files.values())
+        if self.compression:
+            for name in names:
+                self.compress(name)
+            names |= {name + self.compression for name in names}
+        for name in names:
+            os.replace(os.path.join(self.temp_dir, name), os.path.join(self.shard_dir, name))
+        os.rmdir(self.temp_dir)
+        self.temp_dir = None
         
-        for line_num, line in enumerate(infile, 1):
+        manifest_file = os.path.join(self.shard_dir, SHARD_MANIFEST)
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                previous = set(json.load(f))
+        except (OSError, ValueError, TypeError):
+            previous = set()
+        temp_file = f"{manifest_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(sorted(names), f)
+        os.replace(temp_file, manifest_file)
+        for name in previous - names:
+            # Only plain names of this directory: the manifest is not trusted with paths
+            if isinstance(name, str) and os.path.basename(name) == name and name.endswith(SHARD_FILE_EXTENSIONS):
+                try:
+                    os.remove(os.path.join(self.shard_dir, name))
+                except FileNotFoundError:
+                    pass
+    
+    def discard(self):
+        """Close the open shards and drop what this run wrote, keeping the previous shards."""
+        while self.handles:
+            self.handles.popitem(last=False)[1].close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+    
+    def compress(self, name):
+        path = os.path.join(self.temp_dir, name)
+        target = path + self.compression
+        module = COMPRESSION_EXTENSIONS[self.compression]
+        # Shards are small, so each is compressed in one call
+        with open(path, 'rb') as infile:
+            data = infile.read()
+        with open(target, 'wb') as outfile:
+            outfile.write(gzip.compress(data, compresslevel=6, mtime=0) if module is gzip else module.compress(data))
+    
+    def write_index(self, outfile, output_file):
+        """
+        Write the index playlist: one entry per shard, titled with its group
+        (or prefix) and pointing at the shard file relative to output_file
+        (by absolute path when the index goes to stdout).
+        """
+        shard_dir = os.path.abspath(self.shard_dir)
+        if not is_stdio(output_file):
+            shard_dir = os.path.relpath(shard_dir, os.path.dirname(os.path.abspath(output_file)))
+        shard_dir = shard_dir.replace(os.sep, '/')
+        with M3UWriter(outfile) as writer:
+            outfile.write("#EXTM3U\n")
+            for key, name in self.files.items():
+                writer.write_entry(Entry(key or UNGROUPED_SHARD, f"{shard_dir}/{name}", key,
+                                         attrs={'x-entries': str(self.counts[key])}))
+
+
+def is_stdio(path):
+    """Return True if path stands for stdin or stdout."""
+    return path == '-'
+
+
+def detect_compression(head):
+    """Return the compression module matching the first bytes of a file, or None."""
+    for magic, module in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def input_compression(input_file):
+    """Return the compression module of a local input file, or None if it is plain."""
+    if is_stdio(input_file):
+        return None
+    with open(input_file, 'rb') as f:
+        return detect_compression(f.read(6))
+
+
+def output_compression(output_file):
+    """Return the compression module implied by the extension of output_file, or None."""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(output_file)[1].lower())
+
+
+class PrefixedReader(io.RawIOBase):
+    """Read-only raw stream giving back bytes already read from a stream, then the rest of it."""
+    
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if not self._head:
+            return self._stream.readinto(buffer)
+        count = min(len(buffer), len(self._head))
+        buffer[:count] = self._head[:count]
+        self._head = self._head[count:]
+        return count
+
+
+def open_sniffed(stream):
+    """
+    Return a binary stream that can only be read once (a pipe, an HTTP response) as
+    bytes, decompressed when its first bytes are gzip, bz2 or xz magic.
+    """
+    # read() waits for all 6 bytes (a pipe may deliver fewer at a time); they are then handed back
+    head = stream.read(6)
+    stream = io.BufferedReader(PrefixedReader(head, stream))
+    module = detect_compression(head)
+    return module.open(stream, 'rb') if module else stream
+
+
+def open_playlist_binary(input_file):
+    """
+    Open a playlist for reading as bytes.
+    
+    Args:
+        input_file (str): Path to the playlist, or '-' for stdin; gzip, bz2 and xz
+                          content is recognised by its magic bytes and decompressed
+    
+    Returns:
+        Binary file object
+    """
+    if is_stdio(input_file):
+        return open_sniffed(open(sys.stdin.fileno(), 'rb', closefd=False))
+    module = input_compression(input_file)
+    return module.open(input_file, 'rb') if module else open(input_file, 'rb')
+
+
+def open_playlist_input(input_file):
+    """Open a playlist for reading as text (see open_playlist_binary)."""
+    return io.TextIOWrapper(open_playlist_binary(input_file), encoding='utf-8')
+
+
+def open_playlist_output(output_file, name=None):
+    """
+    Open a playlist for writing as text.
+    
+    Args:
+        output_file (str): Path to write, or '-' for stdout
+        name (str, optional): Name whose extension (.gz, .bz2, .xz) selects the
+                              compression, when writing to a temporary path
+    
+    Returns:
+        Text file object
+    """
+    if is_stdio(output_file):
+        # sys.stdout may point to stderr so that status output stays out of the pipe
+        return open(sys.__stdout__.fileno(), 'w', encoding='utf-8', closefd=False)
+    module = output_compression(name or output_file)
+    if module is gzip:
+        # Same default level as the gzip command line tool
+        return gzip.open(output_file, 'wt', compresslevel=6, encoding='utf-8')
+    if module:
+        return module.open(output_file, 'wt', encoding='utf-8')
+    return open(output_file, 'w', encoding='utf-8')
+
+
+def read_playlist_entries(input_file):
+    """
+    Read the entries of a playlist, with the directive lines that belong to each.
+    
+    Same entry rules as streaming mode; lines between an EXTINF line and its
+    URL (#EXTVLCOPT, #EXTGRP, ...) are kept with the entry so it can be written
+    back unchanged.
+    
+    Args:
+        input_file (str): Path to the playlist, or '-' for stdin (may be compressed)
+    
+    Yields:
+        tuple: (extinf_line, directives, url) - the stripped EXTINF line and URL, and the
+               directive lines in between, each followed by a newline ('' if none)
+    """
+    current_extinf = None
+    directives = []
+    with open_playlist_input(input_file) as infile:
+        for line in infile:
             line = line.strip()
-            line_count += 1
-            
-            # Progress indicator for large files
-            if line_count % 10000 == 0:
-                print(f"  Processed {line_count:,} lines...")
-            
-            # Skip empty lines and non-EXTINF comments
-            if not line or (line.startswith('#') and not line.startswith('#EXTINF')):
+            if not line:
                 continue
+            if line[0] == '#':
+                if line.startswith('#EXTINF'):
+                    current_extinf = line
+                    directives = []
+                elif current_extinf and not line.startswith('#EXTM3U'):
+                    directives.append(line + '\n')
+            elif current_extinf:
+                yield current_extinf, ''.join(directives), line
+                current_extinf = None
+
+
+def is_url(path):
+    """Return True if path is an http(s) URL rather than a local file."""
+    return path.startswith(('http://', 'https://'))
+
+
+def redact_url(url):
+    """Return url with its credentials masked, for logging."""
+    parts = urllib.parse.urlsplit(url)
+    netloc = parts.netloc
+    if '@' in netloc:
+        netloc = '***@' + netloc.rpartition('@')[2]
+    query = urllib.parse.urlencode(
+        [(key, '***' if key.lower() in SENSITIVE_QUERY_PARAMS else value)
+         for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)],
+        safe='*')
+    return urllib.parse.urlunsplit((parts.scheme, netloc, parts.path, query, ''))
+
+
+class PlaylistFetch:
+    """
+    Conditional GET of a remote playlist.
+    
+    The validators (ETag, Last-Modified) of the last complete run are kept in
+    <output_file>.fetch.json with a hash of the URL and of the filter
+    configuration, so a 304 reply means the existing output is still current.
+    The response body may be gzip-encoded and is decoded while it streams.
+    """
+    
+    def __init__(self, url, output_file, config_key):
+        self.url = url
+        self.meta_file = f"{output_file}.fetch.json"
+        # The URL carries the credentials, so only its hash is stored
+        self.key = hashlib.blake2b(f"{url}\0{config_key}".encode('utf-8'), digest_size=16).hexdigest()
+        self.response = None
+        self.body = None
+        self.validators = {}
+    
+    def load_validators(self):
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return meta if meta.get('key') == self.key else {}
+    
+    def open(self, conditional=True):
+        """
+        Send the request and open the response body as text.
+        
+        Returns:
+            bool: False if the server replied 304 Not Modified, True otherwise
+        """
+        headers = {'User-Agent': FETCH_USER_AGENT, 'Accept-Encoding': 'gzip'}
+        if conditional:
+            previous = self.load_validators()
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+        
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(self.url, headers=headers), timeout=FETCH_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                e.close()
+                return False
+            raise
+        
+        self.response = response
+        self.validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        body = response
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=response)
+        self.body = io.TextIOWrapper(body, encoding='utf-8')
+        log(f"Response: HTTP {response.status}, content encoding: {response.headers.get('Content-Encoding', 'identity')}", VERBOSE)
+        return True
+    
+    def check_complete(self):
+        """Raise http.client.IncompleteRead if the connection closed before the announced Content-Length."""
+        # urllib ends a cut short body like a complete one; length is what was announced but not received
+        if self.response.length:
+            raise http.client.IncompleteRead(b'', self.response.length)
+    
+    def commit(self):
+        """Store the validators once the response has been fully processed."""
+        meta = dict(self.validators, key=self.key)
+        temp_file = f"{self.meta_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(temp_file, self.meta_file)
+
+
+def filter_entries_lines(lines, outfile, classifier, stats, reporter, state=None, shards=None):
+    """
+    Filter the entries of an iterable of playlist lines and write the kept ones.
+    
+    Args:
+        lines: Iterable of text lines (e.g. a file opened in text mode)
+        outfile: Text file handle for writing (unused with shards)
+        classifier (EntryClassifier): Classifier to apply
+        stats (dict): Statistics updated in place
+        reporter (ProgressReporter): Receives the stage timings
+        state (FilterState, optional): Verdicts of the previous run, updated in place
+        shards (ShardedOutput, optional): Receives the kept entries instead of outfile
+    """
+    verbose = VERBOSITY >= VERBOSE
+    clock = time.perf_counter
+    read_time = parse_time = classify_time = write_time = 0.0
+    
+    # State tracking for line-by-line processing; the EXTINF line is only
+    # parsed once its URL is known (and not at all when the state has it)
+    current_extinf = None
+    writer = M3UWriter(outfile) if shards is None else None
+    
+    started = clock()
+    for line in lines:
+        line = line.strip()
+        
+        # Skip empty lines and non-EXTINF comments
+        if not line or (line.startswith('#') and not line.startswith('#EXTINF')):
+            continue
+        
+        # Remember EXTINF line
+        if line.startswith('#EXTINF'):
+            current_extinf = line
+            continue
+        
+        # This should be a URL line following an EXTINF
+        if current_extinf and not line.startswith('#'):
+            parsing = clock()
+            read_time += parsing - started
+            url = line
+            stats['total_entries'] += 1
             
-            # Parse EXTINF line
-            if line.startswith('#EXTINF'):
-                current_extinf = parse_extinf_line_streaming(line)
-                continue
+            previous = None
+            if state is not None:
+                fingerprint = state.fingerprint(current_extinf)
+                previous = state.lookup(url, fingerprint)
             
-            # This should be a URL line following an EXTINF
-            if current_extinf and not line.startswith('#'):
-                url = line
-                stats['total_entries'] += 1
+            if previous is not None:
+                # Unchanged since the previous run: reuse its verdict and rendering
+                name, filter_reason, extinf_line = previous
+                should_keep = not filter_reason
+                group = None
+                classifying = writing = clock()
+            else:
+                channel = parse_extinf_line_streaming(current_extinf, url)
+                name = channel.name
+                group = channel.group
+                classifying = clock()
+                parse_time += classifying - parsing
                 
                 # Apply filtering logic
-                should_keep, filter_reason = should_keep_entry(
-                    current_extinf['name'], url, current_extinf['category'], allowed_groups
-                )
-                
-                if should_keep:
-                    stats['live_channels'] += 1
-                    # Write the entry to output file immediately
-                    write_extinf_line(outfile, current_extinf)
-                    outfile.write(f"{url}\n")
-                    print(f"✓ Keeping: {current_extinf['name'][:60]}{'...' if len(current_extinf['name']) > 60 else ''}")
+                should_keep, filter_reason = classifier.classify(name, url, channel.group)
+                writing = clock()
+                classify_time += writing - classifying
+                extinf_line = render_extinf_line(channel) if should_keep else None
+                if state is not None:
+                    state.record(url, fingerprint, name, filter_reason, extinf_line)
+            
+            if should_keep:
+                stats['live_channels'] += 1
+                if shards is None:
+                    writer.write_rendered(extinf_line + url + '\n')
                 else:
-                    if filter_reason == "series":
-                        stats['series_filtered'] += 1
-                    elif filter_reason == "movie":
-                        stats['movies_filtered'] += 1
-                    elif filter_reason == "group_not_allowed":
-                        stats['group_filtered'] += 1
-                    else:
-                        stats['other_filtered'] += 1
-                    print(f"✗ Filtered ({filter_reason}): {current_extinf['name'][:60]}{'...' if len(current_extinf['name']) > 60 else ''}")
-                
-                # Reset for next entry
+                    # A reused rendering carries the group title in its attributes
+                    shards.write(split_extinf_line(extinf_line)[0] if group is None else group, extinf_line + url + '\n')
+            else:
+                stats[FILTER_REASON_STATS.get(filter_reason, 'other_filtered')] += 1
+            if verbose:
+                log_entry(name, should_keep, filter_reason)
+            
+            # Reset for next entry
+            current_extinf = None
+            reporter.tick(stats['total_entries'])
+            started = clock()
+            write_time += started - writing
+    read_time += clock() - started
+    writing = clock()
+    if writer is not None:
+        writer.flush()
+    write_time += clock() - writing
+    
+    for stage, seconds in zip(STAGES, (read_time, parse_time, classify_time, write_time)):
+        reporter.add_time(stage, seconds)
+
+
+class FilterState:
+    """
+    Per-entry fingerprints and verdicts persisted between filtering runs.
+    
+    Entries are keyed by URL; the fingerprint is a hash of the raw EXTINF
+    line. The stored verdicts are only reused when the configuration key
+    (classification rules and group filter) is the same as in the run that
+    wrote them.
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, config_key):
+        self.config_key = config_key
+        # url -> [fingerprint, name, filter_reason, rendered EXTINF line or None]
+        self.previous = {}
+        self.current = {}
+        self.reused = 0
+    
+    @classmethod
+    def load(cls, state_file, config_key):
+        """Load the state of the previous run; an unusable file yields an empty state."""
+        state = cls(config_key)
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return state
+        except (OSError, ValueError) as e:
+            log(f"⚠️  Ignoring unreadable state file {state_file}: {e}")
+            return state
+        if data.get('version') == cls.VERSION and data.get('config_key') == config_key:
+            state.previous = data.get('entries', {})
+        else:
+            # Verdicts are stale, but fingerprints still give a meaningful delta report
+            state.previous = {url: [entry[0], entry[1], None, None] for url, entry in data.get('entries', {}).items()}
+        return state
+    
+    @staticmethod
+    def fingerprint(extinf_line):
+        return hashlib.blake2b(extinf_line.encode('utf-8'), digest_size=8).hexdigest()
+    
+    def lookup(self, url, fingerprint):
+        """Return (name, filter_reason, extinf_line) of an unchanged entry, or None."""
+        entry = self.previous.get(url)
+        if entry is None or entry[0] != fingerprint or entry[2] is None:
+            return None
+        self.current[url] = entry
+        self.reused += 1
+        return entry[1], entry[2], entry[3]
+    
+    def record(self, url, fingerprint, name, filter_reason, extinf_line):
+        self.current[url] = [fingerprint, name, filter_reason, extinf_line]
+    
+    def delta(self):
+        """Return the entries added, removed and changed since the previous run."""
+        added, removed, changed = [], [], []
+        for url, entry in self.current.items():
+            previous = self.previous.get(url)
+            if previous is None:
+                added.append({'name': entry[1], 'url': url, 'kept': not entry[2]})
+            elif previous[0] != entry[0]:
+                changed.append({'name': entry[1], 'previous_name': previous[1], 'url': url, 'kept': not entry[2]})
+        for url, entry in self.previous.items():
+            if url not in self.current:
+                removed.append({'name': entry[1], 'url': url})
+        return {'added': added, 'removed': removed, 'changed': changed}
+    
+    def save(self, state_file):
+        """Write the state of this run atomically."""
+        data = {'version': self.VERSION, 'config_key': self.config_key, 'entries': self.current}
+        temp_file = f"{state_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, state_file)
+
+
+def filter_config_key(groups_filter_file):
+    """Return a key identifying the classification rules, rendering and group filter of a run."""
+    digest = hashlib.blake2b(f"rules-{CLASSIFIER_RULES_VERSION}-render-{RENDER_VERSION}".encode('utf-8'), digest_size=16)
+    if groups_filter_file:
+        try:
+            with open(groups_filter_file, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b'unreadable')
+    return digest.hexdigest()
+
+
+class FileRangeReader(io.RawIOBase):
+    """Read-only raw stream over the byte range [start, end) of a file."""
+    
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        count = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= count
+        return count
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def split_on_entries(input_file, jobs):
+    """
+    Split a playlist into byte ranges that start on an #EXTINF line.
+    
+    Args:
+        input_file (str): Path to input M3U file
+        jobs (int): Number of ranges wanted
+    
+    Returns:
+        list: (start, end) byte ranges covering the whole file, in order
+    """
+    size = os.path.getsize(input_file)
+    bounds = [0]
+    if size > 0:
+        with open(input_file, 'rb') as infile, \
+             mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for part in range(1, jobs):
+                offset = max(size * part // jobs, bounds[-1])
+                boundary = data.find(b'\n#EXTINF', offset)
+                if boundary < 0:
+                    break
+                if boundary + 1 > bounds[-1]:
+                    bounds.append(boundary + 1)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def filter_chunk(input_file, start, end, chunk_file, allowed_groups, raw):
+    """
+    Worker for --jobs: filter one byte range of the input into chunk_file.
+    
+    Args:
+        raw (bool): Copy kept entries verbatim (mmap engine) instead of re-rendering them
+    
+    Returns:
+        dict: Statistics for the range
+    """
+    global VERBOSITY
+    VERBOSITY = QUIET
+    
+    stats = new_stats()
+    classifier = EntryClassifier(allowed_groups)
+    reporter = ProgressReporter()
+    if raw:
+        with open(input_file, 'rb') as infile, open(chunk_file, 'wb') as outfile, \
+             mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            filter_entries_bytes(data, start, end, outfile, classifier, stats, reporter)
+    else:
+        # Same decoding and newline handling as open(input_file, 'r', encoding='utf-8')
+        with io.TextIOWrapper(io.BufferedReader(FileRangeReader(input_file, start, end)), encoding='utf-8') as infile, \
+             open(chunk_file, 'w', encoding='utf-8') as outfile:
+            filter_entries_lines(infile, outfile, classifier, stats, reporter)
+    return reporter.finish(stats)
+
+
+def merge_stats(total, part):
+    """Add the counters and stage timings of part into total."""
+    for key, value in part.items():
+        if key == 'timings':
+            timings = total.setdefault('timings', {})
+            for stage, seconds in value.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        elif key in ('elapsed_seconds', 'entries_per_second'):
+            continue
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def filter_live_channels_parallel(input_file, output_file, allowed_groups=None, jobs=2, raw=False):
+    """
+    Multi-process version: the input is split into ranges aligned on #EXTINF
+    lines, each range is filtered by a worker process into a temporary file,
+    and the temporary files are concatenated in input order. The output is
+    byte-identical to the single-process streaming (or, with raw, mmap) mode.
+    
+    Stage timings are summed over the workers (CPU seconds), while the elapsed
+    time and throughput are wall-clock figures.
+    """
+    ranges = split_on_entries(input_file, jobs)
+    log(f"Processing entries ({len(ranges)} chunks on {jobs} worker processes)...")
+    
+    reporter = ProgressReporter()
+    stats = new_stats()
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    chunk_files = []
+    try:
+        for _ in ranges:
+            fd, chunk_file = tempfile.mkstemp(prefix='.filter-chunk-', suffix='.m3u', dir=output_dir)
+            os.close(fd)
+            chunk_files.append(chunk_file)
+        
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(filter_chunk, input_file, start, end, chunk_file, allowed_groups, raw)
+                for (start, end), chunk_file in zip(ranges, chunk_files)
+            ]
+            with open(output_file, 'w', encoding='utf-8') as outfile:
+                outfile.write("#EXTM3U\n")
+                outfile.flush()
+                for number, (future, chunk_file) in enumerate(zip(futures, chunk_files), 1):
+                    merge_stats(stats, future.result())
+                    log(f"  Chunk {number}/{len(ranges)} done ({stats['total_entries']:,} entries so far)")
+                    with open(chunk_file, 'rb') as chunk:
+                        shutil.copyfileobj(chunk, outfile.buffer)
+    finally:
+        for chunk_file in chunk_files:
+            if os.path.exists(chunk_file):
+                os.remove(chunk_file)
+    
+    timings = stats.pop('timings', {})
+    for stage, seconds in timings.items():
+        reporter.add_time(stage, seconds)
+    log(f"\nFiltered playlist written to: {output_file}")
+    return reporter.finish(stats)
+
+
+# Reason codes of the batch engine; 0 keeps the entry
+BATCH_REASONS = ("", "group_not_allowed", "series", "movie", "other VOD")
+
+
+class PlaylistColumns:
+    """
+    A playlist held as columns: row i of every list is entry i.
+    
+    Only what classification needs is extracted while loading (title,
+    interned group title, URL); the raw EXTINF line is kept so that the
+    remaining attributes are only parsed for the entries that are written.
+    """
+    
+    def __init__(self):
+        self.extinf = []
+        self.names = []
+        self.groups = []
+        self.urls = []
+    
+    def __len__(self):
+        return len(self.urls)
+    
+    @classmethod
+    def load(cls, lines):
+        """Build the columns from an iterable of playlist lines (same entry rules as streaming mode)."""
+        columns = cls()
+        extinf, names, groups, urls = columns.extinf, columns.names, columns.groups, columns.urls
+        split = split_extinf_line
+        intern = sys.intern
+        current_extinf = None
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] == '#':
+                if line.startswith('#EXTINF'):
+                    current_extinf = line
+            elif current_extinf:
+                group, title = split(current_extinf)
+                groups.append(intern(group))
+                extinf.append(current_extinf)
+                names.append(title)
+                urls.append(line)
                 current_extinf = None
+        return columns
     
-    print(f"\nFiltered playlist written to: {output_file}")
-    return stats
+    def factorize_groups(self):
+        """Return (group id of every row, distinct group titles by id)."""
+        ids = {}
+        codes = [ids.setdefault(group, len(ids)) for group in self.groups]
+        return codes, list(ids)
 
 
-def filter_live_channels_standard(input_file, output_file, allowed_groups=None):
-    """Standard version using m3u_parser library (for smaller files)."""
-    parser = m3u_parser.M3uParser()
-    parser.parse_m3u(input_file)
+def rows_matching(pattern, values):
+    """
+    Find the rows of a string column matching a compiled pattern.
     
-    # Get the playlist as a list
-    playlist = parser.get_list()
+    The column is joined with NUL separators and searched in a single regex
+    pass; match offsets are then mapped back to row numbers.
     
-    # Initialize counters
-    stats = {
-        'total_entries': len(playlist),
-        'live_channels': 0,
-        'series_filtered': 0,
-        'movies_filtered': 0,
-        'other_filtered': 0,
-        'group_filtered': 0
-    }
+    Returns:
+        Boolean column (numpy array, or bytearray without numpy)
+    """
+    count = len(values)
+    joined = '\x00'.join(values)
+    starts = [match.start() for match in pattern.finditer(joined)]
+    if numpy is not None:
+        ends = numpy.cumsum(numpy.fromiter(map(len, values), dtype=numpy.int64, count=count) + 1)
+        flags = numpy.zeros(count, dtype=bool)
+        flags[numpy.searchsorted(ends, numpy.asarray(starts, dtype=numpy.int64), side='right')] = True
+        return flags
+    flags = bytearray(count)
+    if starts:
+        ends = list(itertools.accumulate(len(value) + 1 for value in values))
+        for start in starts:
+            flags[bisect.bisect_right(ends, start)] = 1
+    return flags
+
+
+def classify_columns(columns, allowed_groups=None):
+    """
+    Classify every row of a PlaylistColumns with whole-column operations.
+    
+    Category rules run once per distinct group (EntryClassifier), title and URL
+    rules as one regex pass per column, and the verdicts are combined with the
+    same precedence as EntryClassifier.classify (group, series, movie, other VOD).
+    
+    Returns:
+        Reason code of every row, as indices into BATCH_REASONS (numpy array or bytearray)
+    """
+    if not len(columns):
+        return numpy.zeros(0, dtype=numpy.uint8) if numpy is not None else bytearray()
+    codes, groups = columns.factorize_groups()
+    classifier = EntryClassifier(allowed_groups)
+    verdicts = [classifier.classify_category(group) for group in groups]
+    
+    title_series = rows_matching(SERIES_TITLE_PATTERN, [name.upper() for name in columns.names])
+    title_year = rows_matching(MOVIE_YEAR_PATTERN, columns.names)
+    url_series = rows_matching(SERIES_URL_PATTERN, columns.urls)
+    url_movie = rows_matching(MOVIE_URL_PATTERN, columns.urls)
+    
+    if numpy is not None:
+        allowed, series, movie, other_vod = numpy.array(verdicts, dtype=bool)[numpy.asarray(codes, dtype=numpy.intp)].T
+        return numpy.select(
+            [~allowed, series | url_series | title_series, movie | url_movie | title_year, other_vod],
+            [1, 2, 3, 4], 0).astype(numpy.uint8)
+    
+    reasons = bytearray(len(codes))
+    for row, code in enumerate(codes):
+        allowed, series, movie, other_vod = verdicts[code]
+        if not allowed:
+            reasons[row] = 1
+        elif series or url_series[row] or title_series[row]:
+            reasons[row] = 2
+        elif movie or url_movie[row] or title_year[row]:
+            reasons[row] = 3
+        elif other_vod:
+            reasons[row] = 4
+    return reasons
+
+
+def filter_live_channels_batch(input_file, output_file, allowed_groups=None):
+    """
+    Batch version for files that fit in memory.
+    
+    The playlist is loaded into columns, classified with whole-column
+    operations (vectorized with NumPy when it is installed) and the kept rows
+    are rendered and written in large batches. The output is the same as in
+    streaming mode.
+    """
+    reporter = ProgressReporter()
+    clock = time.perf_counter
+    
+    started = clock()
+    with open(input_file, 'r', encoding='utf-8') as infile:
+        columns = PlaylistColumns.load(infile)
+    reporter.add_time('parse', clock() - started)
+    
+    stats = new_stats(len(columns))
+    log(f"Filtering entries{' (NumPy)' if numpy is not None else ''}...")
+    
+    started = clock()
+    reasons = classify_columns(columns, allowed_groups)
+    if numpy is not None:
+        counts = numpy.bincount(reasons, minlength=len(BATCH_REASONS)).tolist()
+        kept = numpy.flatnonzero(reasons == 0).tolist()
+    else:
+        counts = [reasons.count(code) for code in range(len(BATCH_REASONS))]
+        kept = [row for row, reason in enumerate(reasons) if not reason]
+    stats['live_channels'] = counts[0]
+    for code, reason in enumerate(BATCH_REASONS[1:], 1):
+        stats[FILTER_REASON_STATS.get(reason, 'other_filtered')] += counts[code]
+    reporter.add_time('classify', clock() - started)
+    
+    if VERBOSITY >= VERBOSE:
+        for name, reason in zip(columns.names, reasons):
+            log_entry(name, not reason, BATCH_REASONS[reason])
+    
+    # Write the filtered playlist
+    log(f"\nWriting filtered playlist to: {output_file}")
+    started = clock()
+    extinf, urls = columns.extinf, columns.urls
+    with open(output_file, 'w', encoding='utf-8') as outfile, M3UWriter(outfile) as writer:
+        outfile.write("#EXTM3U\n")
+        for row in kept:
+            writer.write_entry(parse_extinf_line_streaming(extinf[row], urls[row]))
+    reporter.add_time('write', clock() - started)
+    
+    return reporter.finish(stats)
+
+
+def filter_live_channels_mmap(input_file, output_file, allowed_groups=None):
+    """
+    Bytes-level version for very large files.
     
-    # Create a list to store live channels
-    live_channels = []
+    The input is memory-mapped and scanned for entry boundaries with find();
+    only the title, group-title and URL of each entry are decoded, and kept
+    entries are copied to the output verbatim (including any #EXTVLCOPT-style
+    lines between the EXTINF and the URL) instead of being re-rendered.
+    """
+    log("Processing entries (mmap mode)...")
+    
+    stats = new_stats()
+    classifier = EntryClassifier(allowed_groups)
+    reporter = ProgressReporter()
     
-    print("Filtering entries...")
+    with open(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
+        outfile.write(b"#EXTM3U\n")
+        if os.fstat(infile.fileno()).st_size > 0:
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                filter_entries_bytes(data, 0, len(data), outfile, classifier, stats, reporter)
+    
+    log(f"\nFiltered playlist written to: {output_file}")
+    return reporter.finish(stats)
+
+
+def scan_entries_bytes(data, start, end):
+    """
+    Find the entries of data[start:end].
     
-    for entry in playlist:
-        # Get entry details
-        title = entry.get('name', '')
-        url = entry.get('url', '')
-        category = entry.get('category', '')
+    Yields:
+        tuple: (entry_start, extinf_end, url, entry_end) - offsets of the EXTINF line,
+               of its newline, the stripped URL (bytes) and the offset just past the
+               URL line (one past end when the last line has no trailing newline)
+    """
+    find = data.find
+    pos = start
+    while True:
+        entry_start = find(b'#EXTINF', pos, end)
+        if entry_start < 0:
+            return
+        # Only an EXTINF at the start of a line (after optional whitespace) starts an entry
+        line_start = data.rfind(b'\n', start, entry_start) + 1
+        if line_start < start:
+            line_start = start
+        if line_start < entry_start and data[line_start:entry_start].strip():
+            pos = entry_start + 7
+            continue
+        extinf_end = find(b'\n', entry_start, end)
+        if extinf_end < 0:
+            return
         
-        # Apply filtering logic
-        should_keep, filter_reason = should_keep_entry(title, url, category, allowed_groups)
+        # The URL is the next non-empty line that is not a comment; a new EXTINF replaces this one
+        pos = extinf_end + 1
+        url = None
+        while pos < end:
+            line_end = find(b'\n', pos, end)
+            if line_end < 0:
+                line_end = end
+            line = data[pos:line_end].strip()
+            if line and line[:1] != b'#':
+                url = line
+                break
+            if line.startswith(b'#EXTINF'):
+                break
+            pos = line_end + 1
+        if url is None:
+            continue
+        pos = line_end + 1
+        yield entry_start, extinf_end, url, pos
+
+
+def parse_extinf_bytes(extinf_line):
+    """Return the (title, group title) of an EXTINF line given as bytes."""
+    group, title = split_extinf_line(extinf_line.rstrip())
+    return title.decode('utf-8', 'replace'), group.decode('utf-8', 'replace')
+
+
+def filter_entries_bytes(data, start, end, outfile, classifier, stats, reporter):
+    """
+    Filter the entries of data[start:end] and copy the kept ones to outfile.
+    
+    Args:
+        data: bytes-like playlist contents (typically an mmap)
+        start (int): Offset of the first byte to scan
+        end (int): Offset just past the last byte to scan
+        outfile: Binary file handle for writing
+        classifier (EntryClassifier): Classifier to apply
+        stats (dict): Statistics updated in place
+        reporter (ProgressReporter): Receives the stage timings
+    """
+    clock = time.perf_counter
+    verbose = VERBOSITY >= VERBOSE
+    read_time = parse_time = classify_time = write_time = 0.0
+    
+    started = clock()
+    for entry_start, extinf_end, url, entry_end in scan_entries_bytes(data, start, end):
+        parsing = clock()
+        read_time += parsing - started
+        title, category = parse_extinf_bytes(data[entry_start:extinf_end])
+        url = url.decode('utf-8', 'replace')
+        classifying = clock()
+        parse_time += classifying - parsing
+        
+        stats['total_entries'] += 1
+        should_keep, filter_reason = classifier.classify(title, url, category)
+        writing = clock()
+        classify_time += writing - classifying
         
         if should_keep:
-            live_channels.append(entry)
             stats['live_channels'] += 1
-            print(f"✓ Keeping: {title[:60]}{'...' if len(title) > 60 else ''}")
+            outfile.write(data[entry_start:entry_end])
+            if entry_end > end:
+                # Last line of the file without a trailing newline
+                outfile.write(b"\n")
         else:
-            if filter_reason == "series":
-                stats['series_filtered'] += 1
-            elif filter_reason == "movie":
-                stats['movies_filtered'] += 1
-            elif filter_reason == "group_not_allowed":
-                stats['group_filtered'] += 1
-            else:
-                stats['other_filtered'] += 1
-            print(f"✗ Filtered ({filter_reason}): {title[:60]}{'...' if len(title) > 60 else ''}")
+            stats[FILTER_REASON_STATS.get(filter_reason, 'other_filtered')] += 1
+        if verbose:
+            log_entry(title, should_keep, filter_reason)
+        reporter.tick(stats['total_entries'])
+        started = clock()
+        write_time += started - writing
+    read_time += clock() - started
     
-    # Write the filtered playlist
-    print(f"\nWriting filtered playlist to: {output_file}")
-    write_m3u_file(live_channels, output_file)
+    for stage, seconds in zip(STAGES, (read_time, parse_time, classify_time, write_time)):
+        reporter.add_time(stage, seconds)
+
+
+class PlaylistIndex:
+    """
+    Compact binary index of a playlist, kept next to it as <input_file>.m3uidx.
+    
+    It holds the group-title dictionary and, per entry, the group id, the byte
+    range of the entry in the source, the content verdict (series, movie,
+    other VOD or live) of the classifier without group filter and the kind
+    of its URL (see ENTRY_KINDS). Listing groups,
+    counting entries per group and filtering by group then run without parsing
+    the playlist, copying kept entries straight from the source.
+    
+    The index is only used while the size, modification time and sampled hash
+    of the source match the ones it was built from.
+    """
+    
+    MAGIC = b'M3UIDX\n'
+    VERSION = 2
+    # Filter reasons of the content verdicts, by code
+    REASONS = ("", "series", "movie", "other VOD")
+    # Blocks hashed to recognise the source without reading all of it
+    SAMPLE_BLOCKS = 16
+    SAMPLE_SIZE = 1 << 16
+    
+    def __init__(self, groups=None):
+        self.groups = groups if groups is not None else []
+        self.group_ids = array.array('I')
+        self.starts = array.array('Q')
+        self.ends = array.array('Q')
+        self.reasons = array.array('B')
+        self.kinds = array.array('B')
+        self.source = {}
     
-    return stats
+    @staticmethod
+    def index_file(input_file):
+        return f"{input_file}.m3uidx"
+    
+    @classmethod
+    def source_signature(cls, input_file):
+        """Return the size, modification time and sampled hash identifying the source."""
+        with open(input_file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            digest = hashlib.blake2b(digest_size=16)
+            step = max(st.st_size // cls.SAMPLE_BLOCKS, cls.SAMPLE_SIZE)
+            for offset in range(0, st.st_size, step):
+                f.seek(offset)
+                digest.update(f.read(cls.SAMPLE_SIZE))
+            # The end of the file changes whenever entries are appended
+            f.seek(max(0, st.st_size - cls.SAMPLE_SIZE))
+            digest.update(f.read())
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': digest.hexdigest()}
+    
+    @classmethod
+    def build(cls, input_file):
+        """Scan the playlist and return its index."""
+        index = cls()
+        index.source = cls.source_signature(input_file)
+        group_ids = {}
+        reason_codes = {reason: code for code, reason in enumerate(cls.REASONS)}
+        classifier = EntryClassifier()
+        with open(input_file, 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size > 0:
+                with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for entry_start, extinf_end, url, entry_end in scan_entries_bytes(data, 0, len(data)):
+                        title, category = parse_extinf_bytes(data[entry_start:extinf_end])
+                        group_id = group_ids.get(category)
+                        if group_id is None:
+                            group_id = group_ids[category] = len(index.groups)
+                            index.groups.append(category)
+                        _, filter_reason = classifier.classify(title, url.decode('utf-8', 'replace'), category)
+                        index.group_ids.append(group_id)
+                        index.starts.append(entry_start)
+                        index.ends.append(entry_end)
+                        index.reasons.append(reason_codes[filter_reason])
+                        index.kinds.append(entry_kind_bytes(url))
+        return index
+    
+    @classmethod
+    def load(cls, input_file):
+        """Return the index of input_file, or None if it is missing or out of date."""
+        try:
+            with open(cls.index_file(input_file), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(cls.MAGIC):
+            return None
+        pos = len(cls.MAGIC)
+        meta_size = int.from_bytes(data[pos:pos + 4], 'little')
+        pos += 4
+        try:
+            meta = json.loads(data[pos:pos + meta_size])
+        except ValueError:
+            return None
+        pos += meta_size
+        if (meta.get('version') != cls.VERSION or meta.get('rules_version') != CLASSIFIER_RULES_VERSION
+                or meta.get('byteorder') != sys.byteorder or meta.get('source') != cls.source_signature(input_file)):
+            return None
+        
+        index = cls(meta['groups'])
+        index.source = meta['source']
+        columns = [getattr(index, name) for name in ('group_ids', 'starts', 'ends', 'reasons', 'kinds')]
+        # A truncated (or otherwise damaged) index is stale too, and gets rebuilt
+        if len(data) - pos != meta['entries'] * sum(values.itemsize for values in columns):
+            return None
+        view = memoryview(data)
+        for values in columns:
+            size = meta['entries'] * values.itemsize
+            values.frombytes(view[pos:pos + size])
+            pos += size
+        return index
+    
+    def save(self, input_file):
+        """Write the index next to its playlist, atomically."""
+        meta = json.dumps({
+            'version': self.VERSION,
+            'rules_version': CLASSIFIER_RULES_VERSION,
+            'byteorder': sys.byteorder,
+            'source': self.source,
+            'entries': len(self.reasons),
+            'groups': self.groups
+        }, ensure_ascii=False).encode('utf-8')
+        index_file = self.index_file(input_file)
+        temp_file = f"{index_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(len(meta).to_bytes(4, 'little'))
+            f.write(meta)
+            for values in (self.group_ids, self.starts, self.ends, self.reasons, self.kinds):
+                values.tofile(f)
+        os.replace(temp_file, index_file)
+    
+    def group_histogram(self):
+        """Return the [live, vod, series] entry counts per group title, as scan_group_histogram()."""
+        counts = [[0, 0, 0] for _ in self.groups]
+        for group_id, kind in zip(self.group_ids, self.kinds):
+            counts[group_id][kind] += 1
+        return dict(zip(self.groups, counts))
 
 
-def parse_extinf_line_streaming(extinf_line):
+def load_or_build_index(input_file):
+    """Return the index of input_file, rebuilding and saving it if it is missing or out of date."""
+    index = PlaylistIndex.load(input_file)
+    if index is not None:
+        log(f"Using index: {PlaylistIndex.index_file(input_file)}")
+        return index
+    log(f"Building index: {PlaylistIndex.index_file(input_file)}")
+    index = PlaylistIndex.build(input_file)
+    index.save(input_file)
+    return index
+
+
+def filter_live_channels_indexed(input_file, output_file, allowed_groups=None):
+    """
+    Index-based version for repeated runs over the same playlist.
+    
+    Verdicts come from the index (built on first use), so no entry is parsed;
+    kept entries are copied from the source verbatim, giving the same output
+    as mmap mode. Runs of adjacent kept entries are copied with a single write.
+    """
+    index = load_or_build_index(input_file)
+    log("Processing entries (index mode)...")
+    
+    stats = new_stats(len(index.reasons))
+    reporter = ProgressReporter()
+    started = time.perf_counter()
+    
+    # Group and content verdicts combined per (group id, reason code): None keeps the entry
+    group_allowed = [allowed_groups is None or (bool(group) and group in allowed_groups) for group in index.groups]
+    reason_stats = [None] + [FILTER_REASON_STATS.get(reason, 'other_filtered') for reason in PlaylistIndex.REASONS[1:]]
+    
+    with open(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
+        outfile.write(b"#EXTM3U\n")
+        size = os.fstat(infile.fileno()).st_size
+        if size > 0:
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                run_start = run_end = 0
+                starts, ends = index.starts, index.ends
+                for i, (group_id, reason) in enumerate(zip(index.group_ids, index.reasons)):
+                    if not group_allowed[group_id]:
+                        stats['group_filtered'] += 1
+                    elif reason:
+                        stats[reason_stats[reason]] += 1
+                    else:
+                        stats['live_channels'] += 1
+                        if starts[i] != run_end:
+                            outfile.write(data[run_start:run_end])
+                            run_start = starts[i]
+                        run_end = ends[i]
+                outfile.write(data[run_start:run_end])
+                if run_end > size:
+                    # Last line of the file without a trailing newline
+                    outfile.write(b"\n")
+    
+    reporter.add_time('write', time.perf_counter() - started)
+    log(f"\nFiltered playlist written to: {output_file}")
+    return reporter.finish(stats)
+
+
+def log_entry(title, kept, filter_reason):
+    """Print the verdict for a single entry (verbose mode)."""
+    title = f"{title[:60]}{'...' if len(title) > 60 else ''}"
+    if kept:
+        print(f"✓ Keeping: {title}")
+    else:
+        print(f"✗ Filtered ({filter_reason}): {title}")
+
+
+def parse_extinf_line_streaming(extinf_line, url=''):
     """
     Parse an EXTINF line to extract channel metadata for streaming processing.
     
     Args:
         extinf_line (str): EXTINF line from M3U file
+        url (str): URL line of the entry
         
     Returns:
-        dict: Channel metadata
-    """
-    channel = {
-        'name': '',
-        'logo': '',
-        'category': '',
-        'tvg_id': '',
-        'tvg_name': ''
-    }
-    
-    # Extract tvg-id
-    tvg_id_match = re.search(r'tvg-id="([^"]*)"', extinf_line)
-    if tvg_id_match:
-        channel['tvg_id'] = tvg_id_match.group(1)
+        Entry: Channel metadata, with attributes other than tvg-id, tvg-name,
+               tvg-logo and group-title kept in attrs
+    """
+    return Entry.from_extinf(extinf_line, url)
+
+
+# Classification rules, compiled once. Title rules run on the upper-cased title except the
+# year rule, which runs on the title as written.
+SERIES_TITLE_PATTERN = re.compile(r'S0|E0|SEASON|EPISODE|S\d+\s*E\d+')
+MOVIE_YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+SERIES_CATEGORY_PATTERN = re.compile(r'SRS')
+MOVIE_CATEGORY_PATTERN = re.compile(r'VOD|MOVIE|FILM|CINEMA')
+OTHER_VOD_CATEGORY_PATTERN = re.compile(r'DOWNLOAD|ON DEMAND|RENTAL')
+# URL rules as patterns, for the column-wise batch engine
+SERIES_URL_PATTERN = re.compile(re.escape('/series/'))
+MOVIE_URL_PATTERN = re.compile(re.escape('/movie/'))
+
+# Bump when the classification rules or the group/title parsing change, so stored verdicts
+# (--state, --index) are not reused
+CLASSIFIER_RULES_VERSION = 2
+
+# Bound on the number of distinct categories whose verdict is memoized
+CATEGORY_CACHE_SIZE = 4096
+
+
+class EntryClassifier:
+    """
+    Series/movie/other VOD classifier, built once and applied to every entry.
     
-    # Extract tvg-name
-    tvg_name_match = re.search(r'tvg-name="([^"]*)"', extinf_line)
-    if tvg_name_match:
-        channel['tvg_name'] = tvg_name_match.group(1)
+    Category rules only depend on the group title, which repeats across
+    thousands of entries, so their outcome is memoized per category.
+    """
     
-    # Extract tvg-logo
-    logo_match = re.search(r'tvg-logo="([^"]*)"', extinf_line)
-    if logo_match:
-        channel['logo'] = logo_match.group(1)
+    def __init__(self, allowed_groups=None):
+        """
+        Args:
+            allowed_groups (GroupFilter or set, optional): Allowed group titles
+        """
+        self.allowed_groups = allowed_groups
+        self._classify_category = functools.lru_cache(maxsize=CATEGORY_CACHE_SIZE)(self._category_verdict)
     
-    # Extract group-title
-    group_match = re.search(r'group-title="([^"]*)"', extinf_line)
-    if group_match:
-        channel['category'] = group_match.group(1)
+    def _category_verdict(self, category):
+        """
+        Classify an entry from its category alone.
+        
+        Returns:
+            tuple: (group_allowed: bool, series: bool, movie: bool, other_vod: bool)
+        """
+        if self.allowed_groups is not None and (not category or category not in self.allowed_groups):
+            return False, False, False, False
+        upper = category.upper()
+        return (
+            True,
+            SERIES_CATEGORY_PATTERN.search(upper) is not None,
+            MOVIE_CATEGORY_PATTERN.search(upper) is not None,
+            OTHER_VOD_CATEGORY_PATTERN.search(upper) is not None
+        )
     
-    # Extract channel name (everything after the last comma)
-    name_match = re.search(r',(.+)$', extinf_line)
-    if name_match:
-        channel['name'] = name_match.group(1)
+    def classify_category(self, category):
+        """
+        Classify an entry from its category alone, memoized per category.
+        
+        Returns:
+            tuple: (group_allowed: bool, series: bool, movie: bool, other_vod: bool)
+        """
+        return self._classify_category(category)
     
-    return channel
+    def classify(self, title, url, category):
+        """
+        Determine if an entry should be kept based on filtering criteria.
+        
+        Args:
+            title (str): Channel title/name
+            url (str): Channel URL
+            category (str): Channel category/group
+            
+        Returns:
+            tuple: (should_keep: bool, filter_reason: str)
+        """
+        group_allowed, series, movie, other_vod = self._classify_category(category or '')
+        if not group_allowed:
+            return False, "group_not_allowed"
+        
+        # Series indicators take precedence over movie indicators
+        if series or (url and "/series/" in url) or \
+           (title and SERIES_TITLE_PATTERN.search(title.upper())):
+            return False, "series"
+        
+        if movie or (url and "/movie/" in url) or \
+           (title and MOVIE_YEAR_PATTERN.search(title)):
+            return False, "movie"
+        
+        if other_vod:
+            return False, "other VOD"
+        
+        # If none of the above, keep it (it's a live channel)
+        return True, ""
 
 
 def should_keep_entry(title, url, category, allowed_groups=None):
     """
     Determine if an entry should be kept based on filtering criteria.
     
+    Convenience wrapper for a single entry; loops over a playlist build one
+    EntryClassifier up front and call its classify() method instead.
+    
     Args:
         title (str): Channel title/name
         url (str): Channel URL
         category (str): Channel category/group
-        allowed_groups (set, optional): Set of allowed group titles
+        allowed_groups (GroupFilter or set, optional): Allowed group titles
         
     Returns:
         tuple: (should_keep: bool, filter_reason: str)
     """
-    # Check if group is allowed (if groups filter is specified)
-    if allowed_groups is not None:
-        if not category or category not in allowed_groups:
-            return False, "group_not_allowed"
-    
-    # Check if it's a series (multiple indicators)
-    if (category and "SRS" in category.upper()) or \
-       (url and "/series/" in url) or \
-       (title and any(pattern in title.upper() for pattern in ["S0", "E0", "SEASON", "EPISODE"])) or \
-       (title and re.search(r'S\d+\s*E\d+', title.upper())):
-        return False, "series"
-    
-    # Check if it's a movie (multiple indicators)
-    elif (category and "VOD" in category.upper()) or \
-         (url and "/movie/" in url) or \
-         (title and re.search(r'\b(19|20)\d{2}\b', title)) or \
-         (category and any(keyword in category.upper() 
-                          for keyword in ["MOVIE", "FILM", "CINEMA"])):
-        return False, "movie"
-    
-    # Check for other VOD content
-    elif category and any(keyword in category.upper() 
-                         for keyword in ["DOWNLOAD", "ON DEMAND", "RENTAL"]):
-        return False, "other VOD"
-    
-    # If none of the above, keep it (it's a live channel)
-    return True, ""
-
-
-def write_extinf_line(outfile, channel):
-    """
-    Write an EXTINF line to the output file.
-    
-    Args:
-        outfile: File handle for writing
-        channel (dict): Channel metadata
-    """
-    title = channel.get('name', '')
-    category = channel.get('category', '')
-    logo = channel.get('logo', '')
-    tvg_id = channel.get('tvg_id', '')
-    tvg_name = channel.get('tvg_name', '')
-    
-    # Write EXTINF line
-    extinf_line = '#EXTINF:-1'
-    
-    if tvg_id:
-        extinf_line += f' tvg-id="{tvg_id}"'
-    if tvg_name:
-        extinf_line += f' tvg-name="{tvg_name}"'
-    if logo:
-        extinf_line += f' tvg-logo="{logo}"'
-    if category:
-        extinf_line += f' group-title="{category}"'
-    
-    extinf_line += f',{title}\n'
-    outfile.write(extinf_line)
-
-
-def write_m3u_file(channels, output_file):
-    """Write channels to M3U file format."""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write("#EXTM3U\n")
-        
-        for channel in channels:
-            title = channel.get('name', '')
-            url = channel.get('url', '')
-            category = channel.get('category', '')
-            logo = channel.get('logo', '')
-            tvg = channel.get('tvg', {})
-            tvg_id = tvg.get('id', '') if tvg else ''
-            tvg_name = tvg.get('name', '') if tvg else ''
-            
-            # Write EXTINF line
-            extinf_line = f'#EXTINF:-1'
-            
-            if tvg_id:
-                extinf_line += f' tvg-id="{tvg_id}"'
-            if tvg_name:
-                extinf_line += f' tvg-name="{tvg_name}"'
-            if logo:
-                extinf_line += f' tvg-logo="{logo}"'
-            if category:
-                extinf_line += f' group-title="{category}"'
-            
-            extinf_line += f',{title}\n'
-            f.write(extinf_line)
-            
-            # Write URL line
-            f.write(f"{url}\n")
+    return EntryClassifier(allowed_groups).classify(title, url, category)
 
 
 def print_statistics(stats):
@@ -396,143 +1749,204 @@ def print_statistics(stats):
     if 'group_filtered' in stats:
         total_filtered += stats['group_filtered']
     print(f"Total filtered out:          {total_filtered:,}")
+    if 'shards' in stats:
+        print(f"Shard playlists written:     {stats['shards']:,} ({stats['shard_files_opened']:,} file opens)")
     
     if stats['total_entries'] > 0:
         live_percentage = (stats['live_channels'] / stats['total_entries']) * 100
         filtered_percentage = ((stats['series_filtered'] + stats['movies_filtered'] + stats['other_filtered']) / stats['total_entries']) * 100
         print(f"Live channels percentage:    {live_percentage:.1f}%")
         print(f"Filtered content percentage: {filtered_percentage:.1f}%")
+    
+    if 'timings' in stats:
+        print("-"*50)
+        print(f"Elapsed time:                {stats['elapsed_seconds']:.2f}s "
+              f"({stats['entries_per_second']:,.0f} entries/s)")
+        for stage, seconds in stats['timings'].items():
+            print(f"  {stage + ':':<26}{seconds:.2f}s")
+    if stats.get('peak_memory_kb') is not None:
+        print(f"Peak memory:                 {stats['peak_memory_kb'] / 1024:.1f} MB")
+
 
+def entry_kind_bytes(url):
+    """Return the ENTRY_KINDS index of an entry from its URL (bytes), following the Xtream URL layout."""
+    if b'/series/' in url:
+        return 2
+    if b'/movie/' in url:
+        return 1
+    return 0
 
-def list_group_titles(input_file, output_file=None):
+
+def scan_group_histogram(input_file):
     """
-    List all unique group-title values from the input M3U file.
+    Count the entries of each group in a single pass over the playlist.
+    
+    Only the group-title of each EXTINF line is extracted, so the scan is much
+    faster than a full parse, and memory only grows with the number of groups.
     
     Args:
-        input_file (str): Path to input M3U file
-        output_file (str, optional): Path to output file for group titles
+        input_file (str): Path to the playlist, or '-' for stdin (may be compressed)
+    
+    Returns:
+        dict: Group title (bytes, as in the file) -> [live, vod, series] entry counts
     """
-    if not os.path.exists(input_file):
-        raise FileNotFoundError(f"Input file '{input_file}' not found")
+    histogram = {}
+    group = None
+    with open_playlist_binary(input_file) as infile:
+        for line in infile:
+            line = line.strip()
+            if line.startswith(b'#'):
+                if line.startswith(b'#EXTINF'):
+                    group = split_extinf_line(line)[0]
+            elif line and group is not None:
+                counts = histogram.get(group)
+                if counts is None:
+                    counts = histogram[group] = [0, 0, 0]
+                counts[entry_kind_bytes(line)] += 1
+                group = None
+    return histogram
+
+
+def group_prefix(group):
+    """Return the prefix a group title is rolled up under (e.g. 'UK' for 'UK | NEWS')."""
+    if ' | ' in group:
+        return group.split(' | ')[0]
+    elif ' - ' in group:
+        return group.split(' - ')[0]
+    else:
+        return group.split()[0] if group.split() else group
+
+
+def build_group_report(input_file, histogram):
+    """
+    Turn a raw group histogram into the report written by --list-groups.
     
-    # Check file size to determine processing method
-    file_size = os.path.getsize(input_file)
-    file_size_mb = file_size / (1024 * 1024)
+    Args:
+        input_file (str): Input file name, recorded in the report
+        histogram (dict): Group title (bytes or str) -> [live, vod, series] counts
     
-    print(f"File size: {file_size_mb:.1f} MB")
+    Returns:
+        dict: Totals, per-group counts sorted by name and prefix rollups sorted by size
+    """
+    groups = {}
+    total = [0, 0, 0]
+    for group, counts in histogram.items():
+        if isinstance(group, bytes):
+            group = group.decode('utf-8', 'replace')
+        group = group.strip()
+        merged = groups.setdefault(group, [0, 0, 0])
+        for kind, count in enumerate(counts):
+            merged[kind] += count
+            total[kind] += count
     
-    group_titles = set()  # Use set to store unique group titles
-    total_entries = 0
+    # Entries without a group count towards the totals but are not listed
+    ungrouped = sum(groups.pop('', [0]))
     
-    if file_size_mb > 100:  # Use streaming for large files
-        print("Processing large file in streaming mode...")
-        
-        with open(input_file, 'r', encoding='utf-8') as infile:
-            line_count = 0
-            for line in infile:
-                line = line.strip()
-                line_count += 1
-                
-                # Progress indicator
-                if line_count % 10000 == 0:
-                    print(f"  Processed {line_count:,} lines...")
-                
-                # Parse EXTINF lines
-                if line.startswith('#EXTINF'):
-                    total_entries += 1
-                    channel_data = parse_extinf_line_streaming(line)
-                    category = channel_data.get('category', '').strip()
-                    if category:  # Only add non-empty categories
-                        group_titles.add(category)
-    else:
-        print("Processing file with m3u_parser library...")
-        try:
-            parser = m3u_parser.M3uParser()
-            parser.parse_m3u(input_file)
-            playlist = parser.get_list()
-            
-            for entry in playlist:
-                total_entries += 1
-                category = entry.get('category', '').strip()
-                if category:  # Only add non-empty categories
-                    group_titles.add(category)
-        except Exception as e:
-            print(f"Error parsing with m3u_parser, falling back to streaming mode: {e}")
-            # Fallback to streaming mode
-            return list_group_titles_streaming(input_file)
+    prefixes = {}
+    for group, counts in groups.items():
+        rollup = prefixes.setdefault(group_prefix(group), [0, 0, 0, 0])
+        rollup[0] += 1
+        for kind, count in enumerate(counts, 1):
+            rollup[kind] += count
     
-    # Sort group titles for better readability
-    sorted_groups = sorted(group_titles, key=str.lower)
+    return {
+        'input_file': input_file,
+        'total_entries': sum(total),
+        'unique_groups': len(groups),
+        'ungrouped_entries': ungrouped,
+        'kinds': dict(zip(ENTRY_KINDS, total)),
+        'groups': [dict(name=group, entries=sum(counts), **dict(zip(ENTRY_KINDS, counts)))
+                   for group, counts in sorted(groups.items(), key=lambda item: item[0].lower())],
+        'prefixes': [dict(prefix=prefix, groups=rollup[0], entries=sum(rollup[1:]), **dict(zip(ENTRY_KINDS, rollup[1:])))
+                     for prefix, rollup in sorted(prefixes.items(), key=lambda item: (-sum(item[1][1:]), item[0]))]
+    }
+
+
+def format_kinds(counts):
+    """Return the live/VOD/series split of a report item as text."""
+    return f"live {counts['live']:,}, VOD {counts['vod']:,}, series {counts['series']:,}"
+
+
+def list_group_titles(input_file, output_file=None, use_index=False, output_format='text'):
+    """
+    List all group-title values from the input M3U file with their entry counts.
     
-    # Prepare output content
-    output_lines = []
+    Args:
+        input_file (str): Path to input M3U file, or '-' for stdin
+        output_file (str, optional): Path to output file for group titles, or '-' for stdout
+        use_index (bool): Read the counts from the index sidecar instead of scanning the file
+        output_format (str): 'text' (one group per line, script-friendly) or 'json' (full report)
+    """
+    if not is_stdio(input_file):
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Input file '{input_file}' not found")
+        print(f"File size: {os.path.getsize(input_file) / (1024 * 1024):.1f} MB")
+    
+    started = time.perf_counter()
+    if use_index:
+        histogram = load_or_build_index(input_file).group_histogram()
+    else:
+        print("Scanning group titles...")
+        histogram = scan_group_histogram(input_file)
+    report = build_group_report(input_file, histogram)
+    elapsed = time.perf_counter() - started
+    groups = report['groups']
     
     if output_file:
-        # For file output, create script-friendly format
-        output_lines.append(f"# M3U Playlist Group Analysis")
-        output_lines.append(f"# Input: {input_file}")
-        output_lines.append(f"# Generated: {__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        output_lines.append(f"# Total entries: {total_entries:,}")
-        output_lines.append(f"# Unique groups: {len(sorted_groups):,}")
-        output_lines.append(f"#")
-        
-        # Add each group title (one per line, no numbering for scripts)
-        for group in sorted_groups:
-            output_lines.append(group)
-        
-        # Write to file
+        if output_format == 'json':
+            content = json.dumps(report, indent=2, ensure_ascii=False) + '\n'
+        else:
+            # Script-friendly format: comment header, then one group per line
+            output_lines = [
+                f"# M3U Playlist Group Analysis",
+                f"# Input: {input_file}",
+                f"# Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+                f"# Total entries: {report['total_entries']:,} ({format_kinds(report['kinds'])})",
+                f"# Unique groups: {report['unique_groups']:,}",
+                f"#"
+            ]
+            output_lines.extend(group['name'] for group in groups)
+            content = '\n'.join(output_lines) + '\n'
+        
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(output_lines) + '\n')
+            if is_stdio(output_file):
+                sys.__stdout__.write(content)
+                sys.__stdout__.flush()
+            else:
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    f.write(content)
             print(f"\n📁 Group titles written to: {output_file}")
-            print(f"   Format: One group per line (script-friendly)")
-            print(f"   Groups: {len(sorted_groups)} unique titles")
+            print(f"   Format: {'JSON report' if output_format == 'json' else 'One group per line (script-friendly)'}")
+            print(f"   Groups: {len(groups)} unique titles")
         except Exception as e:
             print(f"❌ Error writing to file: {e}")
             return
     
     # Always show summary on console
-    print(f"\nFound {len(sorted_groups)} unique group titles in {total_entries:,} entries:")
+    print(f"\nFound {len(groups)} unique group titles in {report['total_entries']:,} entries ({elapsed:.2f}s):")
+    print("=" * 60)
     
-    if not output_file:
-        # Full console output only when not writing to file
-        print("=" * 60)
-        
-        # Display group titles with numbering
-        for i, group in enumerate(sorted_groups, 1):
-            print(f"{i:3d}. {group}")
-    else:
-        # Abbreviated console output when writing to file
-        print("=" * 60)
+    # Full console output only when not writing to file
+    shown = groups if not output_file else groups[:10]
+    if output_file:
         print("First 10 groups:")
-        for i, group in enumerate(sorted_groups[:10], 1):
-            print(f"{i:3d}. {group}")
-        if len(sorted_groups) > 10:
-            print(f"    ... and {len(sorted_groups) - 10} more (see output file)")
+    for i, group in enumerate(shown, 1):
+        print(f"{i:3d}. {group['name']} - {group['entries']:,} entries ({format_kinds(group)})")
+    if len(groups) > len(shown):
+        print(f"    ... and {len(groups) - len(shown)} more (see output file)")
     
     # Summary statistics
     print("\n" + "=" * 60)
-    print(f"Total entries: {total_entries:,}")
-    print(f"Unique groups: {len(sorted_groups):,}")
-    print(f"Entries with groups: {sum(1 for entry in sorted_groups if entry):,}")
-    
-    # Show most common group prefixes
-    prefixes = {}
-    for group in sorted_groups:
-        if ' | ' in group:
-            prefix = group.split(' | ')[0]
-        elif ' - ' in group:
-            prefix = group.split(' - ')[0]
-        else:
-            prefix = group.split()[0] if group.split() else group
-        
-        prefixes[prefix] = prefixes.get(prefix, 0) + 1
+    print(f"Total entries: {report['total_entries']:,} ({format_kinds(report['kinds'])})")
+    print(f"Unique groups: {report['unique_groups']:,}")
+    print(f"Entries without group: {report['ungrouped_entries']:,}")
     
-    if prefixes:
+    # Show the largest group prefixes
+    if report['prefixes']:
         print(f"\nMost common group prefixes:")
         print("-" * 30)
-        for prefix, count in sorted(prefixes.items(), key=lambda x: x[1], reverse=True)[:10]:
-            print(f"{prefix}: {count} groups")
+        for rollup in report['prefixes'][:10]:
+            print(f"{rollup['prefix']}: {rollup['groups']} groups, {rollup['entries']:,} entries ({format_kinds(rollup)})")
 
 
 def main():
@@ -548,20 +1962,41 @@ def main():
         "input_file", 
         nargs="?", 
         default="filtered.m3u",
-        help="Input M3U file path (default: filtered.m3u)"
+        help="Input M3U file path, http(s) URL or - for stdin; gzip, bz2 and xz input is decompressed (default: filtered.m3u)"
     )
     
     parser.add_argument(
         "output_file", 
         nargs="?", 
         default="live_channels.m3u",
-        help="Output M3U file path (default: live_channels.m3u)"
+        help="Output M3U file path or - for stdout; .gz, .bz2 and .xz names are compressed (default: live_channels.m3u)"
     )
     
     parser.add_argument(
         "-v", "--verbose",
+        action="count",
+        default=0,
+        help="Enable verbose output (one line per kept or filtered entry)"
+    )
+    
+    parser.add_argument(
+        "-q", "--quiet",
         action="store_true",
-        help="Enable verbose output"
+        help="Only print errors (no progress, no statistics)"
+    )
+    
+    parser.add_argument(
+        "--stats-json",
+        nargs="?",
+        const="",
+        metavar="FILE",
+        help="Write run statistics and stage timings as JSON (default: <output_file>.stats.json)"
+    )
+    
+    parser.add_argument(
+        "--peak-memory",
+        action="store_true",
+        help="Report the peak memory use of the run in the statistics"
     )
     
     parser.add_argument(
@@ -576,6 +2011,58 @@ def main():
         help="Force streaming mode (useful for large files)"
     )
     
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Scan the memory-mapped input as bytes and copy kept entries verbatim (fastest for very large files)"
+    )
+    
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Filter chunks of the input on N worker processes (0: one per CPU); "
+             "the output is identical to single-process mode, but -v per-entry lines are not shown"
+    )
+    
+    parser.add_argument(
+        "--state",
+        type=str,
+        metavar="FILE",
+        help="Reuse the verdicts of unchanged entries from the previous run's state file, update it, "
+             "and write a delta report to <output_file>.delta.json (implies single-process streaming mode)"
+    )
+    
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_KINDS,
+        help="Write the kept entries to one playlist per group title (group) or group prefix (prefix) "
+             "in --shard-dir, in the same pass; output_file becomes the index playlist of the shards "
+             "(implies single-process streaming mode)"
+    )
+    
+    parser.add_argument(
+        "--shard-dir",
+        type=str,
+        metavar="DIR",
+        help="Directory of the shard playlists (default: output_file without extension, plus -shards)"
+    )
+    
+    parser.add_argument(
+        "--shard-compress",
+        choices=("gz", "bz2", "xz"),
+        help="Also write a compressed copy of each shard"
+    )
+    
+    parser.add_argument(
+        "--max-open-shards",
+        type=int,
+        default=MAX_OPEN_SHARDS,
+        metavar="N",
+        help=f"Shard files kept open at once (default: {MAX_OPEN_SHARDS})"
+    )
+    
     parser.add_argument(
         "--list-groups",
         action="store_true",
@@ -586,7 +2073,15 @@ def main():
         "--groups-output",
         type=str,
         metavar="FILE",
-        help="Write group titles to specified file (works with --list-groups)"
+        help="Write group titles to specified file, or - for stdout (works with --list-groups)"
+    )
+    
+    parser.add_argument(
+        "--groups-format",
+        choices=("text", "json"),
+        default="text",
+        help="Format of --groups-output: one group per line (text, default) or a JSON report with "
+             "per-group entry counts, live/VOD/series splits and prefix rollups (json)"
     )
     
     parser.add_argument(
@@ -596,8 +2091,33 @@ def main():
         help="Filter entries to only include groups listed in the specified file"
     )
     
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Filter and list groups from the <input_file>.m3uidx index (built when missing or out of date); "
+             "the output is the same as with --mmap, but -v per-entry lines are not shown"
+    )
+    
+    parser.add_argument(
+        "--build-index",
+        action="store_true",
+        help="Build or refresh the <input_file>.m3uidx index of the input file and exit"
+    )
+    
     args = parser.parse_args()
     
+    global VERBOSITY
+    VERBOSITY = QUIET if args.quiet else min(VERBOSE, NORMAL + args.verbose)
+    
+    if args.list_groups and args.groups_output == '-':
+        # Keep the group list alone on stdout; status output and errors go to stderr
+        sys.stdout = sys.stderr
+    elif is_stdio(args.output_file):
+        if args.stats_json == "":
+            parser.error("--stats-json needs a FILE when the playlist is written to stdout")
+        # Keep the playlist alone on stdout; status output and errors go to stderr
+        sys.stdout = sys.stderr
+    
     try:
         # Get the directory of the current script if relative paths are used
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -606,11 +2126,37 @@ def main():
         input_file = args.input_file
         output_file = args.output_file
         
-        if not os.path.isabs(input_file):
+        if not os.path.isabs(input_file) and not is_url(input_file) and not is_stdio(input_file):
             input_file = os.path.join(script_dir, input_file)
-        if not os.path.isabs(output_file):
+        if not os.path.isabs(output_file) and not is_stdio(output_file):
             output_file = os.path.join(script_dir, output_file)
         
+        if is_url(input_file) and args.list_groups:
+            parser.error("--list-groups needs a local playlist file or - for stdin")
+        if (args.index or args.build_index) and (is_url(input_file) or is_stdio(input_file)):
+            parser.error("--index and --build-index need a local playlist file")
+        
+        shards = None
+        if args.shard_by:
+            shard_dir = args.shard_dir
+            if not shard_dir:
+                if is_stdio(output_file):
+                    parser.error("--shard-by needs --shard-dir when the index is written to stdout")
+                shard_dir = f"{os.path.splitext(output_file)[0]}-shards"
+            elif not os.path.isabs(shard_dir):
+                shard_dir = os.path.join(script_dir, shard_dir)
+            compression = f".{args.shard_compress}" if args.shard_compress else None
+            shards = ShardedOutput(shard_dir, args.shard_by, compression, args.max_open_shards)
+        
+        if args.build_index:
+            if not os.path.exists(input_file):
+                raise FileNotFoundError(f"Input file '{input_file}' not found")
+            index = PlaylistIndex.build(input_file)
+            index.save(input_file)
+            log(f"✅ Index of {len(index.reasons):,} entries in {len(index.groups):,} groups written to: "
+                f"{PlaylistIndex.index_file(input_file)}")
+            return
+        
         # Handle --list-groups option
         if args.list_groups:
             print("M3U Playlist Group Titles Listing")
@@ -619,16 +2165,18 @@ def main():
             if args.groups_output:
                 print(f"Output file: {args.groups_output}")
             print("=" * 50)
-            list_group_titles(input_file, args.groups_output)
+            list_group_titles(input_file, args.groups_output, args.index, args.groups_format)
             return
         
-        print("M3U Playlist Filter - Remove Series and Movies")
-        print("=" * 50)
-        print(f"Input file:  {input_file}")
-        print(f"Output file: {output_file}")
+        log("M3U Playlist Filter - Remove Series and Movies")
+        log("=" * 50)
+        log(f"Input file:  {redact_url(input_file) if is_url(input_file) else input_file}")
+        log(f"Output file: {output_file}")
         if args.filter_by_groups:
-            print(f"Groups filter: {args.filter_by_groups}")
-        print("=" * 50)
+            log(f"Groups filter: {args.filter_by_groups}")
+        if shards is not None:
+            log(f"Shards:      {shards.shard_dir} (one playlist per {shards.shard_by})")
+        log("=" * 50)
         
         # Determine streaming mode
         use_streaming = True  # Default to streaming
@@ -638,13 +2186,27 @@ def main():
             use_streaming = True
         
         # Run the filtering
-        stats = filter_live_channels(input_file, output_file, use_streaming, args.filter_by_groups)
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        stats = filter_live_channels(input_file, output_file, use_streaming, args.filter_by_groups, args.mmap, jobs, args.state, args.index, shards)
+        
+        if args.peak_memory:
+            stats['peak_memory_kb'] = peak_memory_kb()
+        
+        if args.stats_json is not None:
+            stats_file = args.stats_json or f"{output_file}.stats.json"
+            write_stats_json(stats, stats_file)
+            log(f"📊 Statistics written to: {stats_file}")
+        
+        if stats.get('not_modified'):
+            log(f"\n✅ Nothing to do, the playlist has not changed")
+            return
         
         # Print statistics
-        print_statistics(stats)
+        if VERBOSITY >= NORMAL:
+            print_statistics(stats)
         
-        print(f"\n✅ Filtering complete!")
-        print(f"📺 Live channels playlist saved as: {output_file}")
+        log(f"\n✅ Filtering complete!")
+        log(f"📺 Live channels playlist saved as: {output_file}")
         
     except FileNotFoundError as e:
         print(f"❌ Error: {e}")
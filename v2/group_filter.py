@@ -0,0 +1,191 @@
+"""
+Group filters shared by filter_live_channels.py, process.py and serve.py.
+
+A filter selects group titles (panel category names) by exact name, by glob
+pattern such as 'USA Local - *' or by regular expression, each either
+included or excluded. It is compiled once: exact names into a set, plain
+prefix patterns into a character trie and all other patterns into one
+combined regex. The verdict of each group title is memoized, so testing an
+entry costs a dict lookup however long the filter is.
+
+Pattern syntax:
+    re:<regex>   regular expression, searched anywhere in the group title
+    * and ?      glob wildcards ('[' is literal, as group titles often contain it)
+    anything else  exact group title
+
+Group files hold exact group titles, one per line, as --list-groups writes
+them; only the lines after a PATTERNS_MARKER line are read as patterns.
+"""
+
+import fnmatch
+import re
+
+REGEX_PREFIX = 're:'
+GLOB_CHARACTERS = '*?'
+
+# Line of a group file after which lines are patterns and '!' excludes; a comment to older readers
+PATTERNS_MARKER = '#!patterns'
+
+# Key marking the end of a prefix in the trie
+TRIE_END = None
+
+# Verdicts kept before the memo is cleared (group titles number in the thousands)
+MEMO_SIZE = 65536
+
+
+def glob_to_regex(pattern):
+    """Translate a glob pattern to regex source, with '[' taken literally."""
+    return fnmatch.translate(pattern.replace('[', '[[]'))
+
+
+class PatternSet:
+    """
+    A list of patterns compiled for matching a group title in one call.
+
+    Exact names are kept in a set, patterns whose only wildcard is a
+    trailing '*' in a trie, and the remaining globs and regexes in one
+    alternation.
+    """
+
+    def __init__(self, patterns=(), names=()):
+        """
+        Args:
+            patterns (iterable): Patterns in the syntax of this module
+            names (iterable): Group titles matched exactly, whatever characters they contain
+
+        Raises:
+            re.error: If a regex pattern does not compile
+        """
+        self.names = set(names)
+        self.trie = {}
+        # Number of patterns other than exact names
+        self.patterns = 0
+        sources = []
+        for pattern in patterns:
+            if pattern.startswith(REGEX_PREFIX):
+                regex = pattern[len(REGEX_PREFIX):]
+                re.compile(regex)
+                sources.append(f'(?s:.*?(?:{regex}))')
+            elif not any(char in pattern for char in GLOB_CHARACTERS):
+                self.names.add(pattern)
+                continue
+            elif pattern.endswith('*') and not any(char in pattern[:-1] for char in GLOB_CHARACTERS):
+                self.add_prefix(pattern[:-1])
+            else:
+                sources.append(glob_to_regex(pattern))
+            self.patterns += 1
+        self.regex = re.compile('|'.join(sources)) if sources else None
+
+    def add_prefix(self, prefix):
+        node = self.trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[TRIE_END] = True
+
+    def has_prefix_of(self, name):
+        """Return True if one of the prefixes starts name."""
+        node = self.trie
+        if not node:
+            return False
+        for char in name:
+            if TRIE_END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return TRIE_END in node
+
+    def __contains__(self, name):
+        return name in self.names or self.has_prefix_of(name) or \
+            (self.regex is not None and self.regex.match(name) is not None)
+
+    def __bool__(self):
+        return bool(self.names or self.trie or self.regex)
+
+
+class GroupFilter:
+    """
+    Compiled include/exclude filter of group titles.
+
+    Supports the 'in' operator, so it can be used wherever a set of allowed
+    group titles was. A group is selected when it matches an include rule (or
+    there are none and include_all is set) and no exclude rule.
+    """
+
+    def __init__(self, include=(), exclude=(), names=(), include_all=False):
+        """
+        Args:
+            include (iterable): Patterns of the groups to select
+            exclude (iterable): Patterns of the groups to leave out
+            names (iterable): Group titles to select, matched exactly
+            include_all (bool): Select every group not excluded when there are no include rules
+        """
+        self.include = PatternSet(include, names)
+        self.exclude = PatternSet(exclude)
+        self.include_all = include_all and not self.include
+        self._memo = {}
+
+    @classmethod
+    def from_definition(cls, definition):
+        """
+        Build a filter from a filter profile (e.g. KY-filter_all.json).
+
+        included_categories lists exact category names as before; the optional
+        include and exclude lists take patterns. A profile with neither
+        included_categories nor include selects every category not excluded.
+        """
+        names = definition.get('included_categories', ())
+        include = definition.get('include', ())
+        return cls(include, definition.get('exclude', ()), names,
+                   include_all='included_categories' not in definition and 'include' not in definition)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Build a filter from the lines of a group file.
+
+        Each line is an exact group title, '#' starts a comment line and blank
+        lines are skipped, so files written before patterns existed select the
+        same groups. After a PATTERNS_MARKER line, each line is a pattern and
+        lines starting with '!' exclude. A file with only exclude lines
+        selects every other group; an empty file selects none.
+        """
+        names, include, exclude = [], [], []
+        patterns = False
+        for line in lines:
+            line = line.strip()
+            if line == PATTERNS_MARKER:
+                patterns = True
+                continue
+            if not line or line.startswith('#'):
+                continue
+            if not patterns:
+                names.append(line)
+            elif line.startswith('!'):
+                exclude.append(line[1:].strip())
+            else:
+                include.append(line)
+        return cls(include, exclude, names, include_all=not include and bool(exclude))
+
+    def __contains__(self, group):
+        verdict = self._memo.get(group)
+        if verdict is None:
+            verdict = (self.include_all or group in self.include) and group not in self.exclude
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[group] = verdict
+        return verdict
+
+    def select(self, groups):
+        """Return the members of groups that the filter selects, in their order."""
+        return [group for group in groups if group in self]
+
+    def summary(self):
+        """Describe the filter in a few words, for log messages."""
+        parts = ["all groups" if self.include_all else f"{len(self.include.names)} groups"]
+        if self.include.patterns:
+            parts.append(f"{self.include.patterns} patterns")
+        excludes = len(self.exclude.names) + self.exclude.patterns
+        if excludes:
+            parts.append(f"{excludes} exclusions")
+        return ', '.join(parts)
@@ -0,0 +1,182 @@
+"""
+Playlist entry model shared by filter_live_channels.py and process.py.
+
+Both tools carry every channel, movie and episode of a catalogue through
+parsing, filtering and rendering, so the entry type is kept small: its
+fields live in __slots__ instead of a per-instance dict, group titles are
+interned so that all entries of a group share one string, and the extra
+EXTINF attributes are only stored when there are any.
+"""
+
+import re
+import sys
+
+# One key="value" attribute of an EXTINF line
+EXTINF_ATTRIBUTE_PATTERN = re.compile(r'\s*([^\s=",]+)="([^"]*)"')
+
+# A well-formed EXTINF line (duration, blank-separated key="value" attributes, title after the
+# first comma), capturing the first group-title and the title
+EXTINF_LINE_PATTERN = re.compile(
+    r'#EXTINF:[^\s,"]+(?:[ \t]+(?!group-title=")[^\s=",]+="[^"]*")*'
+    r'(?:[ \t]+group-title="([^"]*)"(?:[ \t]+[^\s=",]+="[^"]*")*)?[ \t]*(?:,(.*))?', re.S)
+EXTINF_LINE_BYTES_PATTERN = re.compile(EXTINF_LINE_PATTERN.pattern.encode(), re.S)
+
+# Parts of a channel name that do not identify the channel
+NAME_PROVIDER_PREFIX = re.compile(r'^\s*[A-Z]{2,4}\s*[|:]\s*')
+NAME_QUALITY_TAGS = re.compile(r'\b(?:UHD|FHD|HD|SD|4K|8K|HEVC|H265|H264|RAW|BACKUP)\b')
+NAME_NON_ALNUM = re.compile(r'[\W_]+')
+
+
+def tokenize_extinf_line(extinf_line):
+    """
+    Split an EXTINF line into its attributes and title in a single left-to-right scan.
+
+    Args:
+        extinf_line (str): EXTINF line from M3U file
+
+    Returns:
+        tuple: (attributes: dict in line order, title: str)
+    """
+    # Skip '#EXTINF:', blanks and the duration that follows it
+    pos = 8
+    length = len(extinf_line)
+    while pos < length and extinf_line[pos] in ' \t':
+        pos += 1
+    while pos < length and extinf_line[pos] not in ' \t,':
+        pos += 1
+
+    attributes = {}
+    while pos < length:
+        match = EXTINF_ATTRIBUTE_PATTERN.match(extinf_line, pos)
+        if match:
+            # The first of repeated keys wins
+            attributes.setdefault(match.group(1), match.group(2))
+            pos = match.end()
+        elif extinf_line[pos] in ' \t':
+            pos += 1
+        elif extinf_line[pos] == ',':
+            break
+        else:
+            # Skip an unquoted or malformed attribute up to the next blank
+            while pos < length and extinf_line[pos] not in ' \t,':
+                pos += 1
+
+    # The title follows the first comma after the attributes
+    comma = extinf_line.find(',', pos)
+    title = extinf_line[comma + 1:] if comma >= 0 else ''
+    return attributes, title
+
+
+def split_extinf_line(extinf_line):
+    """
+    Return the group title and title of an EXTINF line, as tokenize_extinf_line finds them.
+
+    Well-formed lines are split by a single regex match; anything else
+    (unquoted or malformed attributes, commas inside values) is tokenized.
+    Bytes lines give bytes (undecodable bytes are kept as they are).
+
+    Args:
+        extinf_line (str or bytes): EXTINF line from M3U file
+
+    Returns:
+        tuple: (group title, title), empty when missing
+    """
+    if isinstance(extinf_line, bytes):
+        match = EXTINF_LINE_BYTES_PATTERN.fullmatch(extinf_line)
+        if match:
+            return match.groups(b'')
+        attributes, title = tokenize_extinf_line(extinf_line.decode('utf-8', 'surrogateescape'))
+        return (attributes.get('group-title', '').encode('utf-8', 'surrogateescape'),
+                title.encode('utf-8', 'surrogateescape'))
+    match = EXTINF_LINE_PATTERN.fullmatch(extinf_line)
+    if match:
+        return match.groups('')
+    attributes, title = tokenize_extinf_line(extinf_line)
+    return attributes.get('group-title', ''), title
+
+
+def normalise_channel_name(name, strip_prefix=False):
+    """
+    Reduce a channel name to what identifies the channel, for comparing names across sources.
+
+    Quality tags, punctuation and case are dropped: 'US| CNN HD', 'US: CNN' and
+    'us - cnn (FHD)' all become 'uscnn'. With strip_prefix, a provider prefix
+    ('US| ', 'UK: ') is dropped as well, so 'US| CNN HD' and 'CNN' both become 'cnn'.
+
+    Args:
+        name (str): Channel name
+        strip_prefix (bool): Drop a leading provider prefix
+
+    Returns:
+        str: The normalised name, '' when nothing identifying is left
+    """
+    name = name.upper()
+    if strip_prefix:
+        name = NAME_PROVIDER_PREFIX.sub('', name)
+    return NAME_NON_ALNUM.sub('', NAME_QUALITY_TAGS.sub(' ', name)).lower()
+
+
+class Entry:
+    """
+    One playlist entry.
+
+    Attributes:
+        name (str): Title of the entry
+        url (str): Stream URL
+        group (str): Group title (interned)
+        logo (str): tvg-logo
+        tvg_id (str): tvg-id
+        tvg_name (str): tvg-name
+        attrs (dict or None): Other EXTINF attributes in line order, None if there are none
+        stream_id (str): Panel stream id ('' for entries read from a playlist)
+        group_id (str): Panel category id ('' for entries read from a playlist)
+    """
+
+    __slots__ = ('name', 'url', 'group', 'logo', 'tvg_id', 'tvg_name', 'attrs', 'stream_id', 'group_id')
+
+    def __init__(self, name='', url='', group='', logo='', tvg_id='', tvg_name='', attrs=None, stream_id='', group_id=''):
+        self.name = name
+        self.url = url
+        self.group = sys.intern(group)
+        self.logo = logo
+        self.tvg_id = tvg_id
+        self.tvg_name = tvg_name
+        self.attrs = attrs or None
+        self.stream_id = stream_id
+        self.group_id = group_id
+
+    @classmethod
+    def from_extinf(cls, extinf_line, url=''):
+        """
+        Build an entry from an EXTINF line and the URL that follows it.
+
+        Args:
+            extinf_line (str): EXTINF line from M3U file
+            url (str): Stream URL of the entry
+
+        Returns:
+            Entry: The parsed entry
+        """
+        attributes, title = tokenize_extinf_line(extinf_line)
+        pop = attributes.pop
+        return cls(title, url, pop('group-title', ''), pop('tvg-logo', ''), pop('tvg-id', ''),
+                   pop('tvg-name', ''), attributes)
+
+    @classmethod
+    def from_panel_channel(cls, channel, base_url):
+        """
+        Build an entry from a channel of an Xtream panel (a member of 'available_channels').
+
+        Args:
+            channel (dict): Panel channel with stream_id, name, stream_icon, category_id and category_name
+            base_url (str): Stream URL prefix of the panel account, without trailing slash
+
+        Returns:
+            Entry: The channel, with the stream id as tvg-id and the name as tvg-name
+        """
+        stream_id = channel['stream_id']
+        return cls(channel['name'], f'{base_url}/{stream_id}.ts', channel['category_name'],
+                   channel['stream_icon'], stream_id, channel['name'], None, stream_id, channel['category_id'])
+
+    def __repr__(self):
+        return f"Entry(name={self.name!r}, group={self.group!r}, url={self.url!r})"
@@ -0,0 +1,153 @@
+"""
+Buffered M3U writer shared by filter_live_channels.py and process.py.
+
+Playlists are written with hundreds of thousands of entries, so each entry
+is rendered with a single format operation and the rendered entries are
+joined and written in batches instead of with one write call per line.
+"""
+
+import re
+
+# Rendered entries collected before they are joined and written
+WRITE_BATCH_SIZE = 8192
+
+# Bump when render_extinf_line output changes, so lines rendered by an earlier run (--state) are not reused
+RENDER_VERSION = 1
+
+# Directive and duration opening an EXTINF line, after which new attributes are inserted
+EXTINF_DURATION_PATTERN = re.compile(r'^(#EXTINF:?[^\s,]*)')
+
+
+def escape_attribute(value):
+    """
+    Make a value safe inside a double-quoted EXTINF attribute.
+
+    Quotes would end the attribute early and line breaks would split the entry,
+    so quotes become &quot; and line breaks spaces.
+    """
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    return escape_title(value)
+
+
+def escape_title(value):
+    """Make a value safe as the title of an EXTINF line (no line breaks)."""
+    if '\n' in value or '\r' in value:
+        value = ' '.join(value.splitlines())
+    return value
+
+
+def set_attribute(extinf_line, name, value):
+    """
+    Set one attribute of an EXTINF line, leaving the rest of the line as it is.
+
+    Args:
+        extinf_line (str): EXTINF line, with or without trailing newline
+        name (str): Attribute name, e.g. 'tvg-id'
+        value (str): New value, escaped here
+
+    Returns:
+        str: The line with the first such attribute replaced, or with the
+        attribute added after the duration when the line has none
+    """
+    value = escape_attribute(value)
+    attribute = re.compile(r'(\s' + re.escape(name) + r'=")[^"]*(")')
+    line, count = attribute.subn(lambda m: m.group(1) + value + m.group(2), extinf_line, count=1)
+    if count:
+        return line
+    return EXTINF_DURATION_PATTERN.sub(lambda m: f'{m.group(1)} {name}="{value}"', extinf_line, count=1)
+
+
+def render_extinf_line(channel):
+    """
+    Render the EXTINF line (with trailing newline) of an entry.
+
+    Empty tvg-id, tvg-name, tvg-logo and group-title attributes are left out;
+    the other attributes of the entry follow in their original order.
+
+    Args:
+        channel (Entry): Channel metadata
+
+    Returns:
+        str: EXTINF line
+    """
+    parts = ['#EXTINF:-1']
+    if channel.tvg_id:
+        parts.append(f' tvg-id="{escape_attribute(channel.tvg_id)}"')
+    if channel.tvg_name:
+        parts.append(f' tvg-name="{escape_attribute(channel.tvg_name)}"')
+    if channel.logo:
+        parts.append(f' tvg-logo="{escape_attribute(channel.logo)}"')
+    if channel.group:
+        parts.append(f' group-title="{escape_attribute(channel.group)}"')
+    if channel.attrs:
+        parts.extend([f' {key}="{escape_attribute(value)}"' for key, value in channel.attrs.items()])
+    parts.append(f',{escape_title(channel.name)}\n')
+    return ''.join(parts)
+
+
+def render_panel_extinf_line(channel):
+    """
+    Render the EXTINF line (with trailing newline) of a panel channel.
+
+    All four tvg-id, tvg-name, tvg-logo and group-title attributes are
+    written, empty or not, as the panel playlists always had them.
+
+    Args:
+        channel (Entry): Channel metadata
+
+    Returns:
+        str: EXTINF line
+    """
+    return (f'#EXTINF:-1 tvg-id="{escape_attribute(channel.tvg_id)}" tvg-name="{escape_attribute(channel.tvg_name)}" '
+            f'tvg-logo="{escape_attribute(channel.logo)}" group-title="{escape_attribute(channel.group)}",'
+            f'{escape_title(channel.name)}\n')
+
+
+def render_entry(channel, render=render_extinf_line):
+    """Render the EXTINF and URL lines of an entry, both with trailing newlines."""
+    return render(channel) + channel.url + '\n'
+
+
+class M3UWriter:
+    """
+    Collects rendered entries and writes them to a text file in batches.
+
+    Usable as a context manager, which flushes the pending entries on exit.
+    The '#EXTM3U' header is left to the caller.
+    """
+
+    def __init__(self, outfile, render=render_extinf_line, batch_size=WRITE_BATCH_SIZE):
+        """
+        Args:
+            outfile: Text file handle for writing
+            render (callable, optional): EXTINF renderer used by write_entry()
+            batch_size (int, optional): Entries collected per write call
+        """
+        self.outfile = outfile
+        self.render = render
+        self.batch_size = batch_size
+        self._pending = []
+
+    def write_entry(self, channel):
+        """Render an entry and queue it for writing."""
+        self.write_rendered(self.render(channel) + channel.url + '\n')
+
+    def write_rendered(self, text):
+        """Queue an already rendered entry (EXTINF and URL lines) for writing."""
+        pending = self._pending
+        pending.append(text)
+        if len(pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending entries with a single write call."""
+        if self._pending:
+            self.outfile.write(''.join(self._pending))
+            self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()